@@ -3,18 +3,36 @@ Docling Agent REST API — Catalogue BTP.
 FastAPI backend for mobile/web access to the invoice extraction pipeline.
 """
 import os
+import asyncio
+import shutil
 import logging
+import secrets
+import threading
+from collections import OrderedDict
 from contextlib import asynccontextmanager
+from datetime import date, timedelta
+from functools import lru_cache
 import numpy as np
 import pandas as pd
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, BackgroundTasks, Query, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, StreamingResponse
 
 from backend.core.config import get_config
-from backend.core.db_manager import DBManager
+from backend.core.db_manager import DBManager, ReviewResolvedError, UpdateConflictError
+from backend.core.events import event_bus
+from backend.core.folder_watcher import EVENT_KINDS
 from backend.core.orchestrator import ExtractionOrchestrator
 from backend.core.monitoring import init_monitoring, Metrics
+from backend.core.profiling import ProfilingMiddleware, list_profiles, profile_path
+from backend.core.scheduler import INTERACTIVE, ExtractionScheduler
+from backend.core.tracing import TracingMiddleware, configure as configure_tracing, span
+from backend.core.upload_batch import BatchRejectedError, UploadBatch
+from backend.core.usage import TokenBudget, cost_usd, model_prices
+from backend.services.resilience import CircuitOpenError
+from backend.schemas.invoice import ProductPatch
 
 # ═══════════════════════════════════════
 # CONFIG
@@ -26,8 +44,13 @@ logging.basicConfig(
 logger = logging.getLogger("DoclingAPI")
 
 config = get_config()
+configure_tracing(config)
 ALLOWED_TYPES = {"application/pdf", "image/jpeg", "image/png", "image/webp"}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
+MAX_PAGE_SIZE = 1000
+MAX_TRACKED_BATCHES = 100  # finished batch jobs kept for status queries
+SSE_HEARTBEAT = 15.0  # seconds between keep-alive comments on idle streams
+MAX_EVENTS_PAGE = 500
 
 
 # ═══════════════════════════════════════
@@ -55,19 +78,39 @@ app = FastAPI(
 )
 
 # Middleware (order matters: last added = first executed)
+app.add_middleware(ProfilingMiddleware, config=config)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(GZipMiddleware, minimum_size=1000)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=os.getenv("CORS_ORIGINS", "*").split(","),
-    allow_methods=["GET", "POST"],
-    allow_headers=["X-API-Key", "Content-Type"],
+    allow_methods=["GET", "POST", "PATCH"],
+    allow_headers=["X-API-Key", "Content-Type", "Last-Event-ID", "X-Profile", "traceparent"],
 )
 
 
 # ═══════════════════════════════════════
 # DEPENDENCIES
 # ═══════════════════════════════════════
+@lru_cache(maxsize=None)
+def _shared_db(db_path: str) -> DBManager:
+    # One connection per process: migrations are checked once, not per request
+    return DBManager(db_path)
+
+
 def get_db() -> DBManager:
-    return DBManager(config.db_path)
+    return _shared_db(config.db_path)
+
+
+_batch_jobs: "OrderedDict[str, UploadBatch]" = OrderedDict()
+_batch_jobs_lock = threading.Lock()
+
+
+def _track_batch(batch: UploadBatch):
+    with _batch_jobs_lock:
+        _batch_jobs[batch.job_id] = batch
+        while len(_batch_jobs) > MAX_TRACKED_BATCHES:
+            _batch_jobs.popitem(last=False)
 
 
 def get_orchestrator(
@@ -76,11 +119,19 @@ def get_orchestrator(
     return ExtractionOrchestrator(config=config, db_manager=db)
 
 
+def require_admin(x_api_key: str | None = Header(None)):
+    """Admin endpoints are off unless ADMIN_API_KEY is set, then need it in X-API-Key."""
+    if not config.admin_api_key:
+        raise HTTPException(403, detail="Admin API disabled (set ADMIN_API_KEY)")
+    if not x_api_key or not secrets.compare_digest(x_api_key, config.admin_api_key):
+        raise HTTPException(401, detail="Invalid API key")
+
+
 # ═══════════════════════════════════════
 # ENDPOINTS
 # ═══════════════════════════════════════
 @app.get("/health", tags=["System"])
-async def healthcheck():
+def healthcheck():
     """Healthcheck for uptime monitoring (Betterstack, Render)."""
     try:
         db = get_db()
@@ -90,10 +141,30 @@ async def healthcheck():
             "version": "2.0.0",
             "db": stats,
             "metrics": Metrics.get_all(),
+            "scheduler": ExtractionScheduler.shared(config.extraction_slots).stats(),
         }
     except Exception as e:
         logger.error(f"Healthcheck failed: {e}")
-        raise HTTPException(status_code=503, detail="Service unhealthy")
+        raise HTTPException(status_code=503, detail="Service unhealthy") from e
+
+
+@app.get("/health/live", tags=["System"])
+async def liveness():
+    """Liveness probe: the process answers. Never touches the database."""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready", tags=["System"])
+def readiness(db: DBManager = Depends(get_db)):
+    """Readiness probe: database reachable and schema fully migrated."""
+    try:
+        check = db.check_ready()
+    except Exception as e:
+        logger.error(f"Readiness check failed: {e}")
+        raise HTTPException(status_code=503, detail="Database unavailable") from e
+    if not check["schema_up_to_date"]:
+        raise HTTPException(status_code=503, detail=f"Schema v{check['schema_version']} not up to date")
+    return {"status": "ready", "gemini_configured": config.has_gemini_key, **check}
 
 
 @app.post("/api/v1/invoices/process", tags=["Invoices"])
@@ -110,7 +181,9 @@ def process_invoice(
             400, detail=f"Unsupported file type: {file.content_type}"
         )
 
-    contents = file.file.read()
+    with span("api.read_upload") as read:
+        contents = file.file.read()
+        read.set("bytes", len(contents))
     if len(contents) > MAX_FILE_SIZE:
         raise HTTPException(
             413,
@@ -118,7 +191,7 @@ def process_invoice(
         )
 
     try:
-        result = orch.process_file(contents, file.filename)
+        result = orch.process_file(contents, file.filename, priority=INTERACTIVE)
         Metrics.increment("invoices_processed")
         Metrics.increment("products_added", result.products_added)
         Metrics.increment("products_updated", result.products_updated)
@@ -130,23 +203,74 @@ def process_invoice(
             "supplier": result.invoice.fournisseur,
             "products_added": result.products_added,
             "products_updated": result.products_updated,
+            "products_held": result.products_held,
             "was_cached": result.was_cached,
             "products": [
                 p.model_dump() for p in result.invoice.products
             ],
         }
+    except CircuitOpenError as e:
+        raise HTTPException(
+            503, detail=str(e), headers={"Retry-After": str(int(e.retry_after))}
+        ) from e
     except Exception as e:
         logger.error(f"Processing error: {e}", exc_info=True)
         raise HTTPException(
             500, detail=f"Processing failed: {str(e)}"
-        )
+        ) from e
+
+
+@app.post("/api/v1/invoices/batch", status_code=202, tags=["Invoices"])
+def process_invoice_batch(
+    background_tasks: BackgroundTasks,
+    files: list[UploadFile] = File(...),
+    orch: ExtractionOrchestrator = Depends(get_orchestrator),
+):
+    """
+    Upload a bundle of invoices (several files and/or .zip archives).
+    Files are spooled to disk, then processed in the background; poll
+    `/api/v1/invoices/batch/{job_id}` for per-file outcomes.
+    """
+    batch = UploadBatch(max_file_size=MAX_FILE_SIZE)
+    try:
+        for upload in files:
+            batch.add_upload(upload.filename or "", upload.file)
+    except BatchRejectedError as e:
+        shutil.rmtree(batch.workdir, ignore_errors=True)
+        raise HTTPException(400, detail=str(e)) from e
+    if not batch.files:
+        shutil.rmtree(batch.workdir, ignore_errors=True)
+        raise HTTPException(400, detail="No supported invoice in the upload")
+
+    _track_batch(batch)
+    background_tasks.add_task(batch.run, orch)
+    return {
+        "job_id": batch.job_id,
+        "status_url": f"/api/v1/invoices/batch/{batch.job_id}",
+        "total": len(batch.files),
+        "rejected": [f for f in batch.results if f["status"] == "rejected"],
+    }
+
+
+@app.get("/api/v1/invoices/batch/{job_id}", tags=["Invoices"])
+async def get_invoice_batch(job_id: str):
+    """Progress and per-file outcome of a batch upload."""
+    with _batch_jobs_lock:
+        batch = _batch_jobs.get(job_id)
+    if batch is None:
+        raise HTTPException(404, detail="Unknown batch job")
+    return batch.to_dict()
 
 
 @app.get("/api/v1/catalogue", tags=["Catalogue"])
-async def get_catalogue(
+def get_catalogue(
     famille: str | None = None,
     fournisseur: str | None = None,
     search: str | None = None,
+    sort: str | None = None,
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
     db: DBManager = Depends(get_db),
 ):
     """
@@ -155,47 +279,242 @@ async def get_catalogue(
     - **famille**: Filter by product family (Ciment, Finition...)
     - **fournisseur**: Filter by supplier name
     - **search**: Full-text search on designations
+    - **sort** / **order**: Sort column and direction (default famille, designation_fr)
+    - **limit** / **offset**: One page of results; `total` is the full match count
     """
-    df = db.get_catalogue()
+    try:
+        df = db.get_catalogue(
+            famille=famille, fournisseur=fournisseur, search=search,
+            sort=sort, order=order, limit=limit, offset=offset,
+        )
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e)) from e
+
+    if limit is None:
+        total = len(df)
+    else:
+        total = db.count_catalogue(famille=famille, fournisseur=fournisseur, search=search)
     if df.empty:
-        return {"products": [], "total": 0}
+        return {"products": [], "total": total, "offset": offset, "limit": limit}
 
     # Nettoyage anti-NaN/Inf robuste pour la sérialisation JSON
     df = df.replace([np.inf, -np.inf], 0).fillna(0)
 
-    if famille:
-        df = df[df["famille"] == famille]
-    if fournisseur:
-        df = df[df["fournisseur"] == fournisseur]
-    if search:
-        mask = (
-            df["designation_fr"].str.contains(
-                search, case=False, na=False
-            )
-            | df["designation_raw"].str.contains(
-                search, case=False, na=False
-            )
-        )
-        df = df[mask]
+    return {"products": df.to_dict("records"), "total": total, "offset": offset, "limit": limit}
+
+
+@app.get("/api/v1/catalogue/facets", tags=["Catalogue"])
+def get_catalogue_facets(
+    famille: str | None = None,
+    fournisseur: str | None = None,
+    search: str | None = None,
+    db: DBManager = Depends(get_db),
+):
+    """Distinct familles / fournisseurs with counts, narrowed by the other filters."""
+    facets = db.get_facets(famille=famille, fournisseur=fournisseur, search=search)
+    return {
+        "familles": [{"value": v, "count": c} for v, c in facets["famille"]],
+        "fournisseurs": [{"value": v, "count": c} for v, c in facets["fournisseur"]],
+    }
+
+
+@app.patch("/api/v1/products", tags=["Catalogue"])
+def patch_products(patches: list[ProductPatch], db: DBManager = Depends(get_db)):
+    """
+    Bulk edit: all rows are validated and applied in one transaction.
+    With `updated_at`, a row changed since the client read it fails the whole
+    batch with 409 (nothing is written). Returns the updated rows.
+    """
+    if len(patches) > MAX_PAGE_SIZE:
+        raise HTTPException(413, detail=f"At most {MAX_PAGE_SIZE} rows per request")
+    ids = [patch.id for patch in patches]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(422, detail="Duplicate product ids")
+    try:
+        rows = db.update_products([(p.id, p.fields.changes(), p.updated_at) for p in patches])
+    except UpdateConflictError as e:
+        raise HTTPException(409, detail={"conflicts": e.conflicts, "missing": e.missing}) from e
+    return {"products": rows, "updated": len(rows)}
+
+
+@app.get("/api/v1/reviews", tags=["Catalogue"])
+def get_price_reviews(
+    status: str | None = Query("pending", pattern="^(pending|approved|rejected)$"),
+    after: int = Query(0, ge=0, description="Cursor: last review id already seen"),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    db: DBManager = Depends(get_db),
+):
+    """
+    Lines held by the price-anomaly check, oldest first: proposed price,
+    current and expected price, and the robust score that flagged them.
+    """
+    reviews = db.get_price_reviews(status=status, after=after, limit=limit)
+    return {
+        "reviews": reviews,
+        "next_cursor": reviews[-1]["id"] if reviews else after,
+        "has_more": len(reviews) == limit,
+    }
+
+
+def _resolve_review(db: DBManager, review_id: int, approve: bool) -> dict:
+    try:
+        review = db.resolve_price_review(review_id, approve)
+    except ReviewResolvedError as e:
+        raise HTTPException(409, detail=str(e)) from e
+    if review is None:
+        raise HTTPException(404, detail=f"Review {review_id} not found")
+    return review
+
+
+@app.post("/api/v1/reviews/{review_id}/approve", tags=["Catalogue"])
+def approve_price_review(review_id: int, db: DBManager = Depends(get_db)):
+    """Apply the held line to the catalogue (its price becomes part of the product's history)."""
+    return _resolve_review(db, review_id, approve=True)
 
-    return {"products": df.to_dict("records"), "total": len(df)}
+
+@app.post("/api/v1/reviews/{review_id}/reject", tags=["Catalogue"])
+def reject_price_review(review_id: int, db: DBManager = Depends(get_db)):
+    """Discard the held line; the catalogue keeps its current price."""
+    return _resolve_review(db, review_id, approve=False)
 
 
 @app.get("/api/v1/stats", tags=["System"])
-async def get_stats(db: DBManager = Depends(get_db)):
+def get_stats(db: DBManager = Depends(get_db)):
     """Get database statistics."""
     return db.get_stats()
 
 
 @app.get("/api/v1/invoices", tags=["Invoices"])
-async def get_invoices(db: DBManager = Depends(get_db)):
-    """List all processed invoices."""
-    df = db.get_invoices()
+def get_invoices(
+    numero_facture: str | None = None,
+    db: DBManager = Depends(get_db),
+):
+    """List processed invoices, optionally those with a given invoice number."""
+    df = db.get_invoices(numero_facture=numero_facture)
     if df.empty:
         return {"invoices": [], "total": 0}
     return {"invoices": df.to_dict("records"), "total": len(df)}
 
 
+async def _sse_stream(sub, replay, lost, is_disconnected):
+    """SSE wire format for one subscription: replay, then live events and heartbeats."""
+    try:
+        yield "retry: 3000\n\n"
+        if lost:
+            yield f"event: reset\ndata: {{\"last_id\": {event_bus.last_id}}}\n\n"
+        for event in replay:
+            yield event.to_sse()
+        while not sub.exhausted:
+            event = await sub.get(timeout=SSE_HEARTBEAT)
+            if event is None:
+                if await is_disconnected():
+                    break
+                yield ": keep-alive\n\n"
+            else:
+                yield event.to_sse()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        sub.close()
+
+
+@app.get("/api/v1/events/stream", tags=["System"])
+async def stream_events(
+    request: Request,
+    types: str | None = Query(None, description="Comma-separated prefixes: pipeline,watcher,job"),
+    last_event_id: int | None = Query(None, description="Resume point when the header cannot be set"),
+    last_event_id_header: str | None = Header(None, alias="Last-Event-ID"),
+):
+    """
+    Server-Sent Events: pipeline stages, watcher activity and job completions.
+    Reconnecting with Last-Event-ID replays missed events from the ring
+    buffer; a `reset` event tells the client when some were lost.
+    """
+    resume_from = last_event_id
+    if last_event_id_header and last_event_id_header.isdigit():
+        resume_from = int(last_event_id_header)
+    type_filter = {t.strip() for t in types.split(",") if t.strip()} if types else None
+    sub, replay, lost = event_bus.subscribe(resume_from, type_filter)
+    return StreamingResponse(
+        _sse_stream(sub, replay, lost, request.is_disconnected), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/v1/events", tags=["System"])
+def get_processing_events(
+    after: int = Query(0, ge=0, description="Cursor: last event id already seen"),
+    status: str | None = Query(None, pattern=f"^({'|'.join(EVENT_KINDS)})$"),
+    filename: str | None = None,
+    since: str | None = Query(None, description="ISO timestamp lower bound"),
+    limit: int = Query(100, ge=1, le=MAX_EVENTS_PAGE),
+    db: DBManager = Depends(get_db),
+):
+    """
+    Persistent processing history (watcher and startup scan), oldest first.
+    Pass `next_cursor` back as `after` to fetch the following page.
+    """
+    events = db.get_processing_events(
+        after=after, status=status, filename=filename, since=since, limit=limit
+    )
+    return {
+        "events": events,
+        "next_cursor": events[-1]["id"] if events else after,
+        "has_more": len(events) == limit,
+    }
+
+
+@app.get("/api/v1/usage", tags=["System"])
+def get_usage(
+    days: int = Query(30, ge=1, le=366),
+    db: DBManager = Depends(get_db),
+):
+    """Gemini calls, tokens, latency and estimated cost per day, per model tier and per supplier."""
+    since = (date.today() - timedelta(days=days - 1)).isoformat()
+    by_model = db.get_usage_by_model(since)
+    for row in by_model:
+        row["cost_usd"] = cost_usd(row["input_tokens"], row["output_tokens"], config, row["model"])
+    day_costs = {}
+    for row in db.get_usage_by_model(since, per_day=True):
+        day_costs[row["day"]] = day_costs.get(row["day"], 0.0) + cost_usd(
+            row["input_tokens"], row["output_tokens"], config, row["model"]
+        )
+    by_day = db.get_usage_by_day(since)
+    for row in by_day:
+        # Days booked before per-model accounting are priced at the standard model's rates
+        row["cost_usd"] = round(day_costs.get(row["day"], cost_usd(
+            row["input_tokens"], row["output_tokens"], config
+        )), 4)
+    by_supplier = db.get_usage_by_supplier(since, *model_prices(config))
+    budget = TokenBudget(db, config.daily_token_budget)
+    return {
+        "since": since,
+        "budget": {
+            "daily_limit": config.daily_token_budget or None,
+            "spent_today": budget.spent_today(),
+            "remaining": budget.remaining(),
+        },
+        "by_day": by_day,
+        "by_model": by_model,
+        "by_supplier": by_supplier,
+    }
+
+
+@app.get("/api/v1/admin/profiles", tags=["Admin"], dependencies=[Depends(require_admin)])
+async def get_profiles():
+    """Stored profiles (collapsed stacks), newest first."""
+    return {"enabled": config.profiling_enabled, "profiles": list_profiles(config.profiles_dir)}
+
+
+@app.get("/api/v1/admin/profiles/{name}", tags=["Admin"], dependencies=[Depends(require_admin)])
+async def download_profile(name: str):
+    """One profile, ready for flamegraph.pl or speedscope."""
+    path = profile_path(config.profiles_dir, name)
+    if path is None:
+        raise HTTPException(404, detail="Unknown profile")
+    return FileResponse(path, media_type="text/plain", filename=name)
+
+
 @app.get("/api/v1/watcher/activity", tags=["System"])
 async def get_watcher_activity():
     """Get the latest activity from the folder watcher."""
@@ -5,15 +5,25 @@ Streamlit UI that communicates with the FastAPI backend.
 import os
 import io
 import time
+import json
 import requests
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 import streamlit as st
 import pandas as pd
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from PIL import Image
 from dotenv import load_dotenv
 
+from backend.core.config import get_config
+from backend.core.tracing import configure as configure_tracing, inject, span
+
 # --- SETUP ---
 load_dotenv()
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(name)s] %(levelname)s: %(message)s")
@@ -23,6 +33,8 @@ API_URL = os.getenv("API_URL", "http://localhost:8000")
 API_KEYS_ENV = os.getenv("API_KEYS", "")
 API_KEY = API_KEYS_ENV.split(",")[0] if API_KEYS_ENV else ""
 HEADERS = {"X-API-Key": API_KEY} if API_KEY else {}
+MAX_PARALLEL_UPLOADS = 12
+HTTP_POOL_SIZE = MAX_PARALLEL_UPLOADS + 4  # uploads + concurrent dashboard GETs / page prefetch
 
 # --- PAGE CONFIG ---
 st.set_page_config(
@@ -92,11 +104,123 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+# --- HTTP ---
+@st.cache_resource
+def get_http_session():
+    """One keep-alive session per Streamlit server process, shared by all viewers and threads."""
+    session = requests.Session()
+    retry = Retry(
+        total=3, backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD"}),  # never replay uploads or edits
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(HEADERS)
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    return session
+
+http = get_http_session()
+
+
+@st.cache_resource
+def init_tracing():
+    """Same TRACING_ENABLED / TRACE_FILE settings as the API; uploads then carry a traceparent."""
+    configure_tracing(get_config())
+
+init_tracing()
+
+
+class EventListener:
+    """
+    Background SSE consumer (one per server process): keeps watcher activity
+    and in-flight pipeline stages in memory, so reruns read them locally
+    instead of polling the API. Reconnects with Last-Event-ID.
+    """
+
+    FINAL_STAGES = {"done", "cached", "failed", "empty"}
+
+    def __init__(self, session):
+        self.session = session
+        self.last_id = 0  # first connect replays the server's buffer
+        self.connected = False
+        self.activity = deque(maxlen=10)
+        self.in_progress = {}  # filename -> pipeline stage
+        self.lock = threading.Lock()
+        threading.Thread(target=self._run, name="sse-listener", daemon=True).start()
+
+    def _run(self):
+        backoff = 1
+        while True:
+            try:
+                with self.session.get(
+                    f"{API_URL}/api/v1/events/stream",
+                    params={"types": "pipeline,watcher,job"},
+                    headers={"Last-Event-ID": str(self.last_id)},
+                    stream=True, timeout=(5, 60),  # idle streams get a heartbeat every 15s
+                ) as res:
+                    if res.status_code == 200:
+                        self.connected, backoff = True, 1
+                        self._consume(res.iter_lines(decode_unicode=True))
+            except Exception as e:
+                logger.debug(f"Event stream interrupted: {e}")
+            self.connected = False
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def _consume(self, lines):
+        event_type, data = None, None
+        for line in lines:
+            if line.startswith("id:"):
+                self.last_id = int(line[3:].strip())
+            elif line.startswith("event:"):
+                event_type = line[6:].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[5:])
+            elif not line:
+                if event_type and data is not None:
+                    self._apply(event_type, data)
+                event_type, data = None, None
+
+    def _apply(self, event_type, data):
+        with self.lock:
+            if event_type == "reset":
+                self.in_progress.clear()  # events were lost: stages may be stale
+            elif event_type == "watcher.activity":
+                self.activity.append(data)
+            elif event_type.startswith("pipeline."):
+                stage = event_type.split(".", 1)[1]
+                if stage in self.FINAL_STAGES:
+                    self.in_progress.pop(data.get("filename"), None)
+                else:
+                    self.in_progress[data.get("filename")] = stage
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.activity)[::-1], dict(self.in_progress)  # newest first
+
+
+@st.cache_resource
+def get_event_listener():
+    return EventListener(get_http_session())
+
+listener = get_event_listener()
+
+
 # --- HELPERS ---
+@st.cache_data(ttl=5)
+def check_api_health():
+    try:
+        return http.get(f"{API_URL}/health/live", timeout=3).status_code
+    except Exception:
+        return None
+
 @st.cache_data(ttl=10)
 def fetch_stats():
     try:
-        res = requests.get(f"{API_URL}/api/v1/stats", headers=HEADERS, timeout=5)
+        res = http.get(f"{API_URL}/api/v1/stats", timeout=5)
         if res.status_code == 200:
             return res.json()
     except Exception as e:
@@ -106,24 +230,99 @@ def fetch_stats():
 @st.cache_data(ttl=1)
 def fetch_watcher_activity():
     try:
-        res = requests.get(f"{API_URL}/api/v1/watcher/activity", headers=HEADERS, timeout=3)
+        res = http.get(f"{API_URL}/api/v1/watcher/activity", timeout=3)
         if res.status_code == 200:
             return res.json().get("activity", [])
     except Exception:
         pass
     return []
 
-@st.cache_data(ttl=1)
-def fetch_catalogue():
+PAGE_SIZES = [50, 100, 250]
+PAGE_CACHE_SIZE = 6  # pages kept per session, whatever the catalogue size
+SORT_OPTIONS = {
+    "Famille": None,
+    "Désignation (FR)": "designation_fr",
+    "Fournisseur": "fournisseur",
+    "P.U. Remisé HT": "prix_remise_ht",
+    "Date Facture": "date_facture",
+}
+
+@st.cache_resource
+def get_page_pool():
+    """Prefetch pool shared by every session; module globals are rebuilt on each rerun."""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="catalogue-page")
+
+def _request_page(query, page, page_size):
+    # Plain HTTP, no Streamlit calls: runs in the prefetch pool
+    params = {k: v for k, v in query.items() if v}
+    params.update(limit=page_size, offset=page * page_size)
+    res = http.get(f"{API_URL}/api/v1/catalogue", params=params, timeout=10)
+    res.raise_for_status()
+    return res.json()
+
+def fetch_catalogue_page(query, page, page_size):
+    """
+    One catalogue page through a small LRU of futures in session_state, so a
+    page prefetched in the background is picked up instead of refetched.
+    """
+    cache = st.session_state.setdefault("catalogue_pages", OrderedDict())
+
+    def _future(p):
+        key = (tuple(sorted(query.items())), p, page_size)
+        if key not in cache:
+            cache[key] = get_page_pool().submit(_request_page, query, p, page_size)
+        cache.move_to_end(key)
+        while len(cache) > PAGE_CACHE_SIZE:
+            cache.popitem(last=False)
+        return key, cache[key]
+
+    key, future = _future(page)
+    try:
+        body = future.result(timeout=15)
+    except Exception as e:
+        cache.pop(key, None)
+        logger.error(f"Failed to fetch catalogue page: {e}")
+        return {"products": [], "total": 0}
+    if (page + 1) * page_size < body.get("total", 0):
+        _future(page + 1)
+    return body
+
+def clear_catalogue_pages():
+    st.session_state.pop("catalogue_pages", None)
+
+def merge_catalogue_rows(rows):
+    """Patch rows returned by the API into the cached pages instead of refetching."""
+    by_id = {row["id"]: row for row in rows}
+    for future in st.session_state.get("catalogue_pages", {}).values():
+        if not future.done() or future.exception() is not None:
+            continue
+        for product in future.result().get("products", []):
+            if product.get("id") in by_id:
+                product.update(by_id[product["id"]])
+
+def fetch_dashboard():
+    """
+    Sidebar data (health, stats). Each keeps its own cache TTL; the ones
+    that expired are fetched concurrently instead of in series.
+    """
+    ctx = get_script_run_ctx()
+    fetchers = {"health": check_api_health, "stats": fetch_stats}
+    with ThreadPoolExecutor(
+        len(fetchers), initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)
+    ) as pool:
+        futures = {name: pool.submit(fn) for name, fn in fetchers.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+@st.cache_data(ttl=10)
+def fetch_facets(famille=None, fournisseur=None, search=None):
+    params = {k: v for k, v in {"famille": famille, "fournisseur": fournisseur, "search": search}.items() if v}
     try:
-        res = requests.get(f"{API_URL}/api/v1/catalogue", headers=HEADERS, timeout=10)
+        res = http.get(f"{API_URL}/api/v1/catalogue/facets", params=params, timeout=5)
         if res.status_code == 200:
-            data = res.json().get("products", [])
-            df = pd.DataFrame(data)
-            return df
+            return res.json()
     except Exception as e:
-        logger.error(f"Failed to fetch catalogue: {e}")
-    return pd.DataFrame()
+        logger.error(f"Failed to fetch facets: {e}")
+    return {"familles": [], "fournisseurs": []}
 
 def optimize_image(file_bytes, max_size=2000):
     """Compress image before sending to API to reduce payload & latency."""
@@ -146,18 +345,31 @@ def optimize_image(file_bytes, max_size=2000):
         logger.warning(f"Optimization skipped (not an image or error): {e}")
         return file_bytes, None # Keep original
 
-def process_single_file(file_name, file_bytes, file_type):
-    """Uploads a single file to the API."""
+def process_single_file(uploaded_file):
+    """
+    Uploads a single file to the API. Bytes are read here, in the worker, so
+    only the files currently in flight are held in memory.
+    """
+    file_name, file_type = uploaded_file.name, uploaded_file.type
     try:
-        # Optimize if it's an image
-        if file_type and file_type.startswith("image/"):
-            optimized_bytes, new_type = optimize_image(file_bytes)
-            if new_type:
-                file_bytes = optimized_bytes
-                file_type = new_type
-
-        files = {"file": (file_name, file_bytes, file_type)}
-        res = requests.post(f"{API_URL}/api/v1/invoices/process", files=files, headers=HEADERS, timeout=60)
+        with span("client.upload", filename=file_name):
+            uploaded_file.seek(0)
+            # Optimize if it's an image
+            if file_type and file_type.startswith("image/"):
+                with span("client.compress") as compress:
+                    optimized_bytes, new_type = optimize_image(uploaded_file.read())
+                    compress.set("bytes", len(optimized_bytes))
+                body = optimized_bytes
+                if new_type:
+                    file_type = new_type
+            else:
+                body = uploaded_file  # PDFs are sent straight from the upload buffer
+
+            files = {"file": (file_name, body, file_type)}
+            with span("client.http_post"):
+                res = http.post(
+                    f"{API_URL}/api/v1/invoices/process", files=files, timeout=60, headers=inject(),
+                )
 
         if res.status_code == 200:
             return file_name, True, res.json()
@@ -168,26 +380,66 @@ def process_single_file(file_name, file_bytes, file_type):
         return file_name, False, str(e)
 
 
+@st.fragment(run_every=2)
+def render_activity():
+    """Reruns on its own every 2s from the listener's memory: no API call while the stream is up."""
+    if listener.connected:
+        activity, in_progress = listener.snapshot()
+    else:
+        activity, in_progress = fetch_watcher_activity(), {}
+    for filename, stage in in_progress.items():
+        st.caption(f"⏳ {filename} — {stage}")
+    if activity:
+        for item in activity:
+            # Determine dot color
+            status = item.get("status", "")
+            dot_color = "#3B82F6" # Blue for processing
+            if "Terminé" in status: dot_color = "#10B981" # Green
+            if "Erreur" in status: dot_color = "#EF4444" # Red
+
+            ext = item.get("ext", "FILE")
+            size = item.get("size", "")
+
+            # Use background colors based on extension
+            bg_color = "#0078D4"
+            if ext in ["PDF"]: bg_color = "#F40F02" # Adobe Red
+            if ext in ["JPG", "JPEG", "PNG", "WEBP"]: bg_color = "#107C10" # Photo Green
+
+            st.markdown(f"""
+                <div class="docling-card">
+                    <div class="file-icon" style="background: {bg_color};">{ext}</div>
+                    <div class="file-info">
+                        <div class="file-name" title="{item['filename']}">{item['filename']}</div>
+                        <div class="file-status">
+                            <span class="status-dot" style="background: {dot_color};"></span>
+                            {status} • {item['time']} {f'• {size}' if size else ''}
+                        </div>
+                    </div>
+                </div>
+            """, unsafe_allow_html=True)
+    else:
+        st.caption("Aucune activité récente.")
+
+
 # --- SIDEBAR ---
 with st.sidebar:
     st.markdown("### 🛡️ Docling Agent v2")
     st.divider()
 
+    dashboard = fetch_dashboard()
+
     # Check API Health
-    api_online = False
-    try:
-        health_res = requests.get(f"{API_URL}/health", timeout=3)
-        if health_res.status_code == 200:
-            api_online = True
-            st.success("🟢 API Connectée")
-        else:
-            st.warning("🟠 API: Réponse inattendue")
-    except Exception:
+    api_online = dashboard["health"] == 200
+    if api_online:
+        st.success("🟢 API Connectée")
+    elif dashboard["health"] is not None:
+        st.warning("🟠 API: Réponse inattendue")
+    else:
         st.error("🔴 API Déconnectée")
         st.caption(f"Impossible de joindre {API_URL}")
 
     st.divider()
-    stats = fetch_stats()
+    stats = dashboard["stats"]
     nb_factures = stats.get("invoices", 0)
 
     st.markdown("### 📊 Statistiques")
@@ -217,50 +469,21 @@ with st.sidebar:
 
     max_workers_setting = st.slider(
         "⚡️ Agressivité Parallèle",
-        min_value=1, max_value=12, value=5,
+        min_value=1, max_value=MAX_PARALLEL_UPLOADS, value=5,
         help="Nombre de processus lancés simultanément vers l'API Gemini."
     )
 
     st.divider()
     if st.button("🔄 Rafraîchir les données", type="secondary"):
         fetch_stats.clear()
-        fetch_catalogue.clear()
+        clear_catalogue_pages()
+        fetch_facets.clear()
         st.rerun()
 
     st.divider()
     st.divider()
     st.markdown("### 🛡️ Activité Docling Agent")
-    activity = fetch_watcher_activity()
-    if activity:
-        for item in activity:
-            # Determine dot color
-            status = item.get("status", "")
-            dot_color = "#3B82F6" # Blue for processing
-            if "Terminé" in status: dot_color = "#10B981" # Green
-            if "Erreur" in status: dot_color = "#EF4444" # Red
-
-            ext = item.get("ext", "FILE")
-            size = item.get("size", "")
-
-            # Use background colors based on extension
-            bg_color = "#0078D4"
-            if ext in ["PDF"]: bg_color = "#F40F02" # Adobe Red
-            if ext in ["JPG", "JPEG", "PNG", "WEBP"]: bg_color = "#107C10" # Photo Green
-
-            st.markdown(f"""
-                <div class="docling-card">
-                    <div class="file-icon" style="background: {bg_color};">{ext}</div>
-                    <div class="file-info">
-                        <div class="file-name" title="{item['filename']}">{item['filename']}</div>
-                        <div class="file-status">
-                            <span class="status-dot" style="background: {dot_color};"></span>
-                            {status} • {item['time']} {f'• {size}' if size else ''}
-                        </div>
-                    </div>
-                </div>
-            """, unsafe_allow_html=True)
-    else:
-        st.caption("Aucune activité récente.")
+    render_activity()
 
 
 # --- TABS ---
@@ -292,40 +515,46 @@ with tab1:
         start_time = time.time()
 
         with ThreadPoolExecutor(max_workers=max_workers_setting) as executor:
-            # Submit all tasks
-            future_to_file = {
-                executor.submit(process_single_file, f.name, f.read(), f.type): f.name
-                for f in uploaded
-            }
+            # Producer: only as many files in flight as there are workers
+            pending_files = iter(uploaded)
+            in_flight = {}
+
+            def _fill_slots():
+                for f in islice(pending_files, max_workers_setting - len(in_flight)):
+                    in_flight[executor.submit(process_single_file, f)] = f.name
 
+            _fill_slots()
             completed = 0
-            for future in as_completed(future_to_file):
-                file_name = future_to_file[future]
-                completed += 1
-                progress_bar.progress(completed / len(uploaded))
-                status_text.text(f"Traitement : {completed}/{len(uploaded)} fichiers...")
-
-                try:
-                    name, success, data = future.result()
-                    with results_container:
-                        # Fix UI Overlap: Do not use st.status in parallel, use simple success/warning alerts.
-                        if success:
-                            if data.get("was_cached"):
-                                st.success(f"⏩ {name} : Déjà traité")
-                                total_cached += 1
-                            elif data.get("products_added", 0) + data.get("products_updated", 0) > 0:
-                                added = data["products_added"]
-                                updated = data["products_updated"]
-                                st.success(f"✅ {name} : {added} nouveaux, {updated} MAJ")
-                                total_added += added
-                                total_updated += updated
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_name = in_flight.pop(future)
+                    completed += 1
+                    progress_bar.progress(completed / len(uploaded))
+                    status_text.text(f"Traitement : {completed}/{len(uploaded)} fichiers...")
+
+                    try:
+                        name, success, data = future.result()
+                        with results_container:
+                            # Fix UI Overlap: Do not use st.status in parallel, use simple success/warning alerts.
+                            if success:
+                                if data.get("was_cached"):
+                                    st.success(f"⏩ {name} : Déjà traité")
+                                    total_cached += 1
+                                elif data.get("products_added", 0) + data.get("products_updated", 0) > 0:
+                                    added = data["products_added"]
+                                    updated = data["products_updated"]
+                                    st.success(f"✅ {name} : {added} nouveaux, {updated} MAJ")
+                                    total_added += added
+                                    total_updated += updated
+                                else:
+                                    st.warning(f"⚠️ {name} : Aucun produit extrait")
                             else:
-                                st.warning(f"⚠️ {name} : Aucun produit extrait")
-                        else:
-                            st.error(f"❌ {name} : Erreur: {data}")
-                except Exception as exc:
-                    with results_container:
-                        st.error(f"❌ {file_name} : Erreur fatale: {exc}")
+                                st.error(f"❌ {name} : Erreur: {data}")
+                    except Exception as exc:
+                        with results_container:
+                            st.error(f"❌ {file_name} : Erreur fatale: {exc}")
+                _fill_slots()
 
         duration = time.time() - start_time
         speed = len(uploaded) / duration if duration > 0 else 0
@@ -334,7 +563,8 @@ with tab1:
 
         # Force refresh metrics and catalogue after upload
         fetch_stats.clear()
-        fetch_catalogue.clear()
+        clear_catalogue_pages()
+        fetch_facets.clear()
 
         st.divider()
         cols = st.columns(3)
@@ -358,32 +588,68 @@ with tab2:
     st.markdown('<div class="main-title">📦 Catalogue Produits (Interactif)</div>', unsafe_allow_html=True)
     st.markdown('<div class="sub-title">Double-cliquez sur une cellule pour modifier la base de données.</div>', unsafe_allow_html=True)
 
-    df = fetch_catalogue()
+    total_products = fetch_stats().get("products", 0)
 
-    if df is None or df.empty:
+    if not total_products:
         st.info("Aucun produit. Uploadez des factures dans l'onglet Traitement ou vérifiez l'API.")
     else:
         col1, col2, col3 = st.columns([2, 1, 1])
         with col1:
             search = st.text_input("🔍 Rechercher", placeholder="Ciment, Portland, treillis...")
+        # Each menu is narrowed by the other filters: read both selections first
+        famille_sel = st.session_state.get("famille_filter", "Toutes")
+        fournisseur_sel = st.session_state.get("fournisseur_filter", "Tous")
+        facets = fetch_facets(
+            famille=None if famille_sel == "Toutes" else famille_sel,
+            fournisseur=None if fournisseur_sel == "Tous" else fournisseur_sel,
+            search=search or None,
+        )
+        famille_counts = {f["value"]: f["count"] for f in facets.get("familles", [])}
+        fournisseur_counts = {f["value"]: f["count"] for f in facets.get("fournisseurs", [])}
         with col2:
-            familles = ["Toutes"] + sorted(df["famille"].dropna().unique().tolist()) if "famille" in df else ["Toutes"]
-            famille_filter = st.selectbox("Famille", familles)
+            familles = ["Toutes"] + sorted(set(famille_counts) | ({famille_sel} - {"Toutes"}))
+            famille_filter = st.selectbox(
+                "Famille", familles, key="famille_filter",
+                format_func=lambda v: v if v == "Toutes" else f"{v} ({famille_counts.get(v, 0)})",
+            )
         with col3:
-            fournisseurs = ["Tous"] + sorted(df["fournisseur"].dropna().unique().tolist()) if "fournisseur" in df else ["Tous"]
-            fournisseur_filter = st.selectbox("Fournisseur", fournisseurs)
-
-        filtered = df.copy()
-        if search and "designation_raw" in filtered and "designation_fr" in filtered:
-            mask = (
-                filtered["designation_raw"].str.contains(search, case=False, na=False)
-                | filtered["designation_fr"].str.contains(search, case=False, na=False)
+            fournisseurs = ["Tous"] + sorted(set(fournisseur_counts) | ({fournisseur_sel} - {"Tous"}))
+            fournisseur_filter = st.selectbox(
+                "Fournisseur", fournisseurs, key="fournisseur_filter",
+                format_func=lambda v: v if v == "Tous" else f"{v} ({fournisseur_counts.get(v, 0)})",
             )
-            filtered = filtered[mask]
-        if famille_filter != "Toutes" and "famille" in filtered:
-            filtered = filtered[filtered["famille"] == famille_filter]
-        if fournisseur_filter != "Tous" and "fournisseur" in filtered:
-            filtered = filtered[filtered["fournisseur"] == fournisseur_filter]
+
+        query = {
+            "famille": None if famille_filter == "Toutes" else famille_filter,
+            "fournisseur": None if fournisseur_filter == "Tous" else fournisseur_filter,
+            "search": search or None,
+        }
+
+        col4, col5, col6, col7 = st.columns([2, 1, 1, 1])
+        with col4:
+            sort_label = st.selectbox("Trier par", list(SORT_OPTIONS))
+        with col5:
+            order = st.radio("Ordre", ["asc", "desc"], horizontal=True,
+                             format_func=lambda o: "↑" if o == "asc" else "↓")
+        with col6:
+            page_size = st.selectbox("Lignes / page", PAGE_SIZES)
+        query.update(sort=SORT_OPTIONS[sort_label], order=order)
+
+        # New filters or sort start again from the first page
+        signature = (tuple(sorted(query.items())), page_size)
+        if st.session_state.get("catalogue_signature") != signature:
+            st.session_state["catalogue_signature"] = signature
+            st.session_state["catalogue_page"] = 1
+        matching = st.session_state.get("catalogue_total", total_products)
+        with col7:
+            n_pages = max(1, -(-matching // page_size))
+            if st.session_state.get("catalogue_page", 1) > n_pages:
+                st.session_state["catalogue_page"] = n_pages
+            page_number = st.number_input("Page", min_value=1, max_value=n_pages, key="catalogue_page")
+
+        page = fetch_catalogue_page(query, page_number - 1, page_size)
+        st.session_state["catalogue_total"] = matching = page.get("total", 0)
+        filtered = pd.DataFrame(page.get("products", []))
 
         display_cols = {
             "id": "ID",
@@ -404,6 +670,12 @@ with tab2:
         existing_cols = {k: v for k, v in display_cols.items() if k in filtered.columns}
         display_df = filtered[list(existing_cols.keys())].rename(columns=existing_cols)
 
+        # One editor per page/query; the version bumps after a save to drop applied edits
+        editor_key = (
+            f"catalogue_editor_{abs(hash(signature))}_{page_number}_"
+            f"{st.session_state.get('catalogue_editor_version', 0)}"
+        )
+
         # We process edits here using st.data_editor
         edited_df = st.data_editor(
             display_df,
@@ -417,39 +689,47 @@ with tab2:
                 "N° Facture": st.column_config.Column(disabled=True),
                 "Date Facture": st.column_config.Column(disabled=True),
             },
-            key="catalogue_editor",
+            key=editor_key,
             num_rows="fixed"
         )
 
-        # Check if edits happened
-        editor_state = st.session_state.get("catalogue_editor", {})
-        if editor_state.get("edited_rows"):
-            for row_idx, edits in editor_state["edited_rows"].items():
-                real_row_idx = filtered.index[row_idx]
-                product_id = int(filtered.loc[real_row_idx, "id"])
-
-                # Reverse translate from UI Name to Backend Name
-                reverse_cols = {v: k for k, v in existing_cols.items()}
-
-                backend_updates = {}
-                for col_name, new_val in edits.items():
-                    if col_name in reverse_cols:
-                        backend_updates[reverse_cols[col_name]] = new_val
-
-                if backend_updates:
-                    res = requests.put(f"{API_URL}/api/v1/products/{product_id}", json=backend_updates, headers=HEADERS)
-                    if res.status_code == 200:
-                        st.toast(f"✅ Produit MAJ ({backend_updates})", icon="💾")
-                    else:
-                        st.error(f"❌ Erreur sauvegarde: {res.text}")
-
-            # Since we processed edits, clear the state and refresh
-            fetch_catalogue.clear()
+        # Pending edits are saved together in one PATCH
+        editor_state = st.session_state.get(editor_key, {})
+        edited_rows = editor_state.get("edited_rows", {})
+        if edited_rows and st.button(f"💾 Enregistrer ({len(edited_rows)} ligne(s) modifiée(s))", type="primary"):
+            # Reverse translate from UI Name to Backend Name
+            reverse_cols = {v: k for k, v in existing_cols.items()}
+            patches = []
+            for row_idx, edits in edited_rows.items():
+                row = filtered.iloc[int(row_idx)]
+                fields = {reverse_cols[col]: val for col, val in edits.items() if col in reverse_cols}
+                if fields:
+                    patches.append({"id": int(row["id"]), "fields": fields, "updated_at": row.get("updated_at")})
+
+            if patches:
+                res = http.patch(f"{API_URL}/api/v1/products", json=patches, timeout=10)
+                if res.status_code == 200:
+                    updated = res.json().get("products", [])
+                    merge_catalogue_rows(updated)
+                    if any("famille" in p["fields"] for p in patches):
+                        fetch_facets.clear()
+                    st.toast(f"✅ {len(updated)} produit(s) mis à jour", icon="💾")
+                elif res.status_code == 409:
+                    st.warning("⚠️ Des produits ont été modifiés entre-temps : rechargement, ressaisissez vos modifications.")
+                    clear_catalogue_pages()
+                else:
+                    st.error(f"❌ Erreur sauvegarde: {res.text}")
+            st.session_state["catalogue_editor_version"] = st.session_state.get("catalogue_editor_version", 0) + 1
             st.rerun()
 
-        st.caption(f"{len(filtered)} produits sur {len(df)}")
+        first = (page_number - 1) * page_size
+        st.caption(
+            f"Produits {first + 1 if len(filtered) else 0}–{first + len(filtered)} "
+            f"sur {matching} (catalogue : {total_products})"
+        )
 
         st.divider()
+        # Exports cover the page shown (the catalogue is read page by page)
         c1, c2 = st.columns(2)
         with c1:
             buf = io.BytesIO()
@@ -474,5 +754,5 @@ with tab3:
     1. **Upload Parallèle** : Compressé (WebP) et envoyé via ThreadPool (jusqu'à 10 fichiers en même temps)
     2. **Analyse IA** : L'API contacte Google Gemini 2.5 Flash pour l'extraction OCR & Structure
     3. **Stockage** : PostgreSQL (Neon) stocke ou met à jour les prix
-    4. **Catalogue** : Récupéré via GET `/api/v1/catalogue` (avec CRUD via `PUT`)
+    4. **Catalogue** : Récupéré page par page via GET `/api/v1/catalogue`, modifications enregistrées en lot via `PATCH /api/v1/products`
     """)
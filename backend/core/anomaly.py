@@ -0,0 +1,211 @@
+"""
+Price-anomaly screening at ingest.
+Each incoming line is scored against the recent prices of the same product
+(robust z-score of the log price: median and MAD), or, for a product never
+seen before, against the typical price of the products of its family and
+unit. Lines above ANOMALY_THRESHOLD are held in price_reviews instead of
+overwriting the catalogue (a 5x jump is usually a sac/kg mix-up or a misread).
+Summaries are computed with NumPy over price_history and cached per product;
+only products with new history rows are recomputed before scoring.
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from backend.core.db_manager import DBManager
+from backend.schemas.invoice import Product
+
+logger = logging.getLogger(__name__)
+
+HISTORY_WINDOW = 20  # recent prices kept per product
+MAD_TO_SIGMA = 1.4826
+# Smallest spread assumed, in log price (about ±28 %): one or two identical
+# past prices must not turn an ordinary price change into an anomaly
+MIN_LOG_SCALE = 0.25
+MIN_FAMILY_PRODUCTS = 20  # below this, a family says nothing about a new product
+FAMILY_REFRESH_SECONDS = 60.0
+
+
+@dataclass
+class Suspect:
+    """One line of the screened batch that should not be applied as is."""
+    index: int
+    product_id: Optional[int]
+    current_price: Optional[float]
+    expected_price: float
+    score: float
+    basis: str  # "product" or "family"
+
+
+def _sorted_group_median(values: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    return (values[starts + (counts - 1) // 2] + values[starts + counts // 2]) / 2
+
+
+def group_median_mad(groups: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """Per-group (groups, median, MAD, count) of values, all groups at once."""
+    order = np.lexsort((values, groups))
+    groups, values = groups[order], values[order]
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    counts = np.diff(np.r_[starts, len(groups)])
+    median = _sorted_group_median(values, starts, counts)
+    deviations = np.abs(values - np.repeat(median, counts))
+    deviations = deviations[np.lexsort((deviations, groups))]
+    return groups[starts], median, _sorted_group_median(deviations, starts, counts), counts
+
+
+def _family_key(famille: Optional[str], unite: Optional[str]) -> Tuple[str, str]:
+    return (famille or "").strip().lower(), (unite or "").strip().lower()
+
+
+class PriceAnomalyDetector:
+    """Cached per-product and per-family log-price summaries, and batch scoring against them."""
+
+    _instances: Dict[str, "PriceAnomalyDetector"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, db: DBManager, threshold: float = 4.0):
+        self.db = db
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._seen_id = -1  # last price_history row summarised; -1: nothing loaded yet
+        # Dense arrays indexed by product id
+        self._median = np.zeros(0)
+        self._scale = np.zeros(0)
+        self._count = np.zeros(0, dtype=np.int64)
+        self._family_of = np.zeros(0, dtype=np.int64)
+        self._families: Dict[Tuple[str, str], int] = {}
+        self._family_median = np.zeros(0)
+        self._family_scale = np.zeros(0)
+        self._family_count = np.zeros(0, dtype=np.int64)
+        self._families_stale = True
+        self._families_built_at = 0.0
+
+    @classmethod
+    def for_db(cls, db: DBManager, threshold: float) -> "PriceAnomalyDetector":
+        """Process-wide detector (and summary cache) for the database file behind db."""
+        with cls._instances_lock:
+            detector = cls._instances.get(db.db_path)
+            if detector is None:
+                detector = cls._instances[db.db_path] = cls(db, threshold)
+            detector.threshold = threshold
+            return detector
+
+    def _grow(self, size: int):
+        if size <= len(self._count):
+            return
+        extra = size - len(self._count) + 1024
+        self._median = np.r_[self._median, np.zeros(extra)]
+        self._scale = np.r_[self._scale, np.zeros(extra)]
+        self._count = np.r_[self._count, np.zeros(extra, dtype=np.int64)]
+        self._family_of = np.r_[self._family_of, np.full(extra, -1, dtype=np.int64)]
+
+    def _summarise(self, product_ids: np.ndarray, prices: np.ndarray):
+        """Recompute the summaries of the products present in (product_ids, prices)."""
+        if not len(product_ids):
+            return
+        # Rows come ordered by product then age: keep each product's most recent window
+        starts = np.flatnonzero(np.r_[True, product_ids[1:] != product_ids[:-1]])
+        counts = np.diff(np.r_[starts, len(product_ids)])
+        from_end = np.repeat(starts + counts, counts) - np.arange(len(product_ids))
+        recent = from_end <= HISTORY_WINDOW
+        ids, median, mad, n = group_median_mad(product_ids[recent], np.log(prices[recent]))
+        self._grow(int(ids.max()) + 1)
+        self._median[ids] = median
+        self._scale[ids] = np.maximum(MAD_TO_SIGMA * mad, MIN_LOG_SCALE)
+        self._count[ids] = n
+        self._families_stale = True
+
+    def _build_families(self):
+        """Typical log price per (famille, unite): the median over its products' medians."""
+        self._families = {}
+        rows = self.db.get_product_families()
+        if rows:
+            self._grow(max(product_id for product_id, _, _ in rows) + 1)
+        self._family_of[:] = -1
+        for product_id, famille, unite in rows:
+            self._family_of[product_id] = self._families.setdefault(
+                _family_key(famille, unite), len(self._families)
+            )
+        known = np.flatnonzero((self._count > 0) & (self._family_of >= 0))
+        self._family_median = np.zeros(len(self._families))
+        self._family_scale = np.zeros(len(self._families))
+        self._family_count = np.zeros(len(self._families), dtype=np.int64)
+        if len(known):
+            codes, median, mad, n = group_median_mad(self._family_of[known], self._median[known])
+            self._family_median[codes] = median
+            self._family_scale[codes] = np.maximum(MAD_TO_SIGMA * mad, MIN_LOG_SCALE)
+            self._family_count[codes] = n
+        self._families_stale = False
+        self._families_built_at = time.monotonic()
+
+    def refresh(self):
+        """Bring the cached summaries up to date with price_history."""
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        if self._seen_id < 0:
+            started = time.perf_counter()
+            max_id = self.db.price_history_max_id()
+            self._summarise(*self.db.load_price_history())
+            logger.info(
+                f"Price summaries built for {int(np.count_nonzero(self._count))} products "
+                f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+            )
+        else:
+            max_id = self.db.price_history_max_id()
+            if max_id > self._seen_id:
+                changed = self.db.get_changed_price_products(self._seen_id)
+                self._summarise(*self.db.load_price_history(changed))
+        self._seen_id = max_id
+        if not self._families_built_at or (
+            self._families_stale and time.monotonic() - self._families_built_at >= FAMILY_REFRESH_SECONDS
+        ):
+            self._build_families()
+
+    def screen(self, products: List[Product]) -> List[Suspect]:
+        """Score a batch of incoming lines (one invoice); returns the ones above the threshold."""
+        if not products:
+            return []
+        with self._lock:
+            self._refresh()
+            found = self.db.find_products([(p.designation_raw, p.fournisseur) for p in products])
+            current = [found.get((p.designation_raw, p.fournisseur)) for p in products]
+            product_id = np.array([c[0] if c else -1 for c in current], dtype=np.int64)
+            family = np.array(
+                [self._families.get(_family_key(p.famille, p.unite), -1) for p in products], dtype=np.int64
+            )
+            prices = np.array([p.prix_remise_ht for p in products], dtype=np.float64)
+
+            priced = prices > 0
+            log_price = np.log(np.where(priced, prices, 1.0))
+            # Lines of a known product: against its own recent prices
+            by_product = (product_id >= 0) & (product_id < len(self._count))
+            by_product[by_product] = self._count[product_id[by_product]] > 0
+            # New products: against the typical price of their family, if it has enough products
+            by_family = ~by_product & (family >= 0)
+            by_family[by_family] = self._family_count[family[by_family]] >= MIN_FAMILY_PRODUCTS
+
+            center = np.zeros(len(products))
+            scale = np.ones(len(products))
+            ids, codes = product_id[by_product], family[by_family]
+            center[by_product], scale[by_product] = self._median[ids], self._scale[ids]
+            center[by_family], scale[by_family] = self._family_median[codes], self._family_scale[codes]
+            scores = np.abs(log_price - center) / scale
+            flagged = np.flatnonzero(priced & (by_product | by_family) & (scores > self.threshold))
+
+        return [
+            Suspect(
+                index=int(i),
+                product_id=current[i][0] if current[i] else None,
+                current_price=current[i][1] if current[i] else None,
+                expected_price=round(float(np.exp(center[i])), 4),
+                score=round(float(scores[i]), 2),
+                basis="product" if by_product[i] else "family",
+            )
+            for i in flagged
+        ]
@@ -0,0 +1,192 @@
+"""
+Offline backfill of invoice archives through the Gemini Batch API.
+Walk → hash → batch jobs (checkpointed in SQLite) → poll → bulk upsert.
+Originals are left in place; an interrupted run resumes its open jobs.
+"""
+import argparse
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+from backend.core.db_manager import DBManager
+from backend.core.events import event_bus
+from backend.core.orchestrator import ExtractionOrchestrator, MIME_TYPES
+from backend.core.usage import TokenBudget, track_usage
+from backend.services.gemini_service import BATCH_FAILED_STATES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+MAX_BATCH_BYTES = 20 * 1024 * 1024  # inline batch request limit
+DEFAULT_POLL_INTERVAL = 60.0  # seconds
+
+
+class BatchBackfill:
+    """Packages archive invoices into asynchronous Gemini batch jobs."""
+
+    def __init__(
+        self,
+        orchestrator: ExtractionOrchestrator,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_batch_bytes: int = MAX_BATCH_BYTES,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+    ):
+        self.orchestrator = orchestrator
+        self.db = orchestrator.db
+        self.gemini = orchestrator.gemini
+        self.batch_size = batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.poll_interval = poll_interval
+        self.budget = TokenBudget(self.db, orchestrator.config.daily_token_budget)
+
+    def run(self, root: str, wait: bool = True) -> Dict[str, int]:
+        """
+        Submit every new invoice under root, then (if wait) poll until all
+        open jobs — including those left by a previous run — are ingested.
+        """
+        stats = {"submitted": 0, "ingested": 0, "failed": 0, "skipped": 0, "deferred": 0}
+
+        for batch in self._pending_batches(Path(root), stats):
+            if self.budget.exhausted():
+                # Backfill is deferrable: the rest is picked up by the next run
+                logger.warning(
+                    f"⏸️ Budget tokens du jour atteint ({self.budget.daily_limit}), "
+                    f"soumission des lots suspendue"
+                )
+                stats["deferred"] += len(batch)
+                break
+            job_name = self.gemini.submit_batch(
+                [(file_hash, data, mime_type) for file_hash, _, data, mime_type in batch],
+                display_name=f"docling-backfill-{int(time.time())}",
+            )
+            self.db.record_backfill_job(
+                job_name, [(file_hash, str(path)) for file_hash, path, _, _ in batch]
+            )
+            stats["submitted"] += len(batch)
+
+        if wait:
+            self.wait(stats)
+        return stats
+
+    def wait(self, stats: Dict[str, int]):
+        """Poll open jobs until none is left."""
+        while True:
+            open_jobs = self.db.get_open_backfill_jobs()
+            if not open_jobs:
+                return
+            pending = [job for job in open_jobs if not self._poll(job, stats)]
+            if not pending:
+                return
+            logger.info(f"⏳ {len(pending)} batch(s) en cours, prochaine vérification dans {self.poll_interval}s")
+            time.sleep(self.poll_interval)
+
+    def _pending_batches(
+        self, root: Path, stats: Dict[str, int]
+    ) -> Iterator[List[Tuple[str, Path, bytes, str]]]:
+        """Lazily group new files into batches bounded by count and payload size."""
+        known = self.db.get_backfill_hashes()
+        batch: List[Tuple[str, Path, bytes, str]] = []
+        batch_bytes = 0
+
+        for path in root.rglob("*"):
+            if not path.is_file() or path.suffix.lower() not in MIME_TYPES:
+                continue
+            data = path.read_bytes()
+            file_hash = DBManager.compute_file_hash(data)
+            if file_hash in known or self.db.is_invoice_processed(file_hash):
+                stats["skipped"] += 1
+                continue
+            if len(data) > self.max_batch_bytes:
+                logger.warning(f"⚠️ {path.name} trop volumineux pour un batch, ignoré")
+                stats["skipped"] += 1
+                continue
+            known.add(file_hash)
+
+            if batch and (
+                len(batch) >= self.batch_size or batch_bytes + len(data) > self.max_batch_bytes
+            ):
+                yield batch
+                batch, batch_bytes = [], 0
+            batch.append((file_hash, path, data, MIME_TYPES[path.suffix.lower()]))
+            batch_bytes += len(data)
+
+        if batch:
+            yield batch
+
+    def _poll(self, job_name: str, stats: Dict[str, int]) -> bool:
+        """Check one job and ingest its results. Returns True once the job is closed."""
+        items = self.db.get_backfill_items(job_name)
+        with track_usage() as usage:
+            state, results, usages = self.gemini.get_batch(job_name, [file_hash for file_hash, _, _ in items])
+        if results is not None:
+            self.db.record_token_usage(usage)
+
+        if results is None:
+            if state in BATCH_FAILED_STATES:
+                logger.error(f"❌ Batch {job_name} terminé en échec ({state})")
+                for file_hash, _, status in items:
+                    if status == "pending":
+                        self.db.set_backfill_item_status(file_hash, "failed")
+                        stats["failed"] += 1
+                self.db.set_backfill_job_state(job_name, "failed")
+                event_bus.publish("job.failed", job_id=job_name, kind="backfill", state=state)
+                return True
+            self.db.set_backfill_job_state(job_name, state)
+            return False
+
+        for file_hash, path, status in items:
+            # Items already ingested before an interruption are not replayed
+            if status != "pending":
+                continue
+            result = results.get(file_hash)
+            if result is None:
+                self.db.set_backfill_item_status(file_hash, "failed")
+                stats["failed"] += 1
+                continue
+            self.orchestrator.ingest_result(file_hash, Path(path).name, result, usage=usages.get(file_hash))
+            self.db.set_backfill_item_status(file_hash, "done")
+            stats["ingested"] += 1
+
+        self.db.set_backfill_job_state(job_name, "done")
+        logger.info(f"✅ Batch {job_name} intégré ({len(items)} factures)")
+        event_bus.publish("job.done", job_id=job_name, kind="backfill", invoices=len(items))
+        return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="docling-backfill",
+        description="Import d'archives de factures via l'API Batch de Gemini (tarif batch, asynchrone).",
+    )
+    parser.add_argument(
+        "root", nargs="?", default=os.getenv("WATCHDOG_FOLDER", "Docling_Factures"),
+        help="Dossier d'archives à parcourir (récursif, fichiers laissés en place)",
+    )
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL)
+    parser.add_argument(
+        "--no-wait", action="store_true",
+        help="Soumettre sans attendre ; une exécution ultérieure reprend le suivi des jobs",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(name)s] %(levelname)s: %(message)s",
+    )
+    backfill = BatchBackfill(
+        ExtractionOrchestrator(),
+        batch_size=args.batch_size,
+        poll_interval=args.poll_interval,
+    )
+    stats = backfill.run(args.root, wait=not args.no_wait)
+    print(
+        f"Soumises: {stats['submitted']} | Intégrées: {stats['ingested']} | "
+        f"Échecs: {stats['failed']} | Ignorées: {stats['skipped']} | Reportées: {stats['deferred']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Resumable bulk import of an invoice tree (`docling-import <dir>`).
+One walk (which also gives the ETA its total) → parallel hashing → bulk
+skip of known hashes → concurrent extraction, with per-file checkpoints in
+SQLite and live throughput/ETA. Originals are never moved.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Set, Tuple
+
+from backend.core.config import get_config
+from backend.core.db_manager import DBManager
+from backend.core.events import event_bus
+from backend.core.orchestrator import ExtractionOrchestrator, MIME_TYPES
+from backend.core.scheduler import BACKFILL
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+HASH_CHUNK = 256  # files hashed and checked against the DB per round
+SKIP_DIRS = {"Traitees", "Erreurs"}
+
+
+class ImportProgress:
+    """Live counters with throughput and ETA."""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.started = time.monotonic()
+        self.added = 0
+        self.skipped = 0
+        self.failed = 0
+
+    @property
+    def done(self) -> int:
+        return self.added + self.skipped + self.failed
+
+    @property
+    def rate(self) -> float:
+        """Extracted files per second (skips are excluded: they cost nothing)."""
+        elapsed = time.monotonic() - self.started
+        return (self.added + self.failed) / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        remaining = self.total - self.done
+        if remaining <= 0:
+            return 0.0
+        return remaining / self.rate if self.rate > 0 else None
+
+    def format(self) -> str:
+        pct = 100 * self.done / self.total if self.total else 100.0
+        eta = self.eta_seconds
+        eta_txt = "--" if eta is None else time.strftime("%H:%M:%S", time.gmtime(eta))
+        return (
+            f"📥 {self.done}/{self.total} ({pct:.1f}%) | {self.rate:.2f} fichiers/s | "
+            f"ETA {eta_txt} | ✅ {self.added} ⏩ {self.skipped} ❌ {self.failed}"
+        )
+
+
+def iter_invoice_files(root: Path) -> Iterator[Path]:
+    """Depth-first lazy walk yielding supported invoice files."""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda e: e.name)
+        except OSError as e:
+            logger.warning(f"Dossier illisible {directory}: {e}")
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in SKIP_DIRS:
+                    stack.append(Path(entry.path))
+            elif Path(entry.name).suffix.lower() in MIME_TYPES:
+                yield Path(entry.path)
+
+
+class BulkImporter:
+    """
+    Imports a folder tree through ExtractionOrchestrator, leaving files in place.
+    Extractions also go through the process-wide scheduler at backfill
+    priority: at most EXTRACTION_SLOTS run at once whatever `workers` is,
+    fewer while other work in the same process holds slots.
+    """
+
+    def __init__(
+        self,
+        orchestrator: ExtractionOrchestrator,
+        workers: int = DEFAULT_WORKERS,
+        hash_workers: Optional[int] = None,
+    ):
+        self.orchestrator = orchestrator
+        self.db = orchestrator.db
+        self.workers = workers
+        self.hash_workers = hash_workers or min(8, os.cpu_count() or 1)
+
+    def run(
+        self,
+        root: str,
+        on_progress: Optional[Callable[[ImportProgress], None]] = None,
+    ) -> ImportProgress:
+        root_path = Path(root)
+        # Paths are small: keep the walk, its length makes the ETA meaningful
+        paths = list(iter_invoice_files(root_path))
+        progress = ImportProgress(total=len(paths))
+        report = on_progress or (lambda p: None)
+
+        files = iter(paths)
+        in_flight: Set[Future] = set()
+        with ThreadPoolExecutor(self.hash_workers, thread_name_prefix="import-hash") as hash_pool, \
+                ThreadPoolExecutor(self.workers, thread_name_prefix="import-extract") as pool:
+            while True:
+                chunk = list(islice(files, HASH_CHUNK))
+                if not chunk:
+                    break
+                for path, file_hash in self._new_files(chunk, hash_pool, progress):
+                    # Bound in-flight extractions so file bytes never pile up in memory
+                    while len(in_flight) >= self.workers * 2:
+                        finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        self._collect(finished, progress)
+                        report(progress)
+                    in_flight.add(pool.submit(self._import_one, path, file_hash))
+                report(progress)
+
+            while in_flight:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                self._collect(finished, progress)
+                report(progress)
+
+        event_bus.publish(
+            "job.done", job_id=str(root_path), kind="bulk_import",
+            counts={"added": progress.added, "skipped": progress.skipped, "failed": progress.failed},
+        )
+        return progress
+
+    def _new_files(
+        self, chunk: List[Path], hash_pool: ThreadPoolExecutor, progress: ImportProgress
+    ) -> List[Tuple[Path, str]]:
+        """Hash a chunk in parallel and drop files already imported or checkpointed done."""
+        hashes = list(hash_pool.map(lambda p: DBManager.compute_path_hash(str(p)), chunk))
+        known = self.db.get_processed_hashes(hashes)
+        statuses = self.db.get_import_statuses(hashes)
+
+        fresh, seen = [], set()
+        for path, file_hash in zip(chunk, hashes):
+            if file_hash in known or statuses.get(file_hash) == "done" or file_hash in seen:
+                progress.skipped += 1
+                continue
+            seen.add(file_hash)
+            fresh.append((path, file_hash))
+        return fresh
+
+    def _import_one(self, path: Path, file_hash: str) -> str:
+        """Returns 'added', 'skipped' (imported concurrently elsewhere) or 'failed'."""
+        self.db.set_import_status(file_hash, str(path), "pending")
+        try:
+            result = self.orchestrator.process_file(
+                path.read_bytes(), path.name, file_hash=file_hash, priority=BACKFILL
+            )
+        except Exception as e:
+            logger.error(f"❌ {path.name}: {e}")
+            self.db.set_import_status(file_hash, str(path), "failed", str(e))
+            return "failed"
+        if not result.was_cached and not result.invoice.products:
+            # Extraction gave nothing (the service returns None rather than raising): retry on resume
+            logger.error(f"❌ {path.name}: aucun produit extrait")
+            self.db.set_import_status(file_hash, str(path), "failed", "Aucun produit extrait")
+            return "failed"
+        self.db.set_import_status(file_hash, str(path), "done")
+        return "skipped" if result.was_cached else "added"
+
+    @staticmethod
+    def _collect(finished: Set[Future], progress: ImportProgress):
+        for future in finished:
+            outcome = future.result()
+            setattr(progress, outcome, getattr(progress, outcome) + 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="docling-import",
+        description="Import massif et reprenable d'un dossier de factures (les fichiers restent en place).",
+    )
+    parser.add_argument("root", help="Dossier à importer (récursif)")
+    parser.add_argument(
+        "-j", "--workers", type=int, default=DEFAULT_WORKERS,
+        help=f"Extractions Gemini simultanées (défaut {DEFAULT_WORKERS}) ; fixe aussi EXTRACTION_SLOTS de ce processus",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(asctime)s [%(name)s] %(levelname)s: %(message)s",
+    )
+    # The CLI is its own process: size its scheduler so -j is not capped at EXTRACTION_SLOTS
+    orchestrator = ExtractionOrchestrator(get_config(EXTRACTION_SLOTS=args.workers))
+    importer = BulkImporter(orchestrator, workers=args.workers)
+
+    last_print = [0.0]
+
+    def _print_progress(progress: ImportProgress):
+        now = time.monotonic()
+        if now - last_print[0] >= 1.0 or progress.done == progress.total:
+            last_print[0] = now
+            sys.stdout.write("\r" + progress.format())
+            sys.stdout.flush()
+
+    progress = importer.run(args.root, on_progress=_print_progress)
+    sys.stdout.write("\r" + progress.format() + "\n")
+    return 1 if progress.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
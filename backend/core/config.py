@@ -10,6 +10,49 @@ class AppConfig(BaseSettings):
 
     gemini_api_key: str = Field(default="", alias="GEMINI_API_KEY")
     db_path: str = Field(default="data_cache.db")
+    db_group_commit: bool = Field(default=True, alias="DB_GROUP_COMMIT")
+    gemini_streaming: bool = Field(default=False, alias="GEMINI_STREAMING")
+    gemini_schema_mode: bool = Field(default=True, alias="GEMINI_SCHEMA_MODE")
+    # Off: the instructions (~300 tokens) are below the explicit-cache minimum (1024+)
+    gemini_prompt_cache: bool = Field(default=False, alias="GEMINI_PROMPT_CACHE")
+    gemini_prompt_cache_ttl: int = Field(default=3600, alias="GEMINI_PROMPT_CACHE_TTL")
+    gemini_model: str = Field(default="gemini-2.5-flash", alias="GEMINI_MODEL")
+    # Cheap-first routing: small single-page documents try the fast tier first
+    gemini_model_routing: bool = Field(default=True, alias="GEMINI_MODEL_ROUTING")
+    gemini_fast_model: str = Field(default="gemini-2.5-flash-lite", alias="GEMINI_FAST_MODEL")
+    gemini_fast_max_bytes: int = Field(default=2 * 1024 * 1024, alias="GEMINI_FAST_MAX_BYTES")
+    gemini_fast_max_pages: int = Field(default=1, alias="GEMINI_FAST_MAX_PAGES")
+    # List prices, USD per million tokens (fast tier, then standard)
+    gemini_fast_input_price_per_m: float = Field(default=0.10, alias="GEMINI_FAST_INPUT_PRICE_PER_M")
+    gemini_fast_output_price_per_m: float = Field(default=0.40, alias="GEMINI_FAST_OUTPUT_PRICE_PER_M")
+    gemini_input_price_per_m: float = Field(default=0.30, alias="GEMINI_INPUT_PRICE_PER_M")
+    gemini_output_price_per_m: float = Field(default=2.50, alias="GEMINI_OUTPUT_PRICE_PER_M")
+    # Batch API jobs are billed at this fraction of the interactive prices
+    gemini_batch_price_factor: float = Field(default=0.5, alias="GEMINI_BATCH_PRICE_FACTOR")
+    # Opt-in: small images arriving close together share one model request
+    gemini_packing: bool = Field(default=False, alias="GEMINI_PACKING")
+    gemini_pack_max_docs: int = Field(default=8, alias="GEMINI_PACK_MAX_DOCS")
+    gemini_pack_max_wait_ms: float = Field(default=250.0, alias="GEMINI_PACK_MAX_WAIT_MS")
+    gemini_pack_max_bytes: int = Field(default=512 * 1024, alias="GEMINI_PACK_MAX_BYTES")
+    gemini_call_timeout_s: float = Field(default=120.0, alias="GEMINI_CALL_TIMEOUT_S")
+    # A hedge's losing call is not cancelled: it still runs, is billed and holds a worker
+    gemini_hedging: bool = Field(default=True, alias="GEMINI_HEDGING")
+    gemini_hedge_min_delay_s: float = Field(default=2.0, alias="GEMINI_HEDGE_MIN_DELAY_S")
+    gemini_breaker_failures: int = Field(default=5, alias="GEMINI_BREAKER_FAILURES")
+    gemini_breaker_cooldown_s: float = Field(default=30.0, alias="GEMINI_BREAKER_COOLDOWN_S")
+    # Hold lines whose price is far from the product's (or family's) usual price
+    anomaly_detection: bool = Field(default=True, alias="ANOMALY_DETECTION")
+    anomaly_threshold: float = Field(default=4.0, alias="ANOMALY_THRESHOLD")  # robust z-score, log price
+    extraction_slots: int = Field(default=4, alias="EXTRACTION_SLOTS")  # concurrent model extractions
+    daily_token_budget: int = Field(default=0, alias="DAILY_TOKEN_BUDGET")  # 0: unlimited
+    admin_api_key: str = Field(default="", alias="ADMIN_API_KEY")
+    profiling_enabled: bool = Field(default=False, alias="PROFILING_ENABLED")
+    profile_pipeline: bool = Field(default=False, alias="PROFILE_PIPELINE")
+    profiles_dir: str = Field(default="profiles", alias="PROFILES_DIR")
+    profile_interval_ms: float = Field(default=5.0, alias="PROFILE_INTERVAL_MS")
+    tracing_enabled: bool = Field(default=False, alias="TRACING_ENABLED")
+    trace_exporter: str = Field(default="file", alias="TRACE_EXPORTER")  # file | console
+    trace_file: str = Field(default="traces.jsonl", alias="TRACE_FILE")
 
     model_config = {
         "env_file": ".env",
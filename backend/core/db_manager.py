@@ -5,15 +5,49 @@ import sqlite3
 import hashlib
 import threading
 import logging
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 
+import numpy as np
 import pandas as pd
 
+from backend.core.migrations import LATEST_VERSION, get_version, migrate
+from backend.core.tracing import span
+from backend.core.usage import Usage
 from backend.schemas.invoice import Product
 
 logger = logging.getLogger(__name__)
 
+# Max bound parameters per IN (...) query
+SQL_IN_CHUNK = 500
+EDITABLE_PRODUCT_FIELDS = {
+    "designation_fr", "famille", "unite",
+    "prix_brut_ht", "remise_pct", "prix_remise_ht", "prix_ttc_iva21",
+}
+CATALOGUE_SORT_COLUMNS = {
+    "famille", "designation_fr", "designation_raw", "fournisseur", "unite",
+    "prix_brut_ht", "prix_remise_ht", "prix_ttc_iva21", "date_facture", "updated_at",
+}
+
+
+class UpdateConflictError(Exception):
+    """Bulk edit rejected: some rows changed since the client read them, or are gone."""
+
+    def __init__(self, conflicts: List[int], missing: List[int]):
+        self.conflicts = conflicts
+        self.missing = missing
+        super().__init__(f"Conflicting ids: {conflicts}, missing ids: {missing}")
+
+
+class ReviewResolvedError(Exception):
+    """The price review was already approved or rejected."""
+
+    def __init__(self, review_id: int, status: str):
+        self.status = status
+        super().__init__(f"Review {review_id} already {status}")
+
 
 class DBManager:
     """Product-oriented SQLite manager with price upsert logic."""
@@ -31,139 +65,752 @@ class DBManager:
             self._conn.execute("PRAGMA synchronous=NORMAL")
         return self._conn
 
+    @contextmanager
+    def _locked(self, operation: str):
+        """The connection lock, traced as one DB span including the time spent waiting for it."""
+        with span(f"db.{operation}") as db_span:
+            waiting = time.perf_counter()
+            with self._lock:
+                db_span.set("lock_wait_ms", round((time.perf_counter() - waiting) * 1000, 3))
+                yield
+
     def _ensure_tables(self):
         with self._lock:
-            conn = self._get_connection()
-            with conn:
-                conn.execute("""
-                    CREATE TABLE IF NOT EXISTS products (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        fournisseur TEXT NOT NULL,
-                        designation_raw TEXT NOT NULL,
-                        designation_fr TEXT,
-                        famille TEXT,
-                        unite TEXT,
-                        prix_brut_ht REAL DEFAULT 0.0,
-                        remise_pct REAL,
-                        prix_remise_ht REAL DEFAULT 0.0,
-                        prix_ttc_iva21 REAL DEFAULT 0.0,
-                        numero_facture TEXT,
-                        date_facture TEXT,
-                        updated_at TIMESTAMP NOT NULL,
-                        UNIQUE(designation_raw, fournisseur)
-                    )
-                """)
-                conn.execute("""
-                    CREATE TABLE IF NOT EXISTS invoices (
-                        file_hash TEXT PRIMARY KEY,
-                        filename TEXT NOT NULL,
-                        fournisseur TEXT,
-                        numero_facture TEXT,
-                        date_facture TEXT,
-                        nb_products INTEGER DEFAULT 0,
-                        processed_at TIMESTAMP NOT NULL
-                    )
-                """)
-            logger.info(f"Database ready at {self.db_path}")
+            version = migrate(self._get_connection())
+            logger.info(f"Database ready at {self.db_path} (schema v{version})")
 
     @staticmethod
     def compute_file_hash(file_bytes: bytes) -> str:
         return hashlib.sha256(file_bytes).hexdigest()
 
+    @staticmethod
+    def compute_path_hash(path: str, chunk_size: int = 1024 * 1024) -> str:
+        """Same digest as compute_file_hash, read in chunks to keep memory flat."""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(chunk_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
     def is_invoice_processed(self, file_hash: str) -> bool:
-        with self._lock:
+        with self._locked("is_invoice_processed"):
             conn = self._get_connection()
             cur = conn.execute(
                 "SELECT 1 FROM invoices WHERE file_hash = ?", (file_hash,)
             )
             return cur.fetchone() is not None
 
+    def get_processed_hashes(self, file_hashes: List[str]) -> Set[str]:
+        """Bulk variant of is_invoice_processed: the subset already in invoices."""
+        found: Set[str] = set()
+        with self._locked("get_processed_hashes"):
+            conn = self._get_connection()
+            for i in range(0, len(file_hashes), SQL_IN_CHUNK):
+                chunk = file_hashes[i:i + SQL_IN_CHUNK]
+                cur = conn.execute(
+                    f"SELECT file_hash FROM invoices WHERE file_hash IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+                found.update(row[0] for row in cur.fetchall())
+        return found
+
     def upsert_product(self, product: Product, numero_facture: str, date_facture: str) -> str:
         """
         Insert or update a product. Returns 'added' or 'updated'.
         """
-        with self._lock:
+        with self._locked("upsert_product"):
             conn = self._get_connection()
-            cur = conn.execute(
-                "SELECT id FROM products WHERE designation_raw = ? AND fournisseur = ?",
-                (product.designation_raw, product.fournisseur),
+            action = self._upsert_row(
+                conn, product, numero_facture, date_facture, datetime.now().isoformat()
             )
-            existing = cur.fetchone()
-            now = datetime.now().isoformat()
+            conn.commit()
+            return action
 
-            if existing:
-                conn.execute(
-                    """UPDATE products SET
-                        designation_fr=?, famille=?, unite=?,
-                        prix_brut_ht=?, remise_pct=?, prix_remise_ht=?, prix_ttc_iva21=?,
-                        numero_facture=?, date_facture=?, updated_at=?
-                    WHERE id=?""",
-                    (
-                        product.designation_fr, product.famille, product.unite,
-                        product.prix_brut_ht, product.remise_pct,
-                        product.prix_remise_ht, product.prix_ttc_iva21,
-                        numero_facture, date_facture, now, existing[0],
-                    ),
-                )
-                conn.commit()
-                return "updated"
-            else:
-                conn.execute(
-                    """INSERT INTO products
-                        (fournisseur, designation_raw, designation_fr, famille, unite,
-                         prix_brut_ht, remise_pct, prix_remise_ht, prix_ttc_iva21,
-                         numero_facture, date_facture, updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (
-                        product.fournisseur, product.designation_raw,
-                        product.designation_fr, product.famille, product.unite,
-                        product.prix_brut_ht, product.remise_pct,
-                        product.prix_remise_ht, product.prix_ttc_iva21,
-                        numero_facture, date_facture, now,
-                    ),
+    def upsert_products(self, rows: List[Tuple[Product, str, str]]) -> List[str]:
+        """
+        Group commit: upsert many (product, numero_facture, date_facture) rows
+        in a single transaction. Returns the action of each row, in order.
+        """
+        now = datetime.now().isoformat()
+        with self._locked("upsert_products"):
+            conn = self._get_connection()
+            with conn:
+                return [
+                    self._upsert_row(conn, product, numero, date, now)
+                    for product, numero, date in rows
+                ]
+
+    @staticmethod
+    def _upsert_row(conn: sqlite3.Connection, product: Product,
+                    numero_facture: str, date_facture: str, now: str) -> str:
+        cur = conn.execute(
+            "SELECT id FROM products WHERE designation_raw = ? AND fournisseur = ?",
+            (product.designation_raw, product.fournisseur),
+        )
+        existing = cur.fetchone()
+
+        if existing:
+            DBManager._record_price(conn, existing[0], product.prix_remise_ht, numero_facture, date_facture, now)
+            conn.execute(
+                """UPDATE products SET
+                    designation_fr=?, famille=?, unite=?,
+                    prix_brut_ht=?, remise_pct=?, prix_remise_ht=?, prix_ttc_iva21=?,
+                    numero_facture=?, date_facture=?, updated_at=?
+                WHERE id=?""",
+                (
+                    product.designation_fr, product.famille, product.unite,
+                    product.prix_brut_ht, product.remise_pct,
+                    product.prix_remise_ht, product.prix_ttc_iva21,
+                    numero_facture, date_facture, now, existing[0],
+                ),
+            )
+            return "updated"
+
+        cur = conn.execute(
+            """INSERT INTO products
+                (fournisseur, designation_raw, designation_fr, famille, unite,
+                 prix_brut_ht, remise_pct, prix_remise_ht, prix_ttc_iva21,
+                 numero_facture, date_facture, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                product.fournisseur, product.designation_raw,
+                product.designation_fr, product.famille, product.unite,
+                product.prix_brut_ht, product.remise_pct,
+                product.prix_remise_ht, product.prix_ttc_iva21,
+                numero_facture, date_facture, now,
+            ),
+        )
+        DBManager._record_price(conn, cur.lastrowid, product.prix_remise_ht, numero_facture, date_facture, now)
+        return "added"
+
+    @staticmethod
+    def _record_price(conn: sqlite3.Connection, product_id: int, price: Optional[float],
+                      numero_facture: Optional[str], date_facture: Optional[str], now: str):
+        if price and price > 0:
+            conn.execute(
+                "INSERT INTO price_history (product_id, prix_remise_ht, numero_facture, date_facture, recorded_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (product_id, price, numero_facture, date_facture, now),
+            )
+
+    def update_products(
+        self, patches: List[Tuple[int, Dict, Optional[str]]]
+    ) -> List[Dict]:
+        """
+        Apply (id, fields, expected_updated_at) edits in one transaction.
+        A row whose updated_at no longer matches, or that no longer exists,
+        rolls back the whole batch with UpdateConflictError. Returns the updated rows.
+        """
+        now = datetime.now().isoformat()
+        conflicts, missing = [], []
+        with self._locked("update_products"):
+            conn = self._get_connection()
+            with conn:
+                for product_id, fields, expected in patches:
+                    unknown = set(fields) - EDITABLE_PRODUCT_FIELDS
+                    if unknown or not fields:
+                        raise ValueError(f"Non-editable fields: {sorted(unknown)}")
+                    sql = (
+                        f"UPDATE products SET {', '.join(f'{col} = ?' for col in fields)}, "
+                        "updated_at = ? WHERE id = ?"
+                    )
+                    params = [*fields.values(), now, product_id]
+                    if expected is not None:
+                        sql += " AND updated_at = ?"
+                        params.append(expected)
+                    if conn.execute(sql, params).rowcount == 0:
+                        exists = conn.execute(
+                            "SELECT 1 FROM products WHERE id = ?", (product_id,)
+                        ).fetchone()
+                        (conflicts if exists else missing).append(product_id)
+                    elif "prix_remise_ht" in fields:
+                        # A manual correction is a price like any other for the anomaly detector
+                        self._record_price(conn, product_id, fields["prix_remise_ht"], None, None, now)
+                if conflicts or missing:
+                    # Raising inside `with conn` rolls the whole batch back
+                    raise UpdateConflictError(conflicts, missing)
+
+            ids = [product_id for product_id, _, _ in patches]
+            rows = []
+            for i in range(0, len(ids), SQL_IN_CHUNK):
+                chunk = ids[i:i + SQL_IN_CHUNK]
+                cur = conn.execute(
+                    f"SELECT * FROM products WHERE id IN ({','.join('?' * len(chunk))})", chunk
                 )
-                conn.commit()
-                return "added"
+                columns = [col[0] for col in cur.description]
+                rows.extend(dict(zip(columns, row)) for row in cur.fetchall())
+            return rows
 
     def save_invoice(self, file_hash: str, filename: str, fournisseur: str,
-                     numero_facture: str, date_facture: str, nb_products: int):
-        with self._lock:
+                     numero_facture: str, date_facture: str, nb_products: int,
+                     usage: Optional[Usage] = None, cost_usd: Optional[float] = None):
+        usage_cols = (
+            (usage.calls, usage.input_tokens, usage.output_tokens, round(usage.latency_ms, 1),
+             usage.model or None, int(usage.escalations > 0), cost_usd)
+            if usage else (None, None, None, None, None, None, None)
+        )
+        with self._locked("save_invoice"):
             conn = self._get_connection()
             conn.execute(
-                "INSERT OR REPLACE INTO invoices VALUES (?, ?, ?, ?, ?, ?, ?)",
+                """INSERT INTO invoices
+                    (file_hash, filename, fournisseur, numero_facture,
+                     date_facture, nb_products, processed_at,
+                     model_calls, input_tokens, output_tokens, model_latency_ms,
+                     model, escalated, cost_usd)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(file_hash) DO UPDATE SET
+                    filename=excluded.filename, fournisseur=excluded.fournisseur,
+                    numero_facture=excluded.numero_facture, date_facture=excluded.date_facture,
+                    nb_products=excluded.nb_products, processed_at=excluded.processed_at,
+                    model_calls=excluded.model_calls, input_tokens=excluded.input_tokens,
+                    output_tokens=excluded.output_tokens, model_latency_ms=excluded.model_latency_ms,
+                    model=excluded.model, escalated=excluded.escalated, cost_usd=excluded.cost_usd""",
                 (file_hash, filename, fournisseur, numero_facture,
-                 date_facture, nb_products, datetime.now().isoformat()),
+                 date_facture, nb_products, datetime.now().isoformat(), *usage_cols),
             )
             conn.commit()
 
-    def get_catalogue(self) -> pd.DataFrame:
-        with self._lock:
+    # ── Token usage ───────────────────────────────────────
+    def record_token_usage(self, usage: Usage, day: Optional[str] = None):
+        """Add calls/tokens to the daily ledger (the budget reads it)."""
+        if not usage.calls and not usage.total_tokens:
+            return
+        day = day or datetime.now().date().isoformat()
+        with self._locked("record_token_usage"):
             conn = self._get_connection()
-            return pd.read_sql_query(
-                "SELECT * FROM products ORDER BY famille, designation_fr", conn
+            with conn:
+                conn.execute(
+                    """INSERT INTO token_usage_daily VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(day) DO UPDATE SET
+                        calls = calls + excluded.calls,
+                        input_tokens = input_tokens + excluded.input_tokens,
+                        output_tokens = output_tokens + excluded.output_tokens,
+                        latency_ms = latency_ms + excluded.latency_ms""",
+                    (day, usage.calls, usage.input_tokens, usage.output_tokens, usage.latency_ms),
+                )
+                conn.executemany(
+                    """INSERT INTO token_usage_by_model VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(day, model) DO UPDATE SET
+                        calls = calls + excluded.calls,
+                        input_tokens = input_tokens + excluded.input_tokens,
+                        output_tokens = output_tokens + excluded.output_tokens,
+                        latency_ms = latency_ms + excluded.latency_ms,
+                        escalations = escalations + excluded.escalations""",
+                    [(day, model, part.calls, part.input_tokens, part.output_tokens,
+                      part.latency_ms, part.escalations) for model, part in usage.by_model.items()],
+                )
+
+    def get_tokens_spent(self, day: str) -> int:
+        with self._locked("get_tokens_spent"):
+            row = self._get_connection().execute(
+                "SELECT input_tokens + output_tokens FROM token_usage_daily WHERE day = ?", (day,)
+            ).fetchone()
+            return row[0] if row else 0
+
+    def get_usage_by_day(self, since: str) -> List[Dict]:
+        with self._locked("get_usage_by_day"):
+            cur = self._get_connection().execute(
+                "SELECT * FROM token_usage_daily WHERE day >= ? ORDER BY day", (since,)
             )
+            columns = [col[0] for col in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
 
-    def get_invoices(self) -> pd.DataFrame:
-        with self._lock:
-            conn = self._get_connection()
-            return pd.read_sql_query(
-                "SELECT * FROM invoices ORDER BY processed_at DESC", conn
+    def get_usage_by_model(self, since: str, per_day: bool = False) -> List[Dict]:
+        """Calls, tokens, latency and escalations per model (and per day if asked)."""
+        day_column = "day, " if per_day else ""
+        with self._locked("get_usage_by_model"):
+            cur = self._get_connection().execute(
+                f"""SELECT {day_column}model,
+                          SUM(calls) AS calls,
+                          SUM(input_tokens) AS input_tokens,
+                          SUM(output_tokens) AS output_tokens,
+                          ROUND(SUM(latency_ms) / MAX(SUM(calls), 1), 1) AS avg_latency_ms,
+                          SUM(escalations) AS escalations
+                   FROM token_usage_by_model
+                   WHERE day >= ?
+                   GROUP BY {day_column}model
+                   ORDER BY {day_column}SUM(calls) DESC""",
+                (since,),
             )
+            columns = [col[0] for col in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    def get_usage_by_supplier(
+        self, since: str, input_price_per_m: float = 0.0, output_price_per_m: float = 0.0
+    ) -> List[Dict]:
+        """
+        Per-supplier totals over invoices processed since `since` (ISO date).
+        Invoices stored before per-model pricing are costed at the given prices.
+        """
+        with self._locked("get_usage_by_supplier"):
+            cur = self._get_connection().execute(
+                """SELECT COALESCE(fournisseur, '') AS fournisseur,
+                          COUNT(*) AS invoices,
+                          SUM(nb_products) AS products,
+                          SUM(model_calls) AS calls,
+                          SUM(input_tokens) AS input_tokens,
+                          SUM(output_tokens) AS output_tokens,
+                          ROUND(AVG(model_latency_ms), 1) AS avg_latency_ms,
+                          SUM(COALESCE(escalated, 0)) AS escalated,
+                          ROUND(SUM(COALESCE(
+                              cost_usd, (input_tokens * ? + output_tokens * ?) / 1e6
+                          )), 4) AS cost_usd
+                   FROM invoices
+                   WHERE processed_at >= ? AND model_calls IS NOT NULL
+                   GROUP BY COALESCE(fournisseur, '')
+                   ORDER BY SUM(input_tokens) + SUM(output_tokens) DESC""",
+                (input_price_per_m, output_price_per_m, since),
+            )
+            columns = [col[0] for col in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    @staticmethod
+    def _catalogue_where(
+        famille: Optional[str] = None,
+        fournisseur: Optional[str] = None,
+        search: Optional[str] = None,
+    ) -> Tuple[str, List]:
+        clauses, params = [], []
+        if famille:
+            clauses.append("famille = ?")
+            params.append(famille)
+        if fournisseur:
+            clauses.append("fournisseur = ?")
+            params.append(fournisseur)
+        if search:
+            clauses.append("(designation_fr LIKE ? OR designation_raw LIKE ?)")
+            params += [f"%{search}%", f"%{search}%"]
+        return (f" WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+    @staticmethod
+    def _catalogue_query(
+        famille: Optional[str] = None,
+        fournisseur: Optional[str] = None,
+        search: Optional[str] = None,
+        sort: Optional[str] = None,
+        order: str = "asc",
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> Tuple[str, List]:
+        """
+        SQL for one page of the filtered catalogue. The default order is the
+        (famille, designation_fr) index order; id breaks ties so pages are stable.
+        """
+        if sort is not None and sort not in CATALOGUE_SORT_COLUMNS:
+            raise ValueError(f"Unsupported sort column: {sort}")
+        if order not in ("asc", "desc"):
+            raise ValueError(f"Unsupported sort order: {order}")
+        where, params = DBManager._catalogue_where(famille, fournisseur, search)
+        direction = order.upper()
+        if sort:
+            order_by = f"{sort} {direction}, id {direction}"
+        else:
+            order_by = f"famille {direction}, designation_fr {direction}, id {direction}"
+        sql = f"SELECT * FROM products{where} ORDER BY {order_by}"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        return sql, params
+
+    @staticmethod
+    def _facet_query(
+        column: str,
+        famille: Optional[str] = None,
+        fournisseur: Optional[str] = None,
+        search: Optional[str] = None,
+    ) -> Tuple[str, List]:
+        """GROUP BY counts for one facet column under the other active filters."""
+        where, params = DBManager._catalogue_where(famille, fournisseur, search)
+        where += " AND " if where else " WHERE "
+        return (
+            f"SELECT {column}, COUNT(*) FROM products{where}"
+            f"{column} IS NOT NULL AND {column} != '' GROUP BY {column} ORDER BY {column}",
+            params,
+        )
+
+    @staticmethod
+    def _invoices_query(numero_facture: Optional[str] = None) -> Tuple[str, List]:
+        if numero_facture:
+            return (
+                "SELECT * FROM invoices WHERE numero_facture = ? ORDER BY processed_at DESC",
+                [numero_facture],
+            )
+        return "SELECT * FROM invoices ORDER BY processed_at DESC", []
+
+    def get_catalogue(
+        self,
+        famille: Optional[str] = None,
+        fournisseur: Optional[str] = None,
+        search: Optional[str] = None,
+        sort: Optional[str] = None,
+        order: str = "asc",
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> pd.DataFrame:
+        sql, params = self._catalogue_query(famille, fournisseur, search, sort, order, limit, offset)
+        with self._locked("get_catalogue"):
+            conn = self._get_connection()
+            return pd.read_sql_query(sql, conn, params=params)
+
+    def count_catalogue(
+        self,
+        famille: Optional[str] = None,
+        fournisseur: Optional[str] = None,
+        search: Optional[str] = None,
+    ) -> int:
+        """Matching product count; unfiltered it comes from the maintained counters."""
+        if not (famille or fournisseur or search):
+            return self.get_stats()["products"]
+        where, params = self._catalogue_where(famille, fournisseur, search)
+        with self._locked("count_catalogue"):
+            conn = self._get_connection()
+            return conn.execute(f"SELECT COUNT(*) FROM products{where}", params).fetchone()[0]
+
+    def get_invoices(self, numero_facture: Optional[str] = None) -> pd.DataFrame:
+        sql, params = self._invoices_query(numero_facture)
+        with self._locked("get_invoices"):
+            conn = self._get_connection()
+            return pd.read_sql_query(sql, conn, params=params)
 
     def get_stats(self) -> Dict:
-        with self._lock:
+        """O(1) counters maintained by triggers (see migration 3)."""
+        with self._locked("get_stats"):
             conn = self._get_connection()
-            products = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
-            invoices = conn.execute("SELECT COUNT(*) FROM invoices").fetchone()[0]
-            families = conn.execute("SELECT COUNT(DISTINCT famille) FROM products").fetchone()[0]
+            products, invoices, families = conn.execute("""
+                SELECT
+                    (SELECT count FROM catalogue_stats WHERE dimension = 'products' AND value = ''),
+                    (SELECT count FROM catalogue_stats WHERE dimension = 'invoices' AND value = ''),
+                    (SELECT COUNT(*) FROM catalogue_stats WHERE dimension = 'famille' AND value != '')
+            """).fetchone()
             return {"products": products, "invoices": invoices, "families": families}
 
+    def get_facet_counts(self) -> Dict[str, List[Tuple[str, int]]]:
+        """Unfiltered famille/fournisseur counts, read from the maintained counters."""
+        with self._locked("get_facet_counts"):
+            conn = self._get_connection()
+            cur = conn.execute(
+                "SELECT dimension, value, count FROM catalogue_stats "
+                "WHERE dimension IN ('famille', 'fournisseur') AND value != '' "
+                "ORDER BY dimension, value"
+            )
+            facets: Dict[str, List[Tuple[str, int]]] = {"famille": [], "fournisseur": []}
+            for dimension, value, count in cur.fetchall():
+                facets[dimension].append((value, count))
+            return facets
+
+    def get_facets(
+        self,
+        famille: Optional[str] = None,
+        fournisseur: Optional[str] = None,
+        search: Optional[str] = None,
+    ) -> Dict[str, List[Tuple[str, int]]]:
+        """
+        Distinct familles and fournisseurs with product counts. Each facet is
+        narrowed by the other filters and the search text (not by itself), so
+        the current selection stays listed alongside its alternatives.
+        """
+        if not (famille or fournisseur or search):
+            return self.get_facet_counts()
+        facets: Dict[str, List[Tuple[str, int]]] = {}
+        with self._locked("get_facets"):
+            conn = self._get_connection()
+            for column, filters in (
+                ("famille", {"fournisseur": fournisseur, "search": search}),
+                ("fournisseur", {"famille": famille, "search": search}),
+            ):
+                if not any(filters.values()):
+                    cur = conn.execute(
+                        "SELECT value, count FROM catalogue_stats "
+                        "WHERE dimension = ? AND value != '' ORDER BY value",
+                        (column,),
+                    )
+                else:
+                    cur = conn.execute(*self._facet_query(column, **filters))
+                facets[column] = [(value, count) for value, count in cur.fetchall()]
+        return facets
+
+    def check_ready(self) -> Dict:
+        """Deep readiness probe: schema version and a read on every core table."""
+        with self._locked("check_ready"):
+            conn = self._get_connection()
+            version = get_version(conn)
+            for table in ("products", "invoices", "catalogue_stats"):
+                conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchall()
+            return {"schema_version": version, "schema_up_to_date": version == LATEST_VERSION}
+
+    # ─── Bulk import checkpoints ───
+
+    def get_import_statuses(self, file_hashes: List[str]) -> Dict[str, str]:
+        statuses: Dict[str, str] = {}
+        with self._locked("get_import_statuses"):
+            conn = self._get_connection()
+            for i in range(0, len(file_hashes), SQL_IN_CHUNK):
+                chunk = file_hashes[i:i + SQL_IN_CHUNK]
+                cur = conn.execute(
+                    f"SELECT file_hash, status FROM import_files "
+                    f"WHERE file_hash IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+                statuses.update(cur.fetchall())
+        return statuses
+
+    def set_import_status(self, file_hash: str, path: str, status: str, error: Optional[str] = None):
+        with self._locked("set_import_status"):
+            conn = self._get_connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO import_files VALUES (?, ?, ?, ?, ?)",
+                (file_hash, path, status, error, datetime.now().isoformat()),
+            )
+            conn.commit()
+
+    # ─── Batch backfill checkpoints ───
+
+    def record_backfill_job(self, job_name: str, items: List[Tuple[str, str]]):
+        """Checkpoint a submitted batch job and its (file_hash, path) items."""
+        now = datetime.now().isoformat()
+        with self._locked("record_backfill_job"):
+            conn = self._get_connection()
+            with conn:
+                conn.execute(
+                    "INSERT INTO backfill_jobs VALUES (?, 'submitted', ?, ?)",
+                    (job_name, now, now),
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO backfill_items VALUES (?, ?, ?, 'pending')",
+                    [(file_hash, path, job_name) for file_hash, path in items],
+                )
+
+    def get_open_backfill_jobs(self) -> List[str]:
+        with self._locked("get_open_backfill_jobs"):
+            conn = self._get_connection()
+            cur = conn.execute(
+                "SELECT job_name FROM backfill_jobs WHERE state NOT IN ('done', 'failed') "
+                "ORDER BY created_at"
+            )
+            return [row[0] for row in cur.fetchall()]
+
+    def get_backfill_items(self, job_name: str) -> List[Tuple[str, str, str]]:
+        with self._locked("get_backfill_items"):
+            conn = self._get_connection()
+            cur = conn.execute(
+                "SELECT file_hash, path, status FROM backfill_items WHERE job_name = ? "
+                "ORDER BY rowid",
+                (job_name,),
+            )
+            return cur.fetchall()
+
+    def get_backfill_hashes(self) -> Set[str]:
+        """Hashes already submitted or ingested (failed items may be resubmitted)."""
+        with self._locked("get_backfill_hashes"):
+            conn = self._get_connection()
+            cur = conn.execute("SELECT file_hash FROM backfill_items WHERE status != 'failed'")
+            return {row[0] for row in cur.fetchall()}
+
+    def set_backfill_job_state(self, job_name: str, state: str):
+        with self._locked("set_backfill_job_state"):
+            conn = self._get_connection()
+            conn.execute(
+                "UPDATE backfill_jobs SET state = ?, updated_at = ? WHERE job_name = ?",
+                (state, datetime.now().isoformat(), job_name),
+            )
+            conn.commit()
+
+    def set_backfill_item_status(self, file_hash: str, status: str):
+        with self._locked("set_backfill_item_status"):
+            conn = self._get_connection()
+            conn.execute(
+                "UPDATE backfill_items SET status = ? WHERE file_hash = ?", (status, file_hash)
+            )
+            conn.commit()
+
+    # ── Processing event log ──────────────────────────────
+    def record_processing_event(
+        self, source: str, filename: str, status: str,
+        message: Optional[str] = None, size: Optional[str] = None,
+    ) -> int:
+        """Append one event; returns its id (the pagination cursor)."""
+        with self._locked("record_processing_event"):
+            conn = self._get_connection()
+            with conn:
+                cur = conn.execute(
+                    "INSERT INTO processing_events (created_at, source, filename, status, message, size) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (datetime.now().isoformat(), source, filename, status, message, size),
+                )
+            return cur.lastrowid
+
+    @staticmethod
+    def _processing_events_query(
+        after: int = 0,
+        status: Optional[str] = None,
+        filename: Optional[str] = None,
+        since: Optional[str] = None,
+        limit: int = 100,
+    ) -> Tuple[str, List]:
+        clauses, params = ["id > ?"], [after]
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if filename:
+            clauses.append("filename = ?")
+            params.append(filename)
+        if since:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        return (
+            f"SELECT * FROM processing_events WHERE {' AND '.join(clauses)} ORDER BY id LIMIT ?",
+            params + [limit],
+        )
+
+    def get_processing_events(
+        self,
+        after: int = 0,
+        status: Optional[str] = None,
+        filename: Optional[str] = None,
+        since: Optional[str] = None,
+        limit: int = 100,
+    ) -> List[Dict]:
+        """Events with id > after, oldest first; pass the last id back as `after` for the next page."""
+        sql, params = self._processing_events_query(after, status, filename, since, limit)
+        with self._locked("get_processing_events"):
+            conn = self._get_connection()
+            cur = conn.execute(sql, params)
+            columns = [col[0] for col in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    # ── Price history & anomaly reviews ──────────────────────
+    def price_history_max_id(self) -> int:
+        with self._locked("price_history_max_id"):
+            row = self._get_connection().execute("SELECT MAX(id) FROM price_history").fetchone()
+            return row[0] or 0
+
+    def get_changed_price_products(self, after_id: int) -> List[int]:
+        """Products with price history rows newer than after_id."""
+        with self._locked("get_changed_price_products"):
+            cur = self._get_connection().execute(
+                "SELECT DISTINCT product_id FROM price_history WHERE id > ?", (after_id,)
+            )
+            return [row[0] for row in cur.fetchall()]
+
+    def load_price_history(
+        self, product_ids: Optional[List[int]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """(product_id, price) arrays ordered by product then age, for all products or the given ones."""
+        chunks = [None] if product_ids is None else [
+            product_ids[i:i + SQL_IN_CHUNK] for i in range(0, len(product_ids), SQL_IN_CHUNK)
+        ]
+        rows = []
+        with self._locked("load_price_history"):
+            conn = self._get_connection()
+            for chunk in chunks:
+                where = "" if chunk is None else f"WHERE product_id IN ({','.join('?' * len(chunk))})"
+                rows.extend(conn.execute(
+                    f"SELECT product_id, prix_remise_ht FROM price_history {where} ORDER BY product_id, id",
+                    chunk or [],
+                ).fetchall())
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        table = np.array(rows, dtype=np.float64)
+        return table[:, 0].astype(np.int64), table[:, 1]
+
+    def get_product_families(self) -> List[Tuple[int, str, str]]:
+        """(id, famille, unite) of every catalogue product."""
+        with self._locked("get_product_families"):
+            cur = self._get_connection().execute(
+                "SELECT id, COALESCE(famille, ''), COALESCE(unite, '') FROM products"
+            )
+            return cur.fetchall()
+
+    def find_products(self, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Tuple[int, float]]:
+        """(designation_raw, fournisseur) → (id, prix_remise_ht) for the keys already in the catalogue."""
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        # Two parameters per key
+        step = SQL_IN_CHUNK // 2
+        with self._locked("find_products"):
+            conn = self._get_connection()
+            for i in range(0, len(unique), step):
+                chunk = unique[i:i + step]
+                cur = conn.execute(
+                    "SELECT designation_raw, fournisseur, id, prix_remise_ht FROM products "
+                    f"WHERE (designation_raw, fournisseur) IN (VALUES {', '.join(['(?, ?)'] * len(chunk))})",
+                    [value for key in chunk for value in key],
+                )
+                for designation_raw, fournisseur, product_id, price in cur.fetchall():
+                    found[(designation_raw, fournisseur)] = (product_id, price)
+        return found
+
+    def hold_price_reviews(self, rows: List[Dict]):
+        """Queue suspect lines (price_reviews columns) for review instead of applying them."""
+        if not rows:
+            return
+        now = datetime.now().isoformat()
+        columns = [
+            "product_id", "fournisseur", "designation_raw", "famille", "unite", "product_json",
+            "numero_facture", "date_facture", "current_price", "proposed_price",
+            "expected_price", "score", "basis",
+        ]
+        with self._locked("hold_price_reviews"):
+            conn = self._get_connection()
+            with conn:
+                conn.executemany(
+                    f"INSERT INTO price_reviews ({', '.join(columns)}, created_at) "
+                    f"VALUES ({', '.join('?' * len(columns))}, ?)",
+                    [[row.get(col) for col in columns] + [now] for row in rows],
+                )
+
+    def get_price_reviews(
+        self, status: Optional[str] = "pending", after: int = 0, limit: int = 100
+    ) -> List[Dict]:
+        """Reviews with id > after, oldest first (all statuses when status is None)."""
+        clauses, params = ["id > ?"], [after]
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        with self._locked("get_price_reviews"):
+            cur = self._get_connection().execute(
+                f"SELECT * FROM price_reviews WHERE {' AND '.join(clauses)} ORDER BY id LIMIT ?",
+                params + [limit],
+            )
+            columns = [col[0] for col in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    def resolve_price_review(self, review_id: int, approve: bool) -> Optional[Dict]:
+        """
+        Approve (apply the held line to the catalogue) or reject a pending
+        review, in one transaction. None if the review does not exist.
+        """
+        now = datetime.now().isoformat()
+        with self._locked("resolve_price_review"):
+            conn = self._get_connection()
+            with conn:
+                cur = conn.execute("SELECT * FROM price_reviews WHERE id = ?", (review_id,))
+                row = cur.fetchone()
+                if row is None:
+                    return None
+                review = dict(zip([col[0] for col in cur.description], row))
+                if review["status"] != "pending":
+                    raise ReviewResolvedError(review_id, review["status"])
+                if approve:
+                    self._upsert_row(
+                        conn, Product.model_validate_json(review["product_json"]),
+                        review["numero_facture"], review["date_facture"], now,
+                    )
+                review.update(status="approved" if approve else "rejected", resolved_at=now)
+                conn.execute(
+                    "UPDATE price_reviews SET status = ?, resolved_at = ? WHERE id = ?",
+                    (review["status"], now, review_id),
+                )
+            return review
+
     def reset_database(self):
-        with self._lock:
+        with self._locked("reset_database"):
             conn = self._get_connection()
             with conn:
                 conn.execute("DELETE FROM products")
                 conn.execute("DELETE FROM invoices")
+                conn.execute("DELETE FROM price_history")
+                conn.execute("DELETE FROM price_reviews")
             logger.warning("Database reset.")
 
     def close(self):
@@ -0,0 +1,143 @@
+"""
+Single-writer group commit for the product catalogue.
+Upserts from concurrent orchestrator calls are queued to one thread that
+coalesces them into shared transactions, so throughput scales with rows
+instead of commits.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from backend.core.db_manager import DBManager
+from backend.core.monitoring import Metrics
+from backend.core.tracing import current_span, span
+from backend.schemas.invoice import Product
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_ROWS = 500
+# Extra time the writer lingers for more work before committing. 0 drains only
+# what queued up during the previous commit, which already batches under load
+# without adding latency to a lone producer.
+MAX_WAIT_MS = 0.0
+
+_STOP = object()
+
+
+class _WriteRequest:
+    __slots__ = ("products", "numero_facture", "date_facture", "future", "parent")
+
+    def __init__(self, products: List[Product], numero_facture: str, date_facture: str):
+        self.products = products
+        self.numero_facture = numero_facture
+        self.date_facture = date_facture
+        self.future: "Future[Tuple[int, int]]" = Future()
+        self.parent = current_span()  # the commit is traced under the first request's trace
+
+
+class CatalogueWriter:
+    """Dedicated writer thread turning queued upserts into group commits."""
+
+    _instances: Dict[str, "CatalogueWriter"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(
+        self,
+        db: DBManager,
+        max_batch_rows: int = MAX_BATCH_ROWS,
+        max_wait_ms: float = MAX_WAIT_MS,
+    ):
+        self.db = db
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="catalogue-writer", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def for_db(cls, db: DBManager) -> "CatalogueWriter":
+        """Process-wide writer for the database file behind db."""
+        with cls._instances_lock:
+            writer = cls._instances.get(db.db_path)
+            if writer is None or not writer._thread.is_alive():
+                writer = cls(db)
+                cls._instances[db.db_path] = writer
+            return writer
+
+    def submit(
+        self, products: List[Product], numero_facture: str, date_facture: str
+    ) -> "Future[Tuple[int, int]]":
+        """Queue products for upsert. The future resolves to (added, updated)."""
+        request = _WriteRequest(list(products), numero_facture, date_facture)
+        if not request.products:
+            request.future.set_result((0, 0))
+        else:
+            self._queue.put(request)
+        return request.future
+
+    def close(self, timeout: Optional[float] = None):
+        """Flush queued writes and stop the thread."""
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            rows = len(first.products)
+            stop = False
+            deadline = time.monotonic() + self.max_wait
+            while rows < self.max_batch_rows:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+                rows += len(item.products)
+            self._commit(batch, rows)
+            if stop:
+                return
+
+    def _commit(self, batch: List[_WriteRequest], rows: int):
+        try:
+            with span("db.group_commit", parent=batch[0].parent, rows=rows, requests=len(batch)):
+                actions = self.db.upsert_products([
+                    (product, request.numero_facture, request.date_facture)
+                    for request in batch for product in request.products
+                ])
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error(f"Commit of {rows} rows failed: {e}")
+                batch[0].future.set_exception(e)
+                return
+            # The transaction was rolled back: one bad request must not fail the
+            # others, so retry each on its own and fail only the ones that still fail
+            logger.warning(f"Group commit of {rows} rows failed, retrying its {len(batch)} requests one by one: {e}")
+            Metrics.increment("db_group_commit_retries")
+            for request in batch:
+                self._commit([request], len(request.products))
+            return
+
+        Metrics.increment("db_group_commits")
+        Metrics.increment("db_rows_written", rows)
+        offset = 0
+        for request in batch:
+            mine = actions[offset:offset + len(request.products)]
+            offset += len(request.products)
+            added = sum(1 for action in mine if action == "added")
+            request.future.set_result((added, len(mine) - added))
+
+
+@atexit.register
+def _flush_writers():
+    for writer in list(CatalogueWriter._instances.values()):
+        writer.close(timeout=5)
@@ -0,0 +1,136 @@
+"""
+In-process pub/sub bus for pipeline, watcher and job events.
+Events get increasing ids and are kept in a ring buffer, so an SSE client
+reconnecting with Last-Event-ID replays what it missed.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+HISTORY_SIZE = 1000
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+class Event:
+    __slots__ = ("id", "type", "data", "time")
+
+    def __init__(self, event_id: int, event_type: str, data: Dict):
+        self.id = event_id
+        self.type = event_type
+        self.data = data
+        self.time = time.time()
+
+    def to_dict(self) -> Dict:
+        return {"id": self.id, "type": self.type, "time": self.time, **self.data}
+
+    def to_sse(self) -> str:
+        payload = json.dumps(self.to_dict(), ensure_ascii=False, default=str)
+        return f"id: {self.id}\nevent: {self.type}\ndata: {payload}\n\n"
+
+
+class Subscription:
+    """Async view of the bus for one consumer (e.g. one SSE connection)."""
+
+    def __init__(self, bus: "EventBus", loop: asyncio.AbstractEventLoop, types: Optional[Set[str]]):
+        self.bus = bus
+        self.loop = loop
+        self.types = types
+        self.queue: "asyncio.Queue[Event]" = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def wants(self, event: Event) -> bool:
+        return not self.types or event.type.split(".", 1)[0] in self.types or event.type in self.types
+
+    def _deliver(self, event: Event):
+        # Runs on the subscriber's loop
+        if self.overflowed:
+            return
+        if self.queue.full():
+            # Too slow: stop feeding it; the stream ends once the queue is drained
+            # and the client resumes from its Last-Event-ID
+            self.overflowed = True
+            self.bus.unsubscribe(self)
+            return
+        self.queue.put_nowait(event)
+
+    @property
+    def exhausted(self) -> bool:
+        return self.overflowed and self.queue.empty()
+
+    async def get(self, timeout: float) -> Optional[Event]:
+        """Next event, or None on timeout."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """Thread-safe publisher; subscribers are notified on their own event loop."""
+
+    def __init__(self, history_size: int = HISTORY_SIZE):
+        # Ids continue past a restart, so a stale Last-Event-ID reads as "events lost"
+        self._ids = itertools.count(int(time.time() * 1000))
+        self._history: Deque[Event] = deque(maxlen=history_size)
+        self._subscribers: List[Subscription] = []
+        self._lock = threading.Lock()
+
+    def publish(self, event_type: str, **data) -> Event:
+        with self._lock:
+            event = Event(next(self._ids), event_type, data)
+            self._history.append(event)
+            subscribers = [s for s in self._subscribers if s.wants(event)]
+        for sub in subscribers:
+            try:
+                sub.loop.call_soon_threadsafe(sub._deliver, event)
+            except RuntimeError:  # loop closed: the connection is gone
+                self.unsubscribe(sub)
+        return event
+
+    def subscribe(
+        self,
+        last_event_id: Optional[int] = None,
+        types: Optional[Set[str]] = None,
+    ) -> Tuple[Subscription, List[Event], bool]:
+        """
+        Register a consumer on the running loop. Returns the subscription,
+        the buffered events after last_event_id to replay, and whether events
+        were lost (last_event_id older than the ring buffer).
+        """
+        sub = Subscription(self, asyncio.get_running_loop(), types)
+        with self._lock:
+            # Snapshot and registration under one lock: nothing slips between them
+            replay, lost = [], False
+            if last_event_id is not None:
+                replay = [e for e in self._history if e.id > last_event_id and sub.wants(e)]
+                oldest = self._history[0].id if self._history else None
+                lost = oldest is not None and last_event_id < oldest - 1
+            self._subscribers.append(sub)
+        return sub, replay, lost
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            if sub in self._subscribers:
+                self._subscribers.remove(sub)
+
+    def recent(self, after: int = 0, limit: int = 100) -> List[Event]:
+        with self._lock:
+            return [e for e in self._history if e.id > after][-limit:]
+
+    @property
+    def last_id(self) -> int:
+        with self._lock:
+            return self._history[-1].id if self._history else 0
+
+
+event_bus = EventBus()
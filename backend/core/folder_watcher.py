@@ -5,11 +5,17 @@ import os
 import time
 import shutil
 import logging
+import threading
+from collections import deque
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+from backend.core.events import event_bus
 from backend.core.orchestrator import ExtractionOrchestrator
+from backend.core.scheduler import BACKFILL, WATCHER
+from backend.core.usage import TokenBudget
 
 logger = logging.getLogger(__name__)
 
@@ -35,7 +41,7 @@ class InvoiceHandler(FileSystemEventHandler):
 
         # Record entry
         size = f"{round(os.path.getsize(file_path) / 1024, 1)} KB"
-        self.watcher.add_activity(file_path.name, "🔄 En cours", size=size)
+        self.watcher.add_activity(file_path.name, "🔄 En cours", size=size, kind="processing")
 
         # Small delay to ensure file is fully written
         time.sleep(1)
@@ -52,67 +58,143 @@ class InvoiceHandler(FileSystemEventHandler):
 
                 logger.info(f"🚚 Deep Scan : Traitement de {item.name} ({item.relative_to(self.watch_path)})")
                 size = f"{round(os.path.getsize(item) / 1024, 1)} KB"
-                self.watcher.add_activity(item.name, "🔄 En cours (Scan Deep)", size=size)
-                self.process_file(item)
+                self.watcher.add_activity(
+                    item.name, "🔄 En cours (Scan Deep)", size=size, kind="processing", source="scan"
+                )
+                # The startup scan is archive work: it must not hold up live files or uploads
+                self.process_file(item, priority=BACKFILL)
+
+    def process_file(self, file_path: Path, priority: str = WATCHER):
+        if self.watcher.budget.exhausted():
+            # Leave the file in place; the watcher retries it once the budget frees up
+            logger.warning(f"⏸️ {file_path.name} reporté : budget tokens du jour atteint")
+            self.watcher.defer(file_path, priority)
+            return
 
-    def process_file(self, file_path: Path):
         logger.info(f"🔍 Chien de garde : Traitement détecté pour {file_path.name}")
         try:
             with open(file_path, "rb") as f:
                 content = f.read()
 
             # Process via orchestrator
-            self.orchestrator.process_file(content, file_path.name)
+            self.orchestrator.process_file(content, file_path.name, priority=priority)
 
             # Move to processed
             dest = self.processed_path / file_path.name
             shutil.move(str(file_path), str(dest))
             logger.info(f"✅ {file_path.name} traité et déplacé vers 'Traitees'")
-            self.watcher.add_activity(file_path.name, "✅ Terminé")
+            self.watcher.add_activity(file_path.name, "✅ Terminé", kind="done")
 
         except Exception as e:
             logger.error(f"❌ Erreur lors du traitement auto de {file_path.name}: {e}")
-            self.watcher.add_activity(file_path.name, f"❌ Erreur: {str(e)}")
+            self.watcher.add_activity(file_path.name, f"❌ Erreur: {str(e)}", kind="error", message=str(e))
             # Move to error
             dest = self.error_path / file_path.name
             shutil.move(str(file_path), str(dest))
 
+ACTIVITY_LOG_SIZE = 10
+EVENT_KINDS = ("processing", "done", "error", "deferred")
+# How often deferred files are retried against the daily token budget
+DEFERRED_RECHECK_SECONDS = 300
+
+
 class DoclingWatcher:
-    def __init__(self, orchestrator: ExtractionOrchestrator, watch_path: str = "Docling_Factures"):
+    def __init__(
+        self,
+        orchestrator: ExtractionOrchestrator,
+        watch_path: str = "Docling_Factures",
+        log_size: int = ACTIVITY_LOG_SIZE,
+        recheck_seconds: float = DEFERRED_RECHECK_SECONDS,
+    ):
         self.orchestrator = orchestrator
         self.watch_path = watch_path
         self.observer = Observer()
-        self.activity_log = [] # List of {filename, status, timestamp}
-
-    def add_activity(self, filename: str, status: str, size: str = None):
-        self.activity_log.append({
+        self.handler: Optional[InvoiceHandler] = None
+        self.budget = TokenBudget(orchestrator.db, orchestrator.config.daily_token_budget)
+        self.recheck_seconds = recheck_seconds
+        # Written from observer and scan threads, read by API requests
+        self.activity_log = deque(maxlen=log_size)
+        self.deferred: Dict[str, Tuple[Path, str]] = {}  # path → (file, priority class)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def add_activity(
+        self,
+        filename: str,
+        status: str,
+        size: Optional[str] = None,
+        kind: str = "processing",
+        message: Optional[str] = None,
+        source: str = "watcher",
+    ):
+        entry = {
             "filename": filename,
             "status": status,
             "size": size,
             "ext": filename.split('.')[-1].upper() if '.' in filename else "FILE",
             "time": time.strftime("%H:%M:%S")
-        })
-        # Keep only last 10
-        if len(self.activity_log) > 10:
-            self.activity_log.pop(0)
-
-    def get_activity(self):
-        return self.activity_log[::-1] # Newest first
+        }
+        with self._lock:
+            self.activity_log.append(entry)
+        event_bus.publish("watcher.activity", **entry)
+        # The ring buffer only feeds the live view; history goes to SQLite
+        try:
+            self.orchestrator.db.record_processing_event(source, filename, kind, message or status, size)
+        except Exception as e:
+            logger.warning(f"Événement non enregistré pour {filename}: {e}")
+
+    def get_activity(self) -> List[Dict]:
+        with self._lock:
+            return list(reversed(self.activity_log))  # Newest first
+
+    def defer(self, file_path: Path, priority: str = WATCHER):
+        with self._lock:
+            self.deferred[str(file_path)] = (file_path, priority)
+        self.add_activity(
+            file_path.name, "⏸️ Reporté (budget tokens du jour atteint)", kind="deferred"
+        )
+
+    def resume_deferred(self) -> int:
+        """Process deferred files still in place if the budget allows. Returns how many were retried."""
+        if self.handler is None or self.budget.exhausted():
+            return 0
+        with self._lock:
+            pending = list(self.deferred.values())
+            self.deferred.clear()
+        retried = 0
+        for file_path, priority in pending:
+            if not file_path.exists():
+                continue
+            self.add_activity(file_path.name, "🔄 En cours (reprise)", kind="processing")
+            # Same class as before: a deferred archive scan must not jump ahead of live files
+            self.handler.process_file(file_path, priority=priority)  # re-defers if the budget runs out again
+            retried += 1
+        return retried
+
+    def _resume_loop(self):
+        while not self._stop.wait(self.recheck_seconds):
+            try:
+                self.resume_deferred()
+            except Exception as e:
+                logger.error(f"❌ Reprise des fichiers reportés impossible : {e}")
 
     def start(self):
         # Create watch directory if it doesn't exist
         os.makedirs(self.watch_path, exist_ok=True)
 
-        handler = InvoiceHandler(self.orchestrator, self.watch_path, self)
+        self.handler = InvoiceHandler(self.orchestrator, self.watch_path, self)
         # Enable recursive monitoring
-        self.observer.schedule(handler, self.watch_path, recursive=True)
+        self.observer.schedule(self.handler, self.watch_path, recursive=True)
         self.observer.start()
+        threading.Thread(target=self._resume_loop, name="watcher-resume", daemon=True).start()
         logger.info(f"🛡️ Chien de garde activé sur le dossier : {os.path.abspath(self.watch_path)}")
 
         # Initial scan
-        handler.scan_existing()
+        self.handler.scan_existing()
 
     def stop(self):
+        self._stop.set()
         self.observer.stop()
-        self.observer.join()
+        if self.observer.is_alive():
+            self.observer.join()
         logger.info("🛡️ Chien de garde arrêté")
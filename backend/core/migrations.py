@@ -0,0 +1,276 @@
+"""
+Versioned SQLite schema migrations, tracked with PRAGMA user_version.
+Existing data_cache.db files (user_version 0) are upgraded in place.
+Append new migrations at the end; never edit one that has shipped.
+"""
+import logging
+import sqlite3
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "Initial schema", [
+        """
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fournisseur TEXT NOT NULL,
+            designation_raw TEXT NOT NULL,
+            designation_fr TEXT,
+            famille TEXT,
+            unite TEXT,
+            prix_brut_ht REAL DEFAULT 0.0,
+            remise_pct REAL,
+            prix_remise_ht REAL DEFAULT 0.0,
+            prix_ttc_iva21 REAL DEFAULT 0.0,
+            numero_facture TEXT,
+            date_facture TEXT,
+            updated_at TIMESTAMP NOT NULL,
+            UNIQUE(designation_raw, fournisseur)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS invoices (
+            file_hash TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            fournisseur TEXT,
+            numero_facture TEXT,
+            date_facture TEXT,
+            nb_products INTEGER DEFAULT 0,
+            processed_at TIMESTAMP NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS import_files (
+            file_hash TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            status TEXT NOT NULL,
+            error TEXT,
+            updated_at TIMESTAMP NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS backfill_jobs (
+            job_name TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            updated_at TIMESTAMP NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS backfill_items (
+            file_hash TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            job_name TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending'
+        )
+        """,
+    ]),
+    (2, "Catalogue and invoice query indexes", [
+        # Catalogue order (famille, designation_fr) and famille filter; also
+        # covers COUNT(DISTINCT famille)
+        "CREATE INDEX IF NOT EXISTS idx_products_famille ON products(famille, designation_fr)",
+        # Fournisseur filter, already in catalogue order
+        "CREATE INDEX IF NOT EXISTS idx_products_fournisseur "
+        "ON products(fournisseur, famille, designation_fr)",
+        "CREATE INDEX IF NOT EXISTS idx_products_numero ON products(numero_facture)",
+        "CREATE INDEX IF NOT EXISTS idx_invoices_processed_at ON invoices(processed_at)",
+        "CREATE INDEX IF NOT EXISTS idx_invoices_numero ON invoices(numero_facture, processed_at)",
+        "CREATE INDEX IF NOT EXISTS idx_backfill_items_job ON backfill_items(job_name)",
+    ]),
+    (3, "Trigger-maintained catalogue counters", [
+        # dimension: 'products' / 'invoices' (value '') or 'famille' / 'fournisseur'
+        """
+        CREATE TABLE IF NOT EXISTS catalogue_stats (
+            dimension TEXT NOT NULL,
+            value TEXT NOT NULL DEFAULT '',
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, value)
+        ) WITHOUT ROWID
+        """,
+        "INSERT INTO catalogue_stats SELECT 'products', '', COUNT(*) FROM products",
+        "INSERT INTO catalogue_stats SELECT 'invoices', '', COUNT(*) FROM invoices",
+        "INSERT INTO catalogue_stats SELECT 'famille', COALESCE(famille, ''), COUNT(*) "
+        "FROM products GROUP BY COALESCE(famille, '')",
+        "INSERT INTO catalogue_stats SELECT 'fournisseur', fournisseur, COUNT(*) "
+        "FROM products GROUP BY fournisseur",
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_products_stats_insert AFTER INSERT ON products
+        BEGIN
+            UPDATE catalogue_stats SET count = count + 1
+                WHERE dimension = 'products' AND value = '';
+            INSERT INTO catalogue_stats VALUES ('famille', COALESCE(NEW.famille, ''), 1)
+                ON CONFLICT(dimension, value) DO UPDATE SET count = count + 1;
+            INSERT INTO catalogue_stats VALUES ('fournisseur', NEW.fournisseur, 1)
+                ON CONFLICT(dimension, value) DO UPDATE SET count = count + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_products_stats_delete AFTER DELETE ON products
+        BEGIN
+            UPDATE catalogue_stats SET count = count - 1
+                WHERE dimension = 'products' AND value = '';
+            UPDATE catalogue_stats SET count = count - 1
+                WHERE dimension = 'famille' AND value = COALESCE(OLD.famille, '');
+            UPDATE catalogue_stats SET count = count - 1
+                WHERE dimension = 'fournisseur' AND value = OLD.fournisseur;
+            DELETE FROM catalogue_stats
+                WHERE dimension IN ('famille', 'fournisseur') AND count <= 0;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_products_stats_update
+        AFTER UPDATE OF famille, fournisseur ON products
+        WHEN OLD.famille IS NOT NEW.famille OR OLD.fournisseur IS NOT NEW.fournisseur
+        BEGIN
+            UPDATE catalogue_stats SET count = count - 1
+                WHERE dimension = 'famille' AND value = COALESCE(OLD.famille, '');
+            UPDATE catalogue_stats SET count = count - 1
+                WHERE dimension = 'fournisseur' AND value = OLD.fournisseur;
+            INSERT INTO catalogue_stats VALUES ('famille', COALESCE(NEW.famille, ''), 1)
+                ON CONFLICT(dimension, value) DO UPDATE SET count = count + 1;
+            INSERT INTO catalogue_stats VALUES ('fournisseur', NEW.fournisseur, 1)
+                ON CONFLICT(dimension, value) DO UPDATE SET count = count + 1;
+            DELETE FROM catalogue_stats
+                WHERE dimension IN ('famille', 'fournisseur') AND count <= 0;
+        END
+        """,
+        # INSERT OR REPLACE would bypass the delete trigger: save_invoice upserts instead
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_invoices_stats_insert AFTER INSERT ON invoices
+        BEGIN
+            UPDATE catalogue_stats SET count = count + 1
+                WHERE dimension = 'invoices' AND value = '';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_invoices_stats_delete AFTER DELETE ON invoices
+        BEGIN
+            UPDATE catalogue_stats SET count = count - 1
+                WHERE dimension = 'invoices' AND value = '';
+        END
+        """,
+    ]),
+    (4, "Append-only processing event log", [
+        """
+        CREATE TABLE IF NOT EXISTS processing_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TIMESTAMP NOT NULL,
+            source TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            status TEXT NOT NULL,
+            message TEXT,
+            size TEXT
+        )
+        """,
+        # id is the cursor: each filter index ends with it so pages stay index-ordered
+        "CREATE INDEX IF NOT EXISTS idx_events_created_at ON processing_events(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_events_status ON processing_events(status, id)",
+        "CREATE INDEX IF NOT EXISTS idx_events_filename ON processing_events(filename, id)",
+    ]),
+    (5, "Gemini token usage per invoice and per day", [
+        "ALTER TABLE invoices ADD COLUMN model_calls INTEGER",
+        "ALTER TABLE invoices ADD COLUMN input_tokens INTEGER",
+        "ALTER TABLE invoices ADD COLUMN output_tokens INTEGER",
+        "ALTER TABLE invoices ADD COLUMN model_latency_ms REAL",
+        "CREATE INDEX IF NOT EXISTS idx_invoices_fournisseur ON invoices(fournisseur, processed_at)",
+        # Every call is booked here, including failed extractions that leave no invoice row
+        """
+        CREATE TABLE IF NOT EXISTS token_usage_daily (
+            day TEXT PRIMARY KEY,
+            calls INTEGER NOT NULL DEFAULT 0,
+            input_tokens INTEGER NOT NULL DEFAULT 0,
+            output_tokens INTEGER NOT NULL DEFAULT 0,
+            latency_ms REAL NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        """,
+    ]),
+    (6, "Model tier per invoice and usage per model", [
+        "ALTER TABLE invoices ADD COLUMN model TEXT",
+        "ALTER TABLE invoices ADD COLUMN escalated INTEGER",
+        "ALTER TABLE invoices ADD COLUMN cost_usd REAL",
+        """
+        CREATE TABLE IF NOT EXISTS token_usage_by_model (
+            day TEXT NOT NULL,
+            model TEXT NOT NULL,
+            calls INTEGER NOT NULL DEFAULT 0,
+            input_tokens INTEGER NOT NULL DEFAULT 0,
+            output_tokens INTEGER NOT NULL DEFAULT 0,
+            latency_ms REAL NOT NULL DEFAULT 0,
+            escalations INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, model)
+        ) WITHOUT ROWID
+        """,
+    ]),
+    (7, "Price history and anomaly review queue", [
+        # One row per applied price; the anomaly detector summarises it per product
+        """
+        CREATE TABLE IF NOT EXISTS price_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            prix_remise_ht REAL NOT NULL,
+            numero_facture TEXT,
+            date_facture TEXT,
+            recorded_at TIMESTAMP NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_price_history_product ON price_history(product_id, id)",
+        # Current catalogue prices are the first samples
+        """
+        INSERT INTO price_history (product_id, prix_remise_ht, numero_facture, date_facture, recorded_at)
+        SELECT id, prix_remise_ht, numero_facture, date_facture, updated_at
+        FROM products WHERE prix_remise_ht > 0
+        """,
+        # Lines held back by the detector, with the full product to apply on approval
+        """
+        CREATE TABLE IF NOT EXISTS price_reviews (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER,
+            fournisseur TEXT NOT NULL,
+            designation_raw TEXT NOT NULL,
+            famille TEXT,
+            unite TEXT,
+            product_json TEXT NOT NULL,
+            numero_facture TEXT,
+            date_facture TEXT,
+            current_price REAL,
+            proposed_price REAL NOT NULL,
+            expected_price REAL,
+            score REAL NOT NULL,
+            basis TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            created_at TIMESTAMP NOT NULL,
+            resolved_at TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_price_reviews_status ON price_reviews(status, id)",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply pending migrations, each in its own transaction. Returns the schema version."""
+    for version, description, statements in MIGRATIONS:
+        if version <= get_version(conn):
+            continue
+        # IMMEDIATE serializes concurrent starters; re-check once the lock is held
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= get_version(conn):
+                conn.rollback()
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info(f"Schema migrated to v{version}: {description}")
+    return get_version(conn)
@@ -40,9 +40,37 @@ class Metrics:
         "gemini_calls_success": 0,
         "gemini_calls_failed": 0,
         "gemini_rate_limited": 0,
+        # Schema-constrained vs prose-prompt output (see GEMINI_SCHEMA_MODE)
+        "gemini_schema_calls": 0,
+        "gemini_schema_failed": 0,
+        "gemini_schema_output_tokens": 0,
+        "gemini_prose_calls": 0,
+        "gemini_prose_failed": 0,
+        "gemini_prose_output_tokens": 0,
+        "gemini_json_repairs": 0,
+        "gemini_cache_refreshes": 0,
+        # Tail latency and endpoint health (see backend/services/resilience.py)
+        "gemini_hedges": 0,
+        "gemini_hedge_wins": 0,
+        "gemini_deadline_exceeded": 0,
+        "gemini_circuit_opened": 0,
+        "gemini_circuit_rejected": 0,
+        # Cheap-first routing (see backend/services/model_router.py)
+        "gemini_routed_fast": 0,
+        "gemini_routed_standard": 0,
+        "gemini_escalations": 0,
+        # Multi-document packing (see backend/core/packing.py)
+        "gemini_packed_requests": 0,
+        "gemini_packed_documents": 0,
+        "gemini_pack_fallbacks": 0,
         "invoices_processed": 0,
         "products_added": 0,
         "products_updated": 0,
+        "products_held": 0,
+        "stream_partial_invoices": 0,
+        "db_group_commits": 0,
+        "db_rows_written": 0,
+        "db_group_commit_retries": 0,
         "ocr_calls_total": 0,
         "avg_processing_time_ms": 0.0,
     }
@@ -1,16 +1,30 @@
 """
 Extraction pipeline orchestrator.
-Hash → Cache → Gemini → Validate → Upsert DB.
+Hash → Cache → Gemini → Validate → Price check → Upsert DB.
 """
+import contextvars
 import hashlib
 import logging
+import queue
+import threading
+from collections import Counter
 from pathlib import Path
-from typing import Optional, Callable
+from typing import List, Optional, Callable, Tuple
 
+from backend.core.anomaly import PriceAnomalyDetector
 from backend.core.config import AppConfig, get_config
 from backend.core.db_manager import DBManager
+from backend.core.db_writer import CatalogueWriter
+from backend.core.events import event_bus
+from backend.core.monitoring import Metrics
+from backend.core.packing import DocumentPacker
+from backend.core.profiling import profile
+from backend.core.scheduler import INTERACTIVE, ExtractionScheduler
+from backend.core.tracing import span
+from backend.core.usage import Usage, track_usage, usage_cost
 from backend.services.gemini_service import GeminiService
-from backend.schemas.invoice import ProcessingResult, InvoiceResult
+from backend.services.resilience import CircuitOpenError
+from backend.schemas.invoice import ProcessingResult, InvoiceResult, Product
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +37,17 @@ MIME_TYPES = {
     ".heic": "image/heic",
 }
 
+# Emit a progress status every N streamed products
+STREAM_STATUS_EVERY = 10
+
+
+def _status_reporter(on_status: Optional[Callable[[str], None]]) -> Callable[[str], None]:
+    def _status(msg: str):
+        logger.info(msg)
+        if on_status:
+            on_status(msg)
+    return _status
+
 
 class ExtractionOrchestrator:
     """Orchestrates the invoice extraction pipeline."""
@@ -31,27 +56,60 @@ class ExtractionOrchestrator:
         self.config = config or get_config()
         self.db = db_manager or DBManager(self.config.db_path)
         self.gemini = GeminiService(self.config)
+        self.writer = CatalogueWriter.for_db(self.db) if self.config.db_group_commit else None
+        self.scheduler = ExtractionScheduler.shared(self.config.extraction_slots)
+        self.packer = DocumentPacker.shared(
+            self.scheduler, self.config.gemini_pack_max_docs,
+            self.config.gemini_pack_max_wait_ms, self.config.gemini_pack_max_bytes,
+        ) if self.config.gemini_packing else None
+        self.anomalies = PriceAnomalyDetector.for_db(
+            self.db, self.config.anomaly_threshold
+        ) if self.config.anomaly_detection else None
 
     def process_file(
         self,
         file_bytes: bytes,
         filename: str,
         on_status: Optional[Callable[[str], None]] = None,
+        stream: Optional[bool] = None,
+        file_hash: Optional[str] = None,
+        priority: str = INTERACTIVE,
     ) -> ProcessingResult:
         """
         Full pipeline: hash → cache check → Gemini extract → upsert DB.
+        With stream=True (default: config.gemini_streaming) products are
+        upserted while Gemini is still generating the rest of the invoice.
+        Callers that already hashed the file can pass file_hash. `priority`
+        is the scheduler class (interactive, watcher or backfill).
         """
-        def _status(msg: str):
-            logger.info(msg)
-            if on_status:
-                on_status(msg)
+        with profile(self.config, f"process_file {filename}"), \
+                span("pipeline.process_file", filename=filename, bytes=len(file_bytes), priority=priority):
+            return self._process_file(file_bytes, filename, on_status, stream, file_hash, priority)
+
+    def _process_file(
+        self,
+        file_bytes: bytes,
+        filename: str,
+        on_status: Optional[Callable[[str], None]],
+        stream: Optional[bool],
+        file_hash: Optional[str],
+        priority: str,
+    ) -> ProcessingResult:
+        _status = _status_reporter(on_status)
 
         # 1. Hash
-        file_hash = DBManager.compute_file_hash(file_bytes)
+        if file_hash is None:
+            with span("pipeline.hash"):
+                file_hash = DBManager.compute_file_hash(file_bytes)
+        event_bus.publish("pipeline.received", filename=filename, file_hash=file_hash)
 
         # 2. Cache check
-        if self.db.is_invoice_processed(file_hash):
+        with span("pipeline.cache_check") as check:
+            cached = self.db.is_invoice_processed(file_hash)
+            check.set("hit", cached)
+        if cached:
             _status(f"⏩ {filename} — déjà traité")
+            event_bus.publish("pipeline.cached", filename=filename, file_hash=file_hash)
             return ProcessingResult(
                 invoice=InvoiceResult(), file_hash=file_hash, was_cached=True
             )
@@ -60,21 +118,173 @@ class ExtractionOrchestrator:
         suffix = Path(filename).suffix.lower()
         mime_type = MIME_TYPES.get(suffix, "application/pdf")
 
-        # 4. Gemini extraction
+        if stream is None:
+            stream = self.config.gemini_streaming
+
+        # 4-5. Gemini extraction + upsert products, once the scheduler admits this class
+        while True:
+            try:
+                if self.packer and self.packer.accepts(file_bytes, mime_type):
+                    packed = self._extract_packed(
+                        file_bytes, filename, file_hash, mime_type, priority, on_status
+                    )
+                    if packed is not None:
+                        return packed
+                with self.scheduler.slot(priority):
+                    return self._extract_and_record(
+                        file_bytes, filename, file_hash, mime_type, stream, on_status
+                    )
+            except CircuitOpenError:
+                if priority == INTERACTIVE:
+                    raise  # the user gets an immediate error rather than a hung request
+                # Background work is parked (without holding a slot) until the endpoint recovers
+                _status(f"⏸️ {filename} en attente : modèle indisponible")
+                self.gemini.breaker.wait_until_available()
+
+    def _extract_and_record(
+        self,
+        file_bytes: bytes,
+        filename: str,
+        file_hash: str,
+        mime_type: str,
+        stream: bool,
+        on_status: Optional[Callable[[str], None]],
+    ) -> ProcessingResult:
+        _status = _status_reporter(on_status)
         _status(f"🧠 Extraction IA de {filename}...")
-        result = self.gemini.extract_invoice(file_bytes, mime_type)
+        event_bus.publish("pipeline.extracting", filename=filename, file_hash=file_hash)
+        usage = Usage()
+        try:
+            if stream:
+                with span("pipeline.extract", mime_type=mime_type, stream=True) as extract, \
+                        track_usage() as usage:
+                    result, added, updated, held = self._extract_streaming(
+                        file_bytes, mime_type, filename, _status
+                    )
+                    extract.set("tokens", usage.total_tokens)
+                return self._record_invoice(
+                    file_hash, filename, result, added, updated, _status, usage, held
+                )
 
-        if not result or not result.products:
-            _status(f"⚠️ Aucun produit extrait de {filename}")
-            return ProcessingResult(
-                invoice=result or InvoiceResult(),
-                file_hash=file_hash,
-            )
+            with span("pipeline.extract", mime_type=mime_type, stream=False) as extract, \
+                    track_usage() as usage:
+                result = self.gemini.extract_invoice(file_bytes, mime_type)
+                extract.set("tokens", usage.total_tokens)
+            return self.ingest_result(file_hash, filename, result, on_status, usage)
+        except Exception as e:
+            event_bus.publish("pipeline.failed", filename=filename, file_hash=file_hash, error=str(e))
+            raise
+        finally:
+            # Failed extractions cost tokens too: book them against the daily budget
+            self.db.record_token_usage(usage)
 
-        # 5. Upsert products
-        added = 0
-        updated = 0
-        for product in result.products:
+    def _extract_packed(
+        self,
+        file_bytes: bytes,
+        filename: str,
+        file_hash: str,
+        mime_type: str,
+        priority: str,
+        on_status: Optional[Callable[[str], None]],
+    ) -> Optional[ProcessingResult]:
+        """
+        Extraction in a request shared with other small images (no streaming:
+        a receipt has a handful of lines). None when the file must go alone.
+        """
+        _status = _status_reporter(on_status)
+        _status(f"🧠 Extraction IA de {filename} (requête groupée)...")
+        event_bus.publish("pipeline.extracting", filename=filename, file_hash=file_hash)
+        ticket = self.packer.submit(file_bytes, mime_type, priority, self.gemini.extract_invoices)
+        try:
+            result = ticket.wait()
+        except Exception as e:
+            event_bus.publish("pipeline.failed", filename=filename, file_hash=file_hash, error=str(e))
+            raise
+        finally:
+            self.db.record_token_usage(ticket.usage)
+        if ticket.fallback:
+            return None
+        return self.ingest_result(file_hash, filename, result, on_status, ticket.usage)
+
+    def ingest_result(
+        self,
+        file_hash: str,
+        filename: str,
+        result: Optional[InvoiceResult],
+        on_status: Optional[Callable[[str], None]] = None,
+        usage: Optional[Usage] = None,
+    ) -> ProcessingResult:
+        """
+        Upsert the products of an already-extracted invoice and record it.
+        Shared by the interactive pipeline and the offline batch backfill.
+        """
+        added = updated = held = 0
+        if result and result.products:
+            added, updated, held = self._upsert(result)
+        return self._record_invoice(
+            file_hash, filename, result, added, updated, _status_reporter(on_status), usage, held
+        )
+
+    def _upsert(self, result: InvoiceResult) -> Tuple[int, int, int]:
+        """Price-check then upsert the products of an invoice. Returns (added, updated, held)."""
+        accepted = self._screen(result.products, result.numero_facture, result.date_facture)
+        with span("pipeline.upsert", products=len(accepted), group_commit=bool(self.writer)):
+            added, updated = self._upsert_products(accepted, result)
+        return added, updated, len(result.products) - len(accepted)
+
+    def _screen(self, products: List[Product], numero_facture: str, date_facture: str) -> List[Product]:
+        """
+        Anomaly stage: hold lines whose price is far off the product's usual
+        price for review (price_reviews). Returns the lines to apply.
+        """
+        if not self.anomalies or not products:
+            return products
+        try:
+            with span("pipeline.anomaly_check", lines=len(products)) as check:
+                suspects = self.anomalies.screen(products)
+                check.set("held", len(suspects))
+            if suspects:
+                self.db.hold_price_reviews([
+                    {
+                        "product_id": s.product_id,
+                        "fournisseur": products[s.index].fournisseur,
+                        "designation_raw": products[s.index].designation_raw,
+                        "famille": products[s.index].famille,
+                        "unite": products[s.index].unite,
+                        "product_json": products[s.index].model_dump_json(),
+                        "numero_facture": numero_facture,
+                        "date_facture": date_facture,
+                        "current_price": s.current_price,
+                        "proposed_price": products[s.index].prix_remise_ht,
+                        "expected_price": s.expected_price,
+                        "score": s.score,
+                        "basis": s.basis,
+                    }
+                    for s in suspects
+                ])
+        except Exception as e:
+            # The check must never block ingestion: apply everything, as before it existed
+            logger.warning(f"Contrôle des prix indisponible, lignes appliquées telles quelles : {e}")
+            return products
+        if not suspects:
+            return products
+        Metrics.increment("products_held", len(suspects))
+        logger.warning(
+            f"🚩 {len(suspects)} prix suspect(s) mis en attente de validation (facture {numero_facture})"
+        )
+        held = {s.index for s in suspects}
+        return [p for i, p in enumerate(products) if i not in held]
+
+    def _upsert_products(self, products: List[Product], result: InvoiceResult) -> Tuple[int, int]:
+        if not products:
+            return 0, 0
+        if self.writer:
+            return self.writer.submit(
+                products, result.numero_facture, result.date_facture
+            ).result()
+
+        added = updated = 0
+        for product in products:
             action = self.db.upsert_product(
                 product, result.numero_facture, result.date_facture
             )
@@ -82,21 +292,195 @@ class ExtractionOrchestrator:
                 added += 1
             else:
                 updated += 1
+        return added, updated
+
+    def _record_invoice(
+        self,
+        file_hash: str,
+        filename: str,
+        result: Optional[InvoiceResult],
+        added: int,
+        updated: int,
+        _status: Callable[[str], None],
+        usage: Optional[Usage] = None,
+        held: int = 0,
+    ) -> ProcessingResult:
+        if not result or not result.products:
+            _status(f"⚠️ Aucun produit extrait de {filename}")
+            event_bus.publish("pipeline.empty", filename=filename, file_hash=file_hash)
+            return ProcessingResult(
+                invoice=result or InvoiceResult(),
+                file_hash=file_hash,
+                products_added=added,
+                products_updated=updated,
+            )
 
         # 6. Save invoice record
-        self.db.save_invoice(
-            file_hash, filename, result.fournisseur,
-            result.numero_facture, result.date_facture, len(result.products),
-        )
+        with span("pipeline.save_invoice"):
+            self.db.save_invoice(
+                file_hash, filename, result.fournisseur,
+                result.numero_facture, result.date_facture, len(result.products),
+                usage=usage, cost_usd=usage_cost(usage, self.config) if usage else None,
+            )
 
+        held_note = f", {held} en attente de validation" if held else ""
         _status(
-            f"✅ {filename}: {added} nouveaux, {updated} mis à jour "
+            f"✅ {filename}: {added} nouveaux, {updated} mis à jour{held_note} "
             f"(facture {result.numero_facture})"
         )
+        event_bus.publish(
+            "pipeline.done", filename=filename, file_hash=file_hash,
+            invoice_number=result.numero_facture, supplier=result.fournisseur,
+            products_added=added, products_updated=updated, products_held=held,
+        )
 
         return ProcessingResult(
             invoice=result,
             file_hash=file_hash,
             products_added=added,
             products_updated=updated,
+            products_held=held,
+        )
+
+    def _extract_streaming(
+        self,
+        file_bytes: bytes,
+        mime_type: str,
+        filename: str,
+        _status: Callable[[str], None],
+    ) -> Tuple[Optional[InvoiceResult], int, int, int]:
+        """
+        Stream the extraction and upsert each product from a writer thread,
+        so DB writes overlap with generation. Lines are price-checked one by
+        one as they arrive. Returns (result, added, updated, held); if the
+        stream breaks after some lines, result holds those lines (see _partial).
+        """
+        if self.writer:
+            return self._extract_streaming_grouped(file_bytes, mime_type, filename, _status)
+
+        pending: "queue.Queue[Optional[Tuple[Product, InvoiceResult]]]" = queue.Queue()
+        counts = {"added": 0, "updated": 0, "held": 0}
+        received: List[Tuple[Product, InvoiceResult]] = []
+        errors = []
+
+        def _writer():
+            while True:
+                item = pending.get()
+                if item is None:
+                    return
+                if errors:
+                    continue
+                product, header = item
+                try:
+                    if not self._screen([product], header.numero_facture, header.date_facture):
+                        counts["held"] += 1
+                        continue
+                    action = self.db.upsert_product(
+                        product, header.numero_facture, header.date_facture
+                    )
+                    counts["added" if action == "added" else "updated"] += 1
+                except Exception as e:
+                    errors.append(e)
+
+        def _on_product(product: Product, header: InvoiceResult):
+            pending.put((product, header))
+            received.append((product, header))
+            if len(received) % STREAM_STATUS_EVERY == 0:
+                _status(f"📦 {filename}: {len(received)} produits reçus...")
+
+        # Run in a copy of this context so its DB spans join the current trace
+        writer = threading.Thread(
+            target=contextvars.copy_context().run, args=(_writer,), name="stream-upsert", daemon=True
         )
+        writer.start()
+        try:
+            result = self.gemini.extract_invoice_stream(
+                file_bytes, mime_type, on_product=_on_product
+            )
+        finally:
+            pending.put(None)
+            writer.join()
+
+        if errors:
+            raise errors[0]
+        return self._finish_stream(
+            result, received, filename, counts["added"], counts["updated"], counts["held"]
+        )
+
+    def _extract_streaming_grouped(
+        self,
+        file_bytes: bytes,
+        mime_type: str,
+        filename: str,
+        _status: Callable[[str], None],
+    ) -> Tuple[Optional[InvoiceResult], int, int, int]:
+        """Streaming through the shared group-commit writer."""
+        futures = []
+        received: List[Tuple[Product, InvoiceResult]] = []
+
+        def _on_product(product: Product, header: InvoiceResult):
+            received.append((product, header))
+            accepted = self._screen([product], header.numero_facture, header.date_facture)
+            futures.append(
+                self.writer.submit(accepted, header.numero_facture, header.date_facture)
+            )
+            if len(futures) % STREAM_STATUS_EVERY == 0:
+                _status(f"📦 {filename}: {len(futures)} produits reçus...")
+
+        result = self.gemini.extract_invoice_stream(
+            file_bytes, mime_type, on_product=_on_product
+        )
+        added = updated = 0
+        for future in futures:
+            a, u = future.result()
+            added += a
+            updated += u
+        return self._finish_stream(result, received, filename, added, updated, len(futures) - added - updated)
+
+    def _finish_stream(
+        self,
+        result: Optional[InvoiceResult],
+        received: List[Tuple[Product, InvoiceResult]],
+        filename: str,
+        added: int,
+        updated: int,
+        held: int,
+    ) -> Tuple[Optional[InvoiceResult], int, int, int]:
+        """
+        Reconcile the streamed lines with the final result. Lines that failed
+        validation while streaming can come back repaired in result.products:
+        they were never emitted, so they are screened and upserted now.
+        """
+        result = self._partial(result, received, filename)
+        if result is None:
+            return result, added, updated, held
+        emitted = Counter(product.model_dump_json() for product, _ in received)
+        late = []
+        for product in result.products:
+            key = product.model_dump_json()
+            if emitted[key]:
+                emitted[key] -= 1
+            else:
+                late.append(product)
+        if late:
+            logger.info(f"🩹 {filename}: {len(late)} lignes réparées intégrées après le flux")
+            a, u, h = self._upsert(result.model_copy(update={"products": late}))
+            added, updated, held = added + a, updated + u, held + h
+        return result, added, updated, held
+
+    @staticmethod
+    def _partial(
+        result: Optional[InvoiceResult],
+        received: List[Tuple[Product, InvoiceResult]],
+        filename: str,
+    ) -> Optional[InvoiceResult]:
+        """
+        A stream that breaks after some lines gives no result, yet those lines
+        are already in the catalogue: record the invoice with the streamed
+        header and the lines received, so it is not left half-applied.
+        """
+        if result is not None or not received:
+            return result
+        logger.warning(f"⚠️ {filename}: extraction interrompue, {len(received)} produits conservés")
+        Metrics.increment("stream_partial_invoices")
+        return received[0][1].model_copy(update={"products": [product for product, _ in received]})
@@ -0,0 +1,145 @@
+"""
+Multi-document packing for small images (opt-in, GEMINI_PACKING).
+Phone photos and till receipts that arrive within GEMINI_PACK_MAX_WAIT_MS of
+each other share one model request: one prompt, several document parts, an
+array of results. The first file of a pack leads it: it waits for companions
+(at most the window, or until the pack is full), takes one extraction slot at
+the best priority of its members and makes the call; the others wait on
+their ticket.
+"""
+import logging
+import threading
+from typing import Callable, List, Optional, Tuple
+
+from backend.core.monitoring import Metrics
+from backend.core.scheduler import PRIORITY_CLASSES, ExtractionScheduler
+from backend.core.tracing import span
+from backend.core.usage import Usage, track_usage
+from backend.schemas.invoice import InvoiceResult
+
+logger = logging.getLogger(__name__)
+
+ExtractMany = Callable[[List[Tuple[bytes, str]]], Optional[List[Optional[InvoiceResult]]]]
+
+
+class PackTicket:
+    """
+    One file's place in a pack. `usage` is its share of the request. With
+    `fallback` set the file was not extracted and must go on its own (alone
+    in its window, or an answer that could not be split back).
+    """
+    __slots__ = ("file_bytes", "mime_type", "priority", "result", "error", "fallback", "usage", "_done")
+
+    def __init__(self, file_bytes: bytes, mime_type: str, priority: str):
+        self.file_bytes = file_bytes
+        self.mime_type = mime_type
+        self.priority = priority
+        self.result: Optional[InvoiceResult] = None
+        self.error: Optional[BaseException] = None
+        self.fallback = False
+        self.usage = Usage()
+        self._done = threading.Event()
+
+    def wait(self) -> Optional[InvoiceResult]:
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class _Pack:
+    def __init__(self):
+        self.tickets: List[PackTicket] = []
+        self.full = threading.Event()
+
+
+class DocumentPacker:
+    """Gathers small images into shared multi-document requests."""
+
+    _shared: Optional["DocumentPacker"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        scheduler: ExtractionScheduler,
+        max_docs: int = 8,
+        max_wait_ms: float = 250.0,
+        max_bytes: int = 512 * 1024,
+    ):
+        self.scheduler = scheduler
+        self.max_docs = max_docs
+        self.max_wait = max_wait_ms / 1000
+        self.max_bytes = max_bytes
+        self._open: Optional[_Pack] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, scheduler: ExtractionScheduler, max_docs: int, max_wait_ms: float,
+               max_bytes: int) -> "DocumentPacker":
+        """Process-wide packer: uploads handled by different orchestrators can share a request."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(scheduler, max_docs, max_wait_ms, max_bytes)
+            return cls._shared
+
+    def accepts(self, file_bytes: bytes, mime_type: str) -> bool:
+        return mime_type.startswith("image/") and len(file_bytes) <= self.max_bytes
+
+    def submit(self, file_bytes: bytes, mime_type: str, priority: str, extract_many: ExtractMany) -> PackTicket:
+        """
+        Join the open pack, or open one and lead it. The leader's call blocks
+        until the pack is extracted (with its `extract_many`); followers return
+        at once. Either way, `ticket.wait()` gives the result.
+        """
+        ticket = PackTicket(file_bytes, mime_type, priority)
+        with self._lock:
+            pack = self._open
+            leader = pack is None
+            if leader:
+                pack = self._open = _Pack()
+            pack.tickets.append(ticket)
+            if len(pack.tickets) >= self.max_docs:
+                self._open = None
+                pack.full.set()
+        if leader:
+            self._lead(pack, extract_many)
+        return ticket
+
+    def _lead(self, pack: _Pack, extract_many: ExtractMany):
+        with span("packer.wait") as wait:
+            pack.full.wait(self.max_wait)
+            with self._lock:
+                if self._open is pack:
+                    self._open = None
+            tickets = pack.tickets  # closed: nobody joins any more
+            wait.set("documents", len(tickets))
+
+        if len(tickets) == 1:
+            tickets[0].fallback = True
+            tickets[0]._done.set()
+            return
+
+        priority = min((t.priority for t in tickets), key=PRIORITY_CLASSES.index)
+        usage, results, error = Usage(), None, None
+        try:
+            with self.scheduler.slot(priority), span("gemini.pack", documents=len(tickets)), \
+                    track_usage() as usage:
+                results = extract_many([(t.file_bytes, t.mime_type) for t in tickets])
+        except Exception as e:
+            error = e
+
+        Metrics.increment("gemini_packed_requests")
+        Metrics.increment("gemini_packed_documents", len(tickets))
+        if error is None and results is None:
+            Metrics.increment("gemini_pack_fallbacks")
+            logger.warning(f"📦 Requête groupée de {len(tickets)} documents inexploitable, envoi un par un")
+        for i, (ticket, share) in enumerate(zip(tickets, usage.split(len(tickets)), strict=True)):
+            ticket.usage = share
+            if error is not None:
+                ticket.error = error
+            elif results is None or results[i] is None:
+                # A document the model could not answer for goes on its own
+                ticket.fallback = True
+            else:
+                ticket.result = results[i]
+            ticket._done.set()
@@ -0,0 +1,185 @@
+"""
+On-demand statistical profiling of API requests and pipeline runs.
+A sampler thread snapshots every thread's stack at a fixed interval and
+writes collapsed stacks (flamegraph.pl / speedscope format) under the
+profiles directory. Nothing runs unless PROFILING_ENABLED is set.
+"""
+import contextvars
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from backend.core.config import AppConfig
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SUFFIX = ".folded"
+PROFILE_HEADER = "x-profile"
+MAX_CONCURRENT_PROFILES = 2
+MAX_STORED_PROFILES = 200
+_NAME_RE = re.compile(r"^[\w.-]+\.folded$")
+_SLUG_RE = re.compile(r"[^\w.-]+")
+
+_slots = threading.BoundedSemaphore(MAX_CONCURRENT_PROFILES)
+# Set while a profile covers the current request/run, so nested hooks don't start another
+_active: contextvars.ContextVar[Optional["SamplingProfiler"]] = contextvars.ContextVar(
+    "active_profile", default=None
+)
+
+
+class SamplingProfiler:
+    """Samples all threads' stacks with sys._current_frames; one root per thread name."""
+
+    def __init__(self, label: str, interval: float = 0.005):
+        self.label = label
+        self.interval = interval
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.name = f"{stamp}-{_SLUG_RE.sub('_', label)[:60]}-{uuid.uuid4().hex[:6]}{PROFILE_SUFFIX}"
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self.started = 0.0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self) -> "SamplingProfiler":
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                thread_name = names.get(ident, str(ident))
+                if thread_name == "profiler":
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(thread_name)
+                self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def save(self, directory: str) -> Path:
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        target = path / self.name
+        target.write_text(self.folded(), encoding="utf-8")
+        _prune(path)
+        return target
+
+
+@contextmanager
+def _profiling(config: AppConfig, label: str) -> Iterator[Optional[SamplingProfiler]]:
+    if not _slots.acquire(blocking=False):
+        logger.warning(f"Profilage ignoré pour {label} : {MAX_CONCURRENT_PROFILES} déjà en cours")
+        yield None
+        return
+    profiler = SamplingProfiler(label, config.profile_interval_ms / 1000).start()
+    token = _active.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _active.reset(token)
+        profiler.stop()
+        _slots.release()
+        try:
+            path = profiler.save(config.profiles_dir)
+            logger.info(
+                f"🔬 Profil {label} : {profiler.duration * 1000:.0f} ms, "
+                f"{profiler.sample_count} échantillons → {path}"
+            )
+        except OSError as e:
+            logger.error(f"Profil {label} non enregistré : {e}")
+
+
+def profile(config: AppConfig, label: str, requested: bool = False):
+    """
+    Context manager profiling the enclosed block when profiling is enabled and
+    either requested (header) or PROFILE_PIPELINE is on. Yields the profiler or
+    None; a block already covered by an outer profile is not profiled twice.
+    """
+    if not config.profiling_enabled or _active.get() is not None:
+        return nullcontext(None)
+    if not (requested or config.profile_pipeline):
+        return nullcontext(None)
+    return _profiling(config, label)
+
+
+def _prune(directory: Path):
+    profiles = sorted(directory.glob(f"*{PROFILE_SUFFIX}"), key=lambda p: p.stat().st_mtime)
+    for old in profiles[:-MAX_STORED_PROFILES]:
+        old.unlink(missing_ok=True)
+
+
+def list_profiles(directory: str) -> List[Dict]:
+    """Stored profiles, newest first."""
+    path = Path(directory)
+    if not path.is_dir():
+        return []
+    profiles = []
+    for entry in path.glob(f"*{PROFILE_SUFFIX}"):
+        stat = entry.stat()
+        profiles.append({
+            "name": entry.name,
+            "size": stat.st_size,
+            "created_at": datetime.fromtimestamp(stat.st_mtime).isoformat(timespec="seconds"),
+        })
+    return sorted(profiles, key=lambda p: p["created_at"], reverse=True)
+
+
+def profile_path(directory: str, name: str) -> Optional[Path]:
+    """Path of a stored profile, or None (also for anything that isn't a bare profile name)."""
+    if not _NAME_RE.match(name):
+        return None
+    path = Path(directory) / name
+    return path if path.is_file() else None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling requests sent with `X-Profile: 1` (when enabled)."""
+
+    def __init__(self, app, config: AppConfig):
+        self.app = app
+        self.config = config
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.config.profiling_enabled:
+            return await self.app(scope, receive, send)
+        requested = any(
+            key == PROFILE_HEADER.encode() and value not in (b"", b"0")
+            for key, value in scope.get("headers", [])
+        )
+        if not requested:
+            return await self.app(scope, receive, send)
+
+        with profile(self.config, f"{scope['method']} {scope['path']}", requested=True) as profiler:
+            async def send_with_id(message):
+                if profiler and message["type"] == "http.response.start":
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"x-profile-id", profiler.name.encode())
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_with_id)
@@ -0,0 +1,145 @@
+"""
+Process-wide admission control for model extractions.
+Interactive uploads, watcher ingestion and backfill share a fixed number of
+extraction slots. Free slots go to the waiting class with the lowest virtual
+time (stride scheduling): interactive work is served first, but watcher and
+backfill still get their weighted share, so none of them starves. A running
+extraction is never interrupted: preemption happens at queue boundaries.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional
+
+from backend.core.tracing import span
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_CLASSES = ("interactive", "watcher", "backfill")
+INTERACTIVE, WATCHER, BACKFILL = PRIORITY_CLASSES
+# Share of freed slots when every class has work waiting (16:4:1)
+DEFAULT_WEIGHTS = {INTERACTIVE: 16, WATCHER: 4, BACKFILL: 1}
+WAIT_SAMPLES = 200
+
+
+class _Ticket:
+    __slots__ = ("enqueued", "granted")
+
+    def __init__(self):
+        self.enqueued = time.perf_counter()
+        self.granted = False
+
+
+class _PriorityClass:
+    def __init__(self, name: str, weight: int):
+        self.name = name
+        self.weight = weight
+        self.queue: Deque[_Ticket] = deque()
+        self.vtime = 0.0
+        self.running = 0
+        self.admitted = 0
+        self.waits_ms: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+
+
+class ExtractionScheduler:
+    """Weighted fair queueing of extractions over `slots` concurrent model calls."""
+
+    _shared: Optional["ExtractionScheduler"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, slots: int, weights: Optional[Dict[str, int]] = None):
+        if slots < 1:
+            raise ValueError("slots must be >= 1")
+        weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        self.slots = slots
+        self._free = slots
+        self._classes = {name: _PriorityClass(name, weights[name]) for name in PRIORITY_CLASSES}
+        self._vtime = 0.0
+        self._cond = threading.Condition()
+
+    @classmethod
+    def shared(cls, slots: int) -> "ExtractionScheduler":
+        """Process-wide scheduler: every orchestrator shares the same Gemini quota."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(slots)
+            return cls._shared
+
+    @contextmanager
+    def slot(self, priority: str = INTERACTIVE) -> Iterator[None]:
+        """Hold one extraction slot for the block, waiting behind higher-priority work."""
+        if priority not in self._classes:
+            raise ValueError(f"Unknown priority class: {priority}")
+        with span("scheduler.wait", priority=priority) as wait:
+            waited_ms = self._acquire(self._classes[priority])
+            wait.set("wait_ms", round(waited_ms, 1))
+        try:
+            yield
+        finally:
+            self._release(self._classes[priority])
+
+    def _acquire(self, klass: _PriorityClass) -> float:
+        ticket = _Ticket()
+        with self._cond:
+            if not klass.queue:
+                # A class returning from idle does not get credit for the time it was away
+                klass.vtime = max(klass.vtime, self._vtime)
+            klass.queue.append(ticket)
+            self._dispatch()
+            try:
+                while not ticket.granted:
+                    self._cond.wait()
+            except BaseException:
+                if ticket.granted:
+                    self._release_locked(klass)
+                else:
+                    klass.queue.remove(ticket)
+                raise
+        return (time.perf_counter() - ticket.enqueued) * 1000
+
+    def _release(self, klass: _PriorityClass):
+        with self._cond:
+            self._release_locked(klass)
+
+    def _release_locked(self, klass: _PriorityClass):
+        klass.running -= 1
+        self._free += 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Hand free slots to waiting tickets. Caller holds the condition."""
+        granted = False
+        while self._free:
+            waiting = [k for k in self._classes.values() if k.queue]
+            if not waiting:
+                break
+            # min() keeps PRIORITY_CLASSES order on ties: interactive wins
+            klass = min(waiting, key=lambda k: k.vtime)
+            ticket = klass.queue.popleft()
+            ticket.granted = True
+            self._vtime = klass.vtime
+            klass.vtime += 1 / klass.weight
+            klass.running += 1
+            klass.admitted += 1
+            klass.waits_ms.append((time.perf_counter() - ticket.enqueued) * 1000)
+            self._free -= 1
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Dict]:
+        """Queue depth, running count and wait times (recent samples) per class."""
+        with self._cond:
+            out = {}
+            for name, klass in self._classes.items():
+                waits = sorted(klass.waits_ms)
+                out[name] = {
+                    "queued": len(klass.queue),
+                    "running": klass.running,
+                    "admitted": klass.admitted,
+                    "avg_wait_ms": round(sum(waits) / len(waits), 1) if waits else 0.0,
+                    "p95_wait_ms": round(waits[int(0.95 * (len(waits) - 1))], 1) if waits else 0.0,
+                }
+            return out
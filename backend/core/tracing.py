@@ -0,0 +1,268 @@
+"""
+Lightweight tracing across client, API, pipeline, Gemini and SQLite.
+Spans follow the OpenTelemetry data model (trace/span ids, parent, W3C
+`traceparent` propagation) and are exported one JSON line per span to a
+file, or to the log. Off unless TRACING_ENABLED is set.
+
+Break a trace down after the fact:
+    python -m backend.core.tracing traces.jsonl --slowest 5
+    python -m backend.core.tracing traces.jsonl --trace <trace_id>
+"""
+import argparse
+import contextvars
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from backend.core.config import AppConfig
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_HEADER = "traceparent"
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start", "_t0",
+                 "duration_ms", "status", "_token")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self.duration_ms = 0.0
+        self.status = "ok"
+        self._token = None
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration_ms = round((time.perf_counter() - self._t0) * 1000, 3)
+        if exc_type is not None:
+            self.status = "error"
+            self.attributes["error"] = f"{exc_type.__name__}: {exc}"
+        _current.reset(self._token)
+        _tracer.export(self)
+        return False
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Returned when tracing is off: same interface, no work."""
+    traceparent = None
+
+    def set(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class JsonlExporter:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class ConsoleExporter:
+    def export(self, span: Span):
+        logger.info(
+            f"🧵 {span.name} {span.duration_ms:.1f}ms trace={span.trace_id[:8]} "
+            f"span={span.span_id} parent={span.parent_id} {span.attributes}"
+        )
+
+
+class _Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.exporter = None
+
+    def configure(self, config: AppConfig):
+        self.enabled = config.tracing_enabled
+        if not self.enabled:
+            self.exporter = None
+        elif config.trace_exporter == "console":
+            self.exporter = ConsoleExporter()
+        else:
+            self.exporter = JsonlExporter(config.trace_file)
+
+    def export(self, span: Span):
+        exporter = self.exporter
+        if exporter is None:
+            return
+        try:
+            exporter.export(span)
+        except Exception as e:  # tracing must never break the traced code
+            logger.warning(f"Span {span.name} non exporté : {e}")
+
+
+_tracer = _Tracer()
+
+
+def configure(config: AppConfig):
+    """Enable/disable tracing process-wide from TRACING_ENABLED / TRACE_EXPORTER / TRACE_FILE."""
+    _tracer.configure(config)
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str]]:
+    """(trace_id, parent span_id) from a W3C traceparent header, or None."""
+    match = _TRACEPARENT_RE.match((header or "").strip().lower())
+    return (match.group(1), match.group(2)) if match else None
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def span(name: str, parent=None, **attributes):
+    """
+    Child span of the current one (or of `parent`: a Span, or a
+    (trace_id, span_id) tuple from parse_traceparent). Starts a new trace
+    when there is neither. Use as a context manager.
+    """
+    if not _tracer.enabled:
+        return _NOOP
+    if parent is None:
+        parent = _current.get()
+    if isinstance(parent, Span):
+        return Span(name, parent.trace_id, parent.span_id, attributes)
+    if parent:
+        return Span(name, parent[0], parent[1], attributes)
+    return Span(name, secrets.token_hex(16), None, attributes)
+
+
+def inject(headers: Optional[Dict] = None) -> Dict:
+    """Add the current traceparent to outgoing HTTP headers."""
+    headers = dict(headers or {})
+    active = _current.get()
+    if active is not None:
+        headers[TRACEPARENT_HEADER] = active.traceparent
+    return headers
+
+
+class TracingMiddleware:
+    """ASGI middleware: one server span per HTTP request, continuing the caller's trace."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _tracer.enabled:
+            return await self.app(scope, receive, send)
+        remote = None
+        for key, value in scope.get("headers", []):
+            if key == TRACEPARENT_HEADER.encode():
+                remote = parse_traceparent(value.decode("latin-1"))
+                break
+
+        with span(f"{scope['method']} {scope['path']}", parent=remote, kind="server") as server:
+            async def send_with_status(message):
+                if message["type"] == "http.response.start":
+                    server.set("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        server.status = "error"
+                await send(message)
+
+            await self.app(scope, receive, send_with_status)
+
+
+# ── Offline breakdown ──────────────────────────────────────
+def load_traces(path: str) -> Dict[str, List[Dict]]:
+    traces: Dict[str, List[Dict]] = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                traces[record["trace_id"]].append(record)
+    return traces
+
+
+def format_trace(spans: List[Dict]) -> str:
+    """Indented span tree with durations and offsets from the trace start."""
+    children: Dict[Optional[str], List[Dict]] = defaultdict(list)
+    ids = {s["span_id"] for s in spans}
+    for s in spans:
+        children[s["parent_id"] if s["parent_id"] in ids else None].append(s)
+    t0 = min(s["start"] for s in spans)
+    lines = []
+
+    def walk(parent: Optional[str], depth: int):
+        for s in sorted(children[parent], key=lambda s: s["start"]):
+            attrs = " ".join(f"{k}={v}" for k, v in s["attributes"].items())
+            flag = " ❌" if s["status"] == "error" else ""
+            lines.append(
+                f"{(s['start'] - t0) * 1000:>9.1f}ms {'  ' * depth}{s['name']} "
+                f"{s['duration_ms']:.1f}ms{flag} {attrs}".rstrip()
+            )
+            walk(s["span_id"], depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", help="JSONL written by TRACE_EXPORTER=file")
+    parser.add_argument("--trace", help="Show this trace id")
+    parser.add_argument("--slowest", type=int, default=5, help="Show the N slowest traces")
+    args = parser.parse_args(argv)
+
+    traces = load_traces(args.file)
+    if args.trace:
+        selected = [args.trace]
+    else:
+        def total(spans):
+            return max(s["start"] * 1000 + s["duration_ms"] for s in spans) - min(s["start"] for s in spans) * 1000
+        selected = sorted(traces, key=lambda t: total(traces[t]), reverse=True)[:args.slowest]
+    for trace_id in selected:
+        print(f"── trace {trace_id}")
+        print(format_trace(traces.get(trace_id, [])))
+
+
+if __name__ == "__main__":
+    main()
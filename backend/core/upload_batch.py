@@ -0,0 +1,171 @@
+"""
+Server-side fan-out of an uploaded invoice bundle (multipart files and/or zip).
+Uploads are spooled to a job directory first, so the request returns as soon
+as the bytes are on disk; extraction then runs in the background with a
+bounded number of files in flight.
+"""
+import logging
+import shutil
+import tempfile
+import threading
+import uuid
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional
+
+from backend.core.events import event_bus
+from backend.core.monitoring import Metrics
+from backend.core.orchestrator import ExtractionOrchestrator, MIME_TYPES
+from backend.core.scheduler import WATCHER
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+MAX_BATCH_FILES = 500
+COPY_CHUNK = 1024 * 1024
+
+
+class BatchRejectedError(ValueError):
+    """The bundle cannot be accepted (unreadable zip, too many files)."""
+
+
+class UploadBatch:
+    """One uploaded bundle: spooled files plus per-file outcomes."""
+
+    def __init__(self, max_file_size: int, root: Optional[str] = None):
+        self.job_id = uuid.uuid4().hex
+        self.max_file_size = max_file_size
+        self.workdir = Path(tempfile.mkdtemp(prefix=f"docling-batch-{self.job_id[:8]}-", dir=root))
+        self.files: List[Path] = []
+        self.results: List[Dict] = []  # one entry per uploaded file, spooled or rejected
+        self.state = "receiving"
+        self.created_at = datetime.now().isoformat()
+        self.finished_at: Optional[str] = None
+        self._lock = threading.Lock()
+
+    # ── Spooling ───────────────────────────────────────────
+    def add_upload(self, filename: str, fileobj: BinaryIO):
+        """Spool one multipart part; zip archives are expanded into their invoices."""
+        if Path(filename).suffix.lower() == ".zip":
+            self._add_zip(fileobj)
+        elif Path(filename).suffix.lower() in MIME_TYPES:
+            self._spool(filename, fileobj)
+        else:
+            self._reject(filename, "Unsupported file type")
+
+    def _add_zip(self, fileobj: BinaryIO):
+        try:
+            archive = zipfile.ZipFile(fileobj)
+        except zipfile.BadZipFile as e:
+            raise BatchRejectedError("Invalid zip archive") from e
+        with archive:
+            for member in archive.infolist():
+                name = Path(member.filename).name  # flatten: no path traversal out of workdir
+                if member.is_dir() or not name or Path(name).suffix.lower() not in MIME_TYPES:
+                    continue
+                if member.file_size > self.max_file_size:
+                    self._reject(name, "File too large")
+                    continue
+                with archive.open(member) as src:
+                    self._spool(name, src)
+
+    def _spool(self, filename: str, src: BinaryIO):
+        if len(self.files) >= MAX_BATCH_FILES:
+            raise BatchRejectedError(f"At most {MAX_BATCH_FILES} files per batch")
+        # Prefixed with its result index: same-named files from different folders stay apart
+        dest = self.workdir / f"{len(self.results):04d}_{Path(filename).name}"
+        size = 0
+        with open(dest, "wb") as out:
+            while chunk := src.read(COPY_CHUNK):
+                size += len(chunk)
+                if size > self.max_file_size:
+                    break
+                out.write(chunk)
+        if size > self.max_file_size:
+            dest.unlink()
+            self._reject(filename, "File too large")
+            return
+        self.files.append(dest)
+        self.results.append({"filename": Path(filename).name, "status": "queued"})
+
+    def _reject(self, filename: str, error: str):
+        self.results.append({"filename": Path(filename).name, "status": "rejected", "error": error})
+
+    # ── Processing ─────────────────────────────────────────
+    def run(self, orchestrator: ExtractionOrchestrator, workers: int = DEFAULT_WORKERS):
+        """Process the spooled files, at most `workers` read into memory at a time."""
+        self.state = "running"
+        pending = iter(self.files)
+        in_flight = {}
+        try:
+            with ThreadPoolExecutor(workers, thread_name_prefix="upload-batch") as pool:
+                while True:
+                    for path in pending:
+                        in_flight[pool.submit(self._process_one, orchestrator, path)] = path
+                        if len(in_flight) >= workers:
+                            break
+                    if not in_flight:
+                        break
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        in_flight.pop(future)
+        finally:
+            self.state = "done"
+            self.finished_at = datetime.now().isoformat()
+            shutil.rmtree(self.workdir, ignore_errors=True)
+        logger.info(f"📦 Lot {self.job_id} terminé : {self.summary()}")
+        event_bus.publish("job.done", job_id=self.job_id, kind="upload_batch", counts=self.summary())
+
+    def _process_one(self, orchestrator: ExtractionOrchestrator, path: Path):
+        index, name = path.name.split("_", 1)
+        index = int(index)
+        self._set(index, {"status": "processing"})
+        try:
+            # Background like watcher ingestion: single interactive uploads go first
+            result = orchestrator.process_file(path.read_bytes(), name, priority=WATCHER)
+        except Exception as e:
+            logger.error(f"❌ {name}: {e}")
+            self._set(index, {"status": "failed", "error": str(e)})
+            return
+        if not result.was_cached and not result.invoice.products:
+            logger.error(f"❌ {name}: aucun produit extrait")
+            self._set(index, {"status": "failed", "error": "No products extracted"})
+            return
+        Metrics.increment("invoices_processed")
+        Metrics.increment("products_added", result.products_added)
+        Metrics.increment("products_updated", result.products_updated)
+        self._set(index, {
+            "status": "cached" if result.was_cached else "done",
+            "invoice_number": result.invoice.numero_facture,
+            "products_added": result.products_added,
+            "products_updated": result.products_updated,
+            "products_held": result.products_held,
+        })
+
+    def _set(self, index: int, outcome: Dict):
+        with self._lock:
+            self.results[index] = entry = {"filename": self.results[index]["filename"], **outcome}
+        event_bus.publish("job.file", job_id=self.job_id, **entry)
+
+    # ── Reporting ──────────────────────────────────────────
+    def summary(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        with self._lock:
+            for outcome in self.results:
+                counts[outcome["status"]] = counts.get(outcome["status"], 0) + 1
+        return counts
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            files = list(self.results)
+        return {
+            "job_id": self.job_id,
+            "state": self.state,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "total": len(self.files),
+            "counts": self.summary(),
+            "files": files,
+        }
@@ -0,0 +1,159 @@
+"""
+Gemini token accounting and the daily token budget.
+GeminiService reports every call to the active `track_usage()` scope; the
+orchestrator stores the totals on the invoice row and in the daily ledger.
+Background work (watcher, backfill) checks `TokenBudget` before spending.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from backend.core.config import AppConfig
+
+BUDGET_CACHE_SECONDS = 10.0
+# Batch API calls are booked under "<model>:batch" so they are priced (and reported) apart
+BATCH_SUFFIX = ":batch"
+
+_active: contextvars.ContextVar[Optional["Usage"]] = contextvars.ContextVar("gemini_usage", default=None)
+
+
+@dataclass
+class Usage:
+    calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    latency_ms: float = 0.0
+    escalations: int = 0
+    model: str = ""  # model of the last call
+    by_model: Dict[str, "Usage"] = field(default_factory=dict)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def _bump(self, calls: int, input_tokens: int, output_tokens: int, latency_ms: float, escalations: int):
+        self.calls += calls
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        self.latency_ms += latency_ms
+        self.escalations += escalations
+
+    def add(self, other: "Usage"):
+        self._bump(other.calls, other.input_tokens, other.output_tokens, other.latency_ms, other.escalations)
+        self.model = other.model or self.model
+        for model, part in other.by_model.items():
+            self.by_model.setdefault(model, Usage(model=model)).add(part)
+
+    def split(self, parts: int) -> List["Usage"]:
+        """Even shares of a request made for `parts` documents (remainders go to the first ones)."""
+        model_shares = {model: part.split(parts) for model, part in self.by_model.items()}
+        def _share(total: int, i: int) -> int:
+            return total // parts + (1 if i < total % parts else 0)
+
+        shares = []
+        for i in range(parts):
+            share = Usage(
+                _share(self.calls, i), _share(self.input_tokens, i), _share(self.output_tokens, i),
+                self.latency_ms / parts, _share(self.escalations, i), self.model,
+            )
+            share.by_model = {model: model_parts[i] for model, model_parts in model_shares.items()}
+            shares.append(share)
+        return shares
+
+
+@contextmanager
+def track_usage() -> Iterator[Usage]:
+    """Collect the Gemini calls made inside the block (same thread/context)."""
+    usage = Usage()
+    outer = _active.get()
+    token = _active.set(usage)
+    try:
+        yield usage
+    finally:
+        _active.reset(token)
+        if outer is not None:
+            outer.add(usage)
+
+
+def record_call(usage_metadata, latency_ms: float, model: str = ""):
+    """Called by GeminiService after each model call, failed ones included (no tokens then)."""
+    usage = _active.get()
+    if usage is None:
+        return
+    input_tokens = int(getattr(usage_metadata, "prompt_token_count", None) or 0)
+    output_tokens = int(getattr(usage_metadata, "candidates_token_count", None) or 0)
+    usage._bump(1, input_tokens, output_tokens, latency_ms, 0)
+    if model:
+        usage.model = model
+        usage.by_model.setdefault(model, Usage(model=model))._bump(1, input_tokens, output_tokens, latency_ms, 0)
+
+
+def record_escalation(from_model: str):
+    """The fast tier's answer was rejected and the document goes to the standard model."""
+    usage = _active.get()
+    if usage is None:
+        return
+    usage.escalations += 1
+    usage.by_model.setdefault(from_model, Usage(model=from_model)).escalations += 1
+
+
+def batch_model(model: str) -> str:
+    return model + BATCH_SUFFIX
+
+
+def model_prices(config: AppConfig, model: Optional[str] = None) -> Tuple[float, float]:
+    """($ per million input tokens, $ per million output tokens) for a model."""
+    if model and model.endswith(BATCH_SUFFIX):
+        input_price, output_price = model_prices(config, model[:-len(BATCH_SUFFIX)])
+        return input_price * config.gemini_batch_price_factor, output_price * config.gemini_batch_price_factor
+    if model and model == config.gemini_fast_model:
+        return config.gemini_fast_input_price_per_m, config.gemini_fast_output_price_per_m
+    return config.gemini_input_price_per_m, config.gemini_output_price_per_m
+
+
+def cost_usd(input_tokens: int, output_tokens: int, config: AppConfig, model: Optional[str] = None) -> float:
+    input_price, output_price = model_prices(config, model)
+    return round(input_tokens / 1e6 * input_price + output_tokens / 1e6 * output_price, 4)
+
+
+def usage_cost(usage: Usage, config: AppConfig) -> float:
+    """Cost of a usage scope, each model at its own price."""
+    if not usage.by_model:
+        return cost_usd(usage.input_tokens, usage.output_tokens, config)
+    return round(sum(
+        cost_usd(part.input_tokens, part.output_tokens, config, model)
+        for model, part in usage.by_model.items()
+    ), 4)
+
+
+class TokenBudget:
+    """DAILY_TOKEN_BUDGET check for deferrable work. 0 means unlimited."""
+
+    def __init__(self, db, daily_limit: int):
+        self.db = db
+        self.daily_limit = daily_limit
+        self._cached = (0.0, "", 0)  # (checked at, day, tokens)
+        self._lock = threading.Lock()
+
+    def spent_today(self) -> int:
+        today = date.today().isoformat()
+        with self._lock:
+            checked_at, day, tokens = self._cached
+            if day == today and time.monotonic() - checked_at < BUDGET_CACHE_SECONDS:
+                return tokens
+        tokens = self.db.get_tokens_spent(today)
+        with self._lock:
+            self._cached = (time.monotonic(), today, tokens)
+        return tokens
+
+    def exhausted(self) -> bool:
+        return self.daily_limit > 0 and self.spent_today() >= self.daily_limit
+
+    def remaining(self) -> Optional[int]:
+        if self.daily_limit <= 0:
+            return None
+        return max(0, self.daily_limit - self.spent_today())
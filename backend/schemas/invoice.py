@@ -1,7 +1,7 @@
 """
 Pydantic schemas for invoice data and product catalogue.
 """
-from pydantic import BaseModel, Field, model_validator
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 from typing import List, Optional
 from datetime import datetime
 
@@ -26,6 +26,44 @@ class Product(BaseModel):
         return self
 
 
+class ProductFields(BaseModel):
+    """Editable catalogue columns; only the fields sent are updated."""
+    model_config = ConfigDict(extra="forbid")
+
+    designation_fr: Optional[str] = None
+    famille: Optional[str] = None
+    unite: Optional[str] = None
+    prix_brut_ht: Optional[float] = Field(default=None, ge=0)
+    remise_pct: Optional[float] = Field(default=None, ge=0, le=100)
+    prix_remise_ht: Optional[float] = Field(default=None, ge=0)
+    prix_ttc_iva21: Optional[float] = Field(default=None, ge=0)
+
+    @model_validator(mode="after")
+    def validate_fields(self) -> "ProductFields":
+        if not self.model_fields_set:
+            raise ValueError("No field to update")
+        for name in self.model_fields_set - {"remise_pct"}:
+            if getattr(self, name) is None:
+                raise ValueError(f"{name} cannot be null")
+        # Same rule as Product: a new discounted price implies its TTC price
+        if "prix_remise_ht" in self.model_fields_set and "prix_ttc_iva21" not in self.model_fields_set:
+            self.prix_ttc_iva21 = round(self.prix_remise_ht * 1.21, 2)
+        return self
+
+    def changes(self) -> dict:
+        return self.model_dump(exclude_unset=True)
+
+
+class ProductPatch(BaseModel):
+    """One row of a bulk catalogue edit."""
+    id: int
+    fields: ProductFields
+    updated_at: Optional[str] = Field(
+        default=None,
+        description="updated_at as last read by the client; the edit is rejected if the row changed since",
+    )
+
+
 class InvoiceResult(BaseModel):
     """Result of processing a single invoice."""
     numero_facture: str = Field(default="")
@@ -40,4 +78,5 @@ class ProcessingResult(BaseModel):
     file_hash: str
     products_added: int = 0
     products_updated: int = 0
+    products_held: int = 0  # suspect prices waiting for review (price_reviews)
     was_cached: bool = False
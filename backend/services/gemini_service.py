@@ -4,14 +4,24 @@ Sends PDF/image directly to Gemini 2.5 Flash for structured extraction.
 """
 import json
 import logging
+import threading
 import time
 import re
-from typing import Optional
+from typing import Callable, Dict, List, Optional, Tuple
 
 from google import genai
 from google.genai import types
 
+from pydantic import TypeAdapter, ValidationError
+
 from backend.core.config import AppConfig
+from backend.core.monitoring import Metrics
+from backend.core.tracing import span
+from backend.core.usage import Usage, batch_model, record_call, record_escalation, track_usage
+from backend.services.model_router import FAST, STANDARD, count_pages, route, validate_extraction
+from backend.services.resilience import (
+    CircuitBreaker, CircuitOpenError, HedgePolicy, breaker_for, call_with_deadline, hedge_policy_for, is_transient,
+)
 from backend.schemas.invoice import InvoiceResult, Product
 
 logger = logging.getLogger(__name__)
@@ -19,7 +29,17 @@ logger = logging.getLogger(__name__)
 MAX_RETRIES = 3
 BASE_DELAY = 5  # seconds
 
-EXTRACTION_PROMPT = """Tu es un expert comptable spécialisé en matériaux de construction (BTP).
+# Batch job states after which no further polling is needed
+BATCH_DONE_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED"}
+BATCH_FAILED_STATES = {"JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+CACHE_REFRESH_MARGIN = 300  # seconds before expiry at which the cache is renewed
+CACHE_RETRY_AFTER = 600  # seconds to wait before retrying a failed cache creation
+# Smallest context the API accepts in an explicit cache (Pro models need more)
+CACHE_MIN_TOKENS = 1024
+CACHE_MIN_TOKENS_PRO = 4096
+CHARS_PER_TOKEN = 4  # rough estimate, enough to compare against the minimum
+
+EXTRACTION_INSTRUCTIONS = """Tu es un expert comptable spécialisé en matériaux de construction (BTP).
 Analyse cette facture et extrais TOUTES les lignes d'articles.
 
 Pour chaque article, fournis :
@@ -37,7 +57,10 @@ Extrais aussi les métadonnées de la facture :
 - "numero_facture": le numéro de facture
 - "date_facture": la date de la facture (format JJ/MM/AAAA)
 - "fournisseur": le nom du fournisseur
+"""
 
+# Prose description of the output shape, only needed without response_schema
+JSON_FORMAT_SPEC = """
 Réponds UNIQUEMENT en JSON strict avec cette structure :
 {
   "numero_facture": "...",
@@ -59,17 +82,246 @@ Réponds UNIQUEMENT en JSON strict avec cette structure :
 }
 """
 
+EXTRACTION_PROMPT = EXTRACTION_INSTRUCTIONS + JSON_FORMAT_SPEC
+
+REPAIR_PROMPT = """Ces lignes d'articles extraites d'une facture BTP sont invalides.
+Corrige-les (types numériques, champs manquants) sans inventer de valeurs
+et renvoie le tableau JSON corrigé :
+
+"""
+
+PACK_PROMPT = """Ce message contient {count} documents distincts (Document 1 à Document {count}) :
+chacun est une facture ou un ticket séparé, éventuellement d'un fournisseur différent.
+Extrais chaque document indépendamment selon les règles ci-dessus et renvoie un tableau JSON
+de {count} objets, un par document, dans l'ordre des documents."""
+
+_PACKED_RESULTS = TypeAdapter(List[InvoiceResult])
+
+
+def _payload_size(contents: List) -> int:
+    """Bytes sent to the model: inline documents, or text length for text-only calls."""
+    size = 0
+    for part in contents:
+        inline = getattr(part, "inline_data", None)
+        size += len(inline.data or b"") if inline is not None else len(str(part))
+    return size
+
+
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+
+class StreamingInvoiceParser:
+    """
+    Incremental parser for a streamed invoice JSON document.
+    Emits each product object of the top-level "products" array as soon as
+    its closing brace arrives, without waiting for the rest of the response.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._last_key: Optional[str] = None
+        self._in_products = False
+        self._products_done = False
+        self._object_start = -1
+        self.header: Optional[Dict] = None
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """Append a chunk and return the product dicts completed by it."""
+        self._text += chunk
+        completed = []
+        text = self._text
+
+        while self._pos < len(text):
+            i = self._pos
+            ch = text[i]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = text[self._string_start + 1:i]
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                if (
+                    ch == "[" and self._depth == 1
+                    and self._last_key == "products" and not self._products_done
+                ):
+                    self._in_products = True
+                    self.header = self._parse_header(text[:i + 1])
+                elif ch == "{" and self._in_products and self._depth == 2:
+                    self._object_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if ch == "}" and self._in_products and self._depth == 2:
+                    completed.append(json.loads(text[self._object_start:i + 1]))
+                    self._object_start = -1
+                elif ch == "]" and self._in_products and self._depth == 1:
+                    self._in_products = False
+                    self._products_done = True
+
+        return completed
+
+    @staticmethod
+    def _parse_header(prefix: str) -> Dict:
+        """Close the document right after '"products": [' to read the invoice metadata."""
+        try:
+            data = json.loads(prefix + "]}")
+        except json.JSONDecodeError:
+            return {}
+        data.pop("products", None)
+        return data
+
+
+def repair_json(text: str) -> Optional[Dict]:
+    """
+    Best-effort local repair of a malformed model response: strips markdown
+    fences and trailing commas, then closes a truncated document by cutting
+    back to the last complete element.
+    """
+    cleaned = _TRAILING_COMMA_RE.sub(r"\1", _FENCE_RE.sub("", text.strip()))
+    try:
+        return json.loads(cleaned)
+    except json.JSONDecodeError:
+        pass
+
+    closers = {"{": "}", "[": "]"}
+    stack: List[str] = []
+    cut_points = []
+    in_string = escape = False
+    for i, ch in enumerate(cleaned):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in closers:
+            stack.append(closers[ch])
+        elif ch in "}]" and stack:
+            stack.pop()
+            cut_points.append((i + 1, "".join(reversed(stack))))
+        elif ch == ",":
+            cut_points.append((i, "".join(reversed(stack))))
+
+    for end, closing in reversed(cut_points[-3:]):
+        try:
+            return json.loads(cleaned[:end] + closing)
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def _invoice_header(data: Optional[Dict]) -> InvoiceResult:
+    """Invoice metadata from model JSON, values coerced to strings; an empty header if still invalid."""
+    if not isinstance(data, dict):
+        return InvoiceResult()
+    try:
+        return InvoiceResult(**{
+            k: str(v) for k, v in data.items()
+            if k in InvoiceResult.model_fields and k != "products" and v is not None
+        })
+    except ValidationError:
+        return InvoiceResult()
+
+
+class PromptCache:
+    """
+    Static extraction instructions registered once as a Gemini cached context.
+    The cache is renewed shortly before its TTL expires. When caching is
+    unavailable (API error, prompt below the minimum cacheable size...) get()
+    returns None and callers send the instructions as a system instruction.
+    """
+
+    def __init__(self, service: "GeminiService", model: str, ttl: int = 3600):
+        self._service = service
+        self._model = model
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._name: Optional[str] = None
+        self._expires_at = 0.0
+        self._retry_after = 0.0
+
+    def get(self) -> Optional[str]:
+        """Return the cached content name, creating or refreshing it if needed."""
+        now = time.monotonic()
+        with self._lock:
+            if self._name and now < self._expires_at - CACHE_REFRESH_MARGIN:
+                return self._name
+            if now < self._retry_after:
+                return None
+            try:
+                cache = self._service._client.caches.create(
+                    model=self._model,
+                    config=types.CreateCachedContentConfig(
+                        display_name="docling-extraction-instructions",
+                        system_instruction=self._service._prompt,
+                        ttl=f"{self._ttl}s",
+                    ),
+                )
+                self._name = cache.name
+                self._expires_at = now + self._ttl
+                Metrics.increment("gemini_cache_refreshes")
+                logger.info(f"Extraction instructions cached as {cache.name} (TTL {self._ttl}s)")
+            except Exception as e:
+                logger.warning(f"Context caching unavailable, using system instruction: {e}")
+                self._name = None
+                self._retry_after = now + CACHE_RETRY_AFTER
+            return self._name
+
+    def invalidate(self):
+        """Forget the current cache (e.g. expired or deleted server-side)."""
+        with self._lock:
+            self._name = None
+            self._expires_at = 0.0
+
 
 class GeminiService:
-    """Multimodal invoice extraction via Gemini 2.0 Flash."""
+    """Multimodal invoice extraction via Gemini (standard tier, plus a fast tier for small documents)."""
 
     def __init__(self, config: AppConfig):
         self.config = config
         self._client = None
+        self.tiers = {STANDARD: config.gemini_model, FAST: config.gemini_fast_model}
+
+        # Cached contexts are tied to a model, and only worth it above its minimum size
+        self._prompt_caches: Dict[str, PromptCache] = {
+            model: PromptCache(self, model, ttl=config.gemini_prompt_cache_ttl)
+            for model in set(self.tiers.values())
+            if self._cacheable(model)
+        } if config.gemini_prompt_cache else {}
+
+        # Shared by every instance: they all talk to the same endpoint
+        self.breaker = breaker_for(
+            self.model, config.gemini_breaker_failures, config.gemini_breaker_cooldown_s
+        )
+        self.hedging = hedge_policy_for(self.model, config.gemini_hedge_min_delay_s)
 
         if config.has_gemini_key:
             self._client = genai.Client(api_key=config.gemini_api_key)
-            logger.info("Gemini client initialized (gemini-2.5-flash)")
+            logger.info(f"Gemini client initialized ({self.model}, fast tier {config.gemini_fast_model})")
         else:
             logger.warning("Gemini API key missing — extraction disabled.")
 
@@ -77,104 +329,482 @@ class GeminiService:
     def is_available(self) -> bool:
         return self._client is not None
 
+    @property
+    def model(self) -> str:
+        """The standard model: streaming, repairs, batches and escalations."""
+        return self.tiers[STANDARD]
+
+    def _breaker(self, model: str) -> CircuitBreaker:
+        if model == self.model:
+            return self.breaker
+        return breaker_for(model, self.config.gemini_breaker_failures, self.config.gemini_breaker_cooldown_s)
+
+    def _hedging(self, model: str) -> HedgePolicy:
+        if model == self.model:
+            return self.hedging
+        return hedge_policy_for(model, self.config.gemini_hedge_min_delay_s)
+
+    @property
+    def _mode(self) -> str:
+        return "schema" if self.config.gemini_schema_mode else "prose"
+
+    @property
+    def _prompt(self) -> str:
+        return EXTRACTION_INSTRUCTIONS if self.config.gemini_schema_mode else EXTRACTION_PROMPT
+
+    def _cacheable(self, model: str) -> bool:
+        minimum = CACHE_MIN_TOKENS_PRO if "pro" in model else CACHE_MIN_TOKENS
+        if len(self._prompt) // CHARS_PER_TOKEN >= minimum:
+            return True
+        logger.info(f"Extraction instructions below the {minimum}-token cache minimum of {model}: not cached")
+        return False
+
+    def _generation_config(
+        self, use_cache: bool = True, model: Optional[str] = None, packed: bool = False
+    ) -> types.GenerateContentConfig:
+        """
+        Per-call config. The static instructions are referenced through the
+        cached context when available, otherwise sent as system instruction;
+        either way the call contents only carry the document.
+        """
+        prompt_cache = self._prompt_caches.get(model or self.model) if use_cache else None
+        cached = prompt_cache.get() if prompt_cache else None
+        return types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=(list[InvoiceResult] if packed else InvoiceResult)
+            if self.config.gemini_schema_mode else None,
+            cached_content=cached,
+            system_instruction=None if cached else self._prompt,
+            temperature=0.1,
+            http_options=self._http_options(),
+        )
+
+    def _http_options(self) -> types.HttpOptions:
+        """Per-call deadline: a stalled call gives its worker back (timeout in ms)."""
+        return types.HttpOptions(timeout=int(self.config.gemini_call_timeout_s * 1000))
+
+    def _handle_cache_error(self, error_str: str) -> bool:
+        """Drop a cache the server no longer knows about. Returns True if handled."""
+        if self._prompt_caches and "cachedcontent" in error_str.lower().replace(" ", ""):
+            logger.warning("Cached context rejected by the API, recreating it")
+            for prompt_cache in self._prompt_caches.values():
+                prompt_cache.invalidate()
+            return True
+        return False
+
     def _parse_retry_delay(self, error_msg: str) -> int:
         """Extract retry delay from 429 error message."""
         match = re.search(r"retry in (\d+)", str(error_msg))
         return int(match.group(1)) + 2 if match else BASE_DELAY
 
-    def extract_invoice(
-        self, file_bytes: bytes, mime_type: str = "application/pdf"
-    ) -> Optional[InvoiceResult]:
+    def _record_usage(self, response, started: float, model: Optional[str] = None) -> None:
+        """Book one model call (tokens and latency); response is None when the call failed."""
+        usage = getattr(response, "usage_metadata", None)
+        tokens = getattr(usage, "candidates_token_count", None)
+        if isinstance(tokens, int):
+            Metrics.increment(f"gemini_{self._mode}_output_tokens", tokens)
+        record_call(usage, (time.perf_counter() - started) * 1000, model or self.model)
+
+    def _parse_response(self, text: str) -> Optional[InvoiceResult]:
         """
-        Extract invoice data with automatic retry on rate limit (429).
+        Strict fast path: validate the raw JSON in one pass with pydantic.
+        On failure, repair the document locally and re-extract only the
+        product lines that still fail validation. Returns None when the
+        response is unrecoverable and the call should be retried.
         """
-        if not self._client:
-            logger.error("Cannot extract: Gemini client not initialized.")
+        try:
+            return InvoiceResult.model_validate_json(text)
+        except ValidationError as e:
+            logger.warning(f"Strict validation failed ({e.error_count()} errors), repairing...")
+
+        data = repair_json(text or "")
+        if not isinstance(data, dict):
             return None
+        Metrics.increment("gemini_json_repairs")
 
-        file_part = types.Part.from_bytes(data=file_bytes, mime_type=mime_type)
+        raw_products = data.pop("products", None) or []
+        header = _invoice_header(data)
+        products, broken = [], []
+        for raw in raw_products:
+            try:
+                products.append(Product.model_validate(raw))
+            except ValidationError:
+                broken.append(raw)
+        if broken:
+            products.extend(self._repair_products(broken))
+        header.products = products
+        return header
 
-        for attempt in range(1, MAX_RETRIES + 1):
+    def _parse_packed(self, text: str) -> Optional[List[Optional[InvoiceResult]]]:
+        """Array of results for a packed request; each document is repaired on its own."""
+        try:
+            return _PACKED_RESULTS.validate_json(text)
+        except ValidationError as e:
+            logger.warning(f"Strict validation of packed response failed ({e.error_count()} errors), repairing...")
+
+        data = repair_json(text or "")
+        if not isinstance(data, list):
+            return None
+        return [
+            self._parse_response(json.dumps(item, ensure_ascii=False)) if isinstance(item, dict) else None
+            for item in data
+        ]
+
+    def _repair_products(self, broken: List) -> List[Product]:
+        """Ask the model to fix only the invalid product lines (text-only, no document)."""
+        logger.info(f"Re-extracting {len(broken)} invalid product lines")
+        started = time.perf_counter()
+        try:
+            response = self._client.models.generate_content(
+                model=self.model,
+                contents=[REPAIR_PROMPT + json.dumps(broken, ensure_ascii=False)],
+                config=types.GenerateContentConfig(
+                    response_mime_type="application/json",
+                    response_schema=list[Product],
+                    temperature=0.0,
+                    http_options=self._http_options(),
+                ),
+            )
+            self._record_usage(response, started)
+            repaired = []
+            for raw in json.loads(response.text):
+                try:
+                    repaired.append(Product.model_validate(raw))
+                except ValidationError as e:
+                    logger.warning(f"Dropping unrepairable product line: {e}")
+            return repaired
+        except Exception as e:
+            logger.error(f"Product repair failed: {e}")
+            return []
+
+    def _call_model(self, contents: List, size: int, model: str, packed: bool = False):
+        """
+        One generate_content call under the deadline, with a duplicate sent if
+        it runs past the recent p95 for this request size. Returns (response, hedged).
+        """
+        config = self._generation_config(model=model, packed=packed)
+        hedging = self._hedging(model)
+
+        def _call():
+            started, response = time.perf_counter(), None
             try:
                 response = self._client.models.generate_content(
-                    model="gemini-2.5-flash",
-                    contents=[EXTRACTION_PROMPT, file_part],
-                    config=types.GenerateContentConfig(
-                        response_mime_type="application/json",
-                        temperature=0.1,
-                    ),
+                    model=model, contents=contents, config=config,
                 )
+                hedging.record(size, time.perf_counter() - started)
+                return response
+            finally:
+                self._record_usage(response, started, model)
 
-                data = json.loads(response.text)
-                result = InvoiceResult(**data)
-                logger.info(
-                    f"Extracted {len(result.products)} products from invoice "
-                    f"{result.numero_facture} ({result.fournisseur})"
-                )
+        hedge_after = hedging.delay(size) if self.config.gemini_hedging else None
+        return call_with_deadline(
+            _call, self.config.gemini_call_timeout_s, hedge_after, on_hedge=hedging.hedged
+        )
+
+    def _extract(
+        self, contents: List, label: str = "", model: Optional[str] = None, packed: bool = False
+    ):
+        """
+        Shared call loop: retries on rate limit (429), transient errors and
+        unparseable output. Raises CircuitOpenError while the endpoint is down
+        rather than spending the remaining attempts on it. Returns an
+        InvoiceResult, or a list of them for a packed request.
+        """
+        model = model or self.model
+        breaker = self._breaker(model)
+        size = _payload_size(contents)
+        for attempt in range(1, MAX_RETRIES + 1):
+            breaker.before_call()
+            try:
+                Metrics.increment("gemini_calls_total")
+                Metrics.increment(f"gemini_{self._mode}_calls")
+                with span("gemini.attempt", attempt=attempt, mode=self._mode, model=model) as call:
+                    response, hedged = self._call_model(contents, size, model, packed)
+                    call.set("hedged", hedged)
+                breaker.record_success()
+
+                with span("gemini.parse"):
+                    result = self._parse_packed(response.text) if packed else self._parse_response(response.text)
+                if result is None:
+                    Metrics.increment("gemini_calls_failed")
+                    Metrics.increment(f"gemini_{self._mode}_failed")
+                    logger.warning(
+                        f"Unparseable Gemini response (attempt {attempt}/{MAX_RETRIES})"
+                    )
+                    continue
+
+                Metrics.increment("gemini_calls_success")
+                if packed:
+                    logger.info(f"{label}Extracted {len(result)} documents in one request")
+                else:
+                    logger.info(
+                        f"{label}Extracted {len(result.products)} products from invoice "
+                        f"{result.numero_facture} ({result.fournisseur})"
+                    )
                 return result
 
-            except json.JSONDecodeError as e:
-                logger.error(f"Gemini returned invalid JSON: {e}")
-                return None
             except Exception as e:
                 error_str = str(e)
+                if is_transient(e):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()  # the endpoint answered (429, 400...)
                 if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str:
+                    Metrics.increment("gemini_rate_limited")
                     delay = self._parse_retry_delay(error_str)
                     logger.warning(
                         f"Rate limited (attempt {attempt}/{MAX_RETRIES}). "
                         f"Waiting {delay}s..."
                     )
-                    time.sleep(delay)
+                    with span("gemini.backoff", delay_s=delay):
+                        time.sleep(delay)
+                    continue
+                elif self._handle_cache_error(error_str):
+                    continue
+                elif is_transient(e):
+                    Metrics.increment("gemini_calls_failed")
+                    logger.warning(f"Transient Gemini error (attempt {attempt}/{MAX_RETRIES}): {e}")
                     continue
                 else:
+                    Metrics.increment("gemini_calls_failed")
                     logger.error(f"Gemini extraction error: {e}")
                     return None
 
-        logger.error(f"Failed after {MAX_RETRIES} retries (rate limit).")
+        logger.error(f"Failed after {MAX_RETRIES} attempts.")
         return None
 
-    def extract_from_text(self, ocr_text: str) -> Optional[InvoiceResult]:
-        """Extract structured data from pre-OCR'd text (fewer tokens)."""
+    def extract_invoice(
+        self, file_bytes: bytes, mime_type: str = "application/pdf"
+    ) -> Optional[InvoiceResult]:
+        """
+        Extract invoice data with automatic retry on rate limit (429)
+        and on malformed output. Small documents try the fast tier first
+        (see model_router) and escalate to the standard model if its answer
+        fails validation.
+        """
+        if not self._client:
+            logger.error("Cannot extract: Gemini client not initialized.")
+            return None
+
+        file_part = types.Part.from_bytes(data=file_bytes, mime_type=mime_type)
+        if route(file_bytes, mime_type, self.config) == STANDARD:
+            Metrics.increment("gemini_routed_standard")
+            return self._extract([file_part])
+        return self._extract_cheap_first([file_part], count_pages(file_bytes, mime_type) or 1)
+
+    def _extract_cheap_first(self, contents: List, pages: int) -> Optional[InvoiceResult]:
+        Metrics.increment("gemini_routed_fast")
+        fast = self.tiers[FAST]
+        try:
+            result = self._extract(contents, label="[fast] ", model=fast)
+            problems = validate_extraction(result, pages)
+        except CircuitOpenError:
+            result, problems = None, ["fast_tier_unavailable"]
+        if not problems:
+            return result
+
+        Metrics.increment("gemini_escalations")
+        record_escalation(fast)
+        logger.info(f"Escalating from {fast} to {self.model}: {', '.join(problems)}")
+        with span("gemini.escalate", reasons=",".join(problems)):
+            escalated = self._extract(contents, label="[escalated] ")
+        # A doubtful answer beats none if the standard model fails too
+        return escalated or result
+
+    def extract_invoices(
+        self, documents: List[Tuple[bytes, str]]
+    ) -> Optional[List[Optional[InvoiceResult]]]:
+        """
+        Extract several small (file_bytes, mime_type) documents in one request
+        on the standard model. Returns one result per document, in order, or
+        None when the answer cannot be matched back to the documents.
+        """
+        if not self._client:
+            logger.error("Cannot extract: Gemini client not initialized.")
+            return None
+
+        contents: List = [PACK_PROMPT.format(count=len(documents))]
+        for i, (file_bytes, mime_type) in enumerate(documents, 1):
+            contents.append(f"Document {i} :")
+            contents.append(types.Part.from_bytes(data=file_bytes, mime_type=mime_type))
+        results = self._extract(contents, label="[packed] ", packed=True)
+        if results is not None and len(results) != len(documents):
+            logger.warning(f"Packed request returned {len(results)} results for {len(documents)} documents")
+            return None
+        return results
+
+    def extract_invoice_stream(
+        self,
+        file_bytes: bytes,
+        mime_type: str = "application/pdf",
+        on_product: Optional[Callable[[Product, InvoiceResult], None]] = None,
+    ) -> Optional[InvoiceResult]:
+        """
+        Streaming variant of extract_invoice.
+        Each product is validated and handed to on_product (with the invoice
+        header) while the model is still generating the remaining lines.
+        Retries only happen before the first product is emitted. Calls have
+        the same deadline and circuit breaker as extract_invoice, but are not
+        hedged: emitted products cannot be taken back.
+        """
         if not self._client:
             logger.error("Cannot extract: Gemini client not initialized.")
             return None
 
-        prompt = EXTRACTION_PROMPT + "\n\nVoici le texte OCR de la facture :\n\n" + ocr_text
+        file_part = types.Part.from_bytes(data=file_bytes, mime_type=mime_type)
 
         for attempt in range(1, MAX_RETRIES + 1):
+            parser = StreamingInvoiceParser()
+            header: Optional[InvoiceResult] = None
+            emitted = 0
+            started, booked = time.perf_counter(), False
+            self.breaker.before_call()
             try:
-                response = self._client.models.generate_content(
-                    model="gemini-2.5-flash",
-                    contents=[prompt],
-                    config=types.GenerateContentConfig(
-                        response_mime_type="application/json",
-                        temperature=0.1,
-                    ),
-                )
-                data = json.loads(response.text)
-                result = InvoiceResult(**data)
+                Metrics.increment("gemini_calls_total")
+                Metrics.increment(f"gemini_{self._mode}_calls")
+                with span("gemini.attempt", attempt=attempt, mode=self._mode, model=self.model, stream=True) as call:
+                    stream = self._client.models.generate_content_stream(
+                        model=self.model,
+                        contents=[file_part],
+                        config=self._generation_config(),
+                    )
+                    last_chunk = None
+                    for chunk in stream:
+                        last_chunk = chunk
+                        for raw in parser.feed(chunk.text or ""):
+                            try:
+                                product = Product(**raw)
+                            except ValidationError as e:
+                                logger.warning(f"Skipping invalid streamed product: {e}")
+                                continue
+                            if header is None:
+                                header = _invoice_header(parser.header)
+                            emitted += 1
+                            if on_product:
+                                on_product(product, header)
+                    call.set("products", emitted)
+                # Usage metadata is only complete on the final chunk
+                self._record_usage(last_chunk, started)
+                booked = True
+                self.breaker.record_success()
+
+                result = self._parse_response(parser.text)
+                if result is None:
+                    Metrics.increment("gemini_calls_failed")
+                    Metrics.increment(f"gemini_{self._mode}_failed")
+                    if emitted:
+                        logger.error(f"Unparseable stream after {emitted} products")
+                        return None
+                    logger.warning(
+                        f"Unparseable Gemini response (attempt {attempt}/{MAX_RETRIES})"
+                    )
+                    continue
+
+                Metrics.increment("gemini_calls_success")
                 logger.info(
-                    f"[text mode] Extracted {len(result.products)} products "
-                    f"from invoice {result.numero_facture}"
+                    f"[stream] Extracted {len(result.products)} products from invoice "
+                    f"{result.numero_facture} ({result.fournisseur})"
                 )
                 return result
 
-            except json.JSONDecodeError as e:
-                logger.error(f"Gemini returned invalid JSON: {e}")
-                return None
             except Exception as e:
+                if not booked:
+                    self._record_usage(None, started)
                 error_str = str(e)
-                if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str:
+                if is_transient(e):
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if emitted == 0 and ("429" in error_str or "RESOURCE_EXHAUSTED" in error_str):
+                    Metrics.increment("gemini_rate_limited")
                     delay = self._parse_retry_delay(error_str)
                     logger.warning(
                         f"Rate limited (attempt {attempt}/{MAX_RETRIES}). "
                         f"Waiting {delay}s..."
                     )
-                    time.sleep(delay)
+                    with span("gemini.backoff", delay_s=delay):
+                        time.sleep(delay)
+                    continue
+                elif emitted == 0 and self._handle_cache_error(error_str):
+                    continue
+                elif emitted == 0 and is_transient(e):
+                    Metrics.increment("gemini_calls_failed")
+                    logger.warning(f"Transient Gemini error (attempt {attempt}/{MAX_RETRIES}): {e}")
                     continue
                 else:
-                    logger.error(f"Gemini extraction error: {e}")
+                    Metrics.increment("gemini_calls_failed")
+                    logger.error(f"Gemini streaming error after {emitted} products: {e}")
                     return None
 
-        logger.error(f"Failed after {MAX_RETRIES} retries (rate limit).")
+        logger.error(f"Failed after {MAX_RETRIES} attempts.")
         return None
+
+    def extract_from_text(self, ocr_text: str) -> Optional[InvoiceResult]:
+        """Extract structured data from pre-OCR'd text (fewer tokens)."""
+        if not self._client:
+            logger.error("Cannot extract: Gemini client not initialized.")
+            return None
+
+        return self._extract(
+            ["Voici le texte OCR de la facture :\n\n" + ocr_text], label="[text mode] "
+        )
+
+    def submit_batch(
+        self, documents: List[Tuple[str, bytes, str]], display_name: str = "docling-backfill"
+    ) -> str:
+        """
+        Submit (key, file_bytes, mime_type) documents as one asynchronous batch
+        job (billed at batch prices). Returns the job name to poll.
+        The cached context is not used: batch jobs may outlive its TTL.
+        """
+        if not self._client:
+            raise RuntimeError("Gemini client not initialized")
+
+        config = self._generation_config(use_cache=False)
+        requests = [
+            types.InlinedRequest(
+                model=self.model,
+                contents=[types.Part.from_bytes(data=file_bytes, mime_type=mime_type)],
+                metadata={"key": key},
+                config=config,
+            )
+            for key, file_bytes, mime_type in documents
+        ]
+        job = self._client.batches.create(
+            model=self.model, src=requests, config={"display_name": display_name}
+        )
+        logger.info(f"Batch job {job.name} submitted ({len(requests)} documents)")
+        return job.name
+
+    def get_batch(
+        self, job_name: str, keys: List[str]
+    ) -> Tuple[str, Optional[Dict[str, Optional[InvoiceResult]]], Dict[str, Usage]]:
+        """
+        Poll a batch job. Returns (state, results, usages); results maps each
+        submitted key to its parsed invoice (None if that document failed)
+        and is only set once the job has finished successfully. usages holds
+        each answered key's own tokens, booked under the job's model at batch
+        prices (see batch_model).
+        """
+        job = self._client.batches.get(name=job_name)
+        state = getattr(job.state, "value", str(job.state))
+        if state not in BATCH_DONE_STATES:
+            return state, None, {}
+
+        model = batch_model((getattr(job, "model", None) or self.model).removeprefix("models/"))
+        results: Dict[str, Optional[InvoiceResult]] = {key: None for key in keys}
+        usages: Dict[str, Usage] = {}
+        responses = (job.dest.inlined_responses if job.dest else None) or []
+        for index, item in enumerate(responses):
+            # Responses keep the request order; metadata carries the key when echoed back
+            key = (item.metadata or {}).get("key") or (keys[index] if index < len(keys) else None)
+            if key is None:
+                continue
+            if item.error or not item.response:
+                logger.warning(f"Batch item {key} failed: {item.error}")
+                continue
+            with track_usage() as item_usage:
+                record_call(getattr(item.response, "usage_metadata", None), 0.0, model)
+            usages[key] = item_usage
+            results[key] = self._parse_response(item.response.text)
+        return state, results, usages
@@ -0,0 +1,91 @@
+"""
+Cheap-first model routing.
+Small, short documents (till receipts, phone photos, one-page invoices) go to
+the fast model tier first. Its answer is checked with cheap heuristics; only
+when a check fails is the document re-extracted with the standard model.
+"""
+import re
+from typing import List, Optional
+
+from backend.core.config import AppConfig
+from backend.schemas.invoice import InvoiceResult
+
+FAST, STANDARD = "fast", "standard"
+
+IVA_RATE = 1.21
+PRICE_REL_TOLERANCE = 0.02  # 2 % (rounding on the invoice)
+PRICE_ABS_TOLERANCE = 0.02  # 2 cents
+MAX_INCONSISTENT_SHARE = 0.2  # share of lines with inconsistent prices before escalating
+MAX_EMPTY_SHARE = 0.2  # share of lines with an empty designation, family or price
+MAX_LINES_PER_PAGE = 80
+
+_PDF_PAGE_RE = re.compile(rb"/Type\s*/Page(?!s)")
+_PDF_COUNT_RE = re.compile(rb"/Count\s+(\d+)")
+
+
+def count_pages(file_bytes: bytes, mime_type: str) -> Optional[int]:
+    """
+    Page count of a document (1 for images). For a PDF: its page objects, or
+    else the page tree's /Count (the root node holds the largest). None when
+    neither is readable, e.g. both inside compressed object streams (PDF 1.5+).
+    """
+    if mime_type != "application/pdf":
+        return 1
+    pages = len(_PDF_PAGE_RE.findall(file_bytes))
+    if pages:
+        return pages
+    counts = [int(n) for n in _PDF_COUNT_RE.findall(file_bytes)]
+    return max(counts) if counts and max(counts) > 0 else None
+
+
+def route(file_bytes: bytes, mime_type: str, config: AppConfig) -> str:
+    """Tier to try first for this document."""
+    if not config.gemini_model_routing:
+        return STANDARD
+    if len(file_bytes) > config.gemini_fast_max_bytes:
+        return STANDARD
+    pages = count_pages(file_bytes, mime_type)
+    # Unknown page count: do not bet on the fast tier
+    if pages is None or pages > config.gemini_fast_max_pages:
+        return STANDARD
+    return FAST
+
+
+def _close(expected: float, actual: float) -> bool:
+    return abs(expected - actual) <= max(PRICE_ABS_TOLERANCE, PRICE_REL_TOLERANCE * abs(expected))
+
+
+def validate_extraction(result: Optional[InvoiceResult], pages: int) -> List[str]:
+    """Reasons to distrust a fast-tier extraction; empty when it looks sound."""
+    if result is None:
+        return ["unparseable"]
+    if not result.products:
+        return ["no_products"]
+
+    problems = []
+    if not result.numero_facture.strip() and not result.fournisseur.strip():
+        problems.append("missing_header")
+
+    lines = len(result.products)
+    # At least one line per page, and not an implausible number of them
+    if lines < pages or lines > pages * MAX_LINES_PER_PAGE:
+        problems.append("line_count")
+
+    inconsistent = empty = 0
+    for p in result.products:
+        if p.prix_brut_ht > 0 and p.prix_remise_ht > 0:
+            expected = p.prix_brut_ht * (1 - (p.remise_pct or 0) / 100)
+            if not _close(expected, p.prix_remise_ht):
+                inconsistent += 1
+                continue
+        if p.prix_remise_ht > 0 and not _close(p.prix_remise_ht * IVA_RATE, p.prix_ttc_iva21):
+            inconsistent += 1
+            continue
+        if not (p.designation_raw.strip() and p.designation_fr.strip() and p.famille.strip()) \
+                or p.prix_remise_ht <= 0:
+            empty += 1
+    if inconsistent > MAX_INCONSISTENT_SHARE * lines:
+        problems.append("price_mismatch")
+    if empty > MAX_EMPTY_SHARE * lines:
+        problems.append("empty_fields")
+    return problems
@@ -0,0 +1,247 @@
+"""
+Tail-latency and failure handling for model calls.
+- per-call deadlines: a call that has not answered in time is abandoned;
+- hedged requests: when a call runs past the recent p95 for its size class,
+  a duplicate is sent and the first answer wins. The loser cannot be
+  cancelled once started: it runs to completion (or its HTTP timeout), is
+  billed, and holds a worker, so at most HEDGE_MAX_IN_FLIGHT hedges run;
+- circuit breaker: after a burst of failures the endpoint is considered
+  down, interactive callers fail fast and background work is parked.
+"""
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+import httpx
+from google.genai import errors as genai_errors
+
+from backend.core.monitoring import Metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+LATENCY_WINDOW = 200  # recent successful calls kept per size class
+HEDGE_MIN_SAMPLES = 20  # no hedging until the p95 means something
+HEDGE_BUDGET = 0.10  # at most this share of calls may be duplicated
+SIZE_CLASS_BYTES = 256 * 1024
+CALL_WORKERS = 32
+HEDGE_MAX_IN_FLIGHT = 4  # duplicates running at once, losers included
+TRANSIENT_STATUS_CODES = {408, 500, 502, 503, 504}
+# Errors raised without a code attribute carry it first, as the SDK formats them ("503 UNAVAILABLE. ...")
+_STATUS_RE = re.compile(r"^(\d{3}) [A-Z_]+\b")
+
+# Calls run here so the caller can stop waiting; a stalled call is bounded by its HTTP timeout
+_pool = ThreadPoolExecutor(CALL_WORKERS, thread_name_prefix="model-call")
+_hedge_slots = threading.BoundedSemaphore(HEDGE_MAX_IN_FLIGHT)
+
+
+class DeadlineExceededError(TimeoutError):
+    """No answer (first or hedged) before the call deadline."""
+
+
+class CircuitOpenError(RuntimeError):
+    """The model endpoint is considered down; retry after `retry_after` seconds."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} indisponible (circuit ouvert), nouvel essai dans {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def is_transient(error: BaseException) -> bool:
+    """Timeouts, network and server-side errors: they count against the endpoint's health."""
+    if isinstance(error, (TimeoutError, ConnectionError, httpx.TimeoutException, httpx.NetworkError)):
+        return True
+    if isinstance(error, genai_errors.APIError):
+        return error.code in TRANSIENT_STATUS_CODES
+    match = _STATUS_RE.match(str(error))
+    return bool(match) and int(match.group(1)) in TRANSIENT_STATUS_CODES
+
+
+class CircuitBreaker:
+    """
+    Closed → open after `failure_threshold` consecutive failures; open → half
+    open after `cooldown_s`, where a single probe call decides whether to
+    close again or re-open.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, cooldown_s: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._cond = threading.Condition()
+
+    @property
+    def state(self) -> str:
+        with self._cond:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown_s:
+            self._state = self.HALF_OPEN
+        return self._state
+
+    def retry_after(self) -> float:
+        with self._cond:
+            return max(0.0, self.cooldown_s - (time.monotonic() - self._opened_at))
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go out now."""
+        with self._cond:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            Metrics.increment("gemini_circuit_rejected")
+            raise CircuitOpenError(self.name, max(1.0, self.cooldown_s - (time.monotonic() - self._opened_at)))
+
+    def record_success(self):
+        with self._cond:
+            if self._state != self.CLOSED:
+                logger.info(f"✅ {self.name} rétabli, circuit refermé")
+            self._state, self._failures, self._probing = self.CLOSED, 0, False
+            self._cond.notify_all()
+
+    def record_failure(self):
+        with self._cond:
+            self._failures += 1
+            if self._probing or (self._state == self.CLOSED and self._failures >= self.failure_threshold):
+                if self._state == self.CLOSED:
+                    Metrics.increment("gemini_circuit_opened")
+                    logger.error(
+                        f"🔌 {self.name} : {self._failures} échecs consécutifs, circuit ouvert "
+                        f"pour {self.cooldown_s:.0f}s"
+                    )
+                self._state, self._opened_at, self._probing = self.OPEN, time.monotonic(), False
+            self._cond.notify_all()
+
+    def wait_until_available(self, timeout: Optional[float] = None) -> bool:
+        """Block while calls would be rejected. Used to park background work."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                state = self._current_state()
+                if state == self.CLOSED or (state == self.HALF_OPEN and not self._probing):
+                    return True
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                # Wake up at the end of the cooldown even if nobody notifies
+                pause = self.cooldown_s - (time.monotonic() - self._opened_at) if state == self.OPEN else None
+                pause = max(0.05, pause) if pause is not None else 1.0
+                self._cond.wait(pause if remaining is None else min(pause, remaining))
+
+
+class HedgePolicy:
+    """Recent latencies per request size class, and the share of calls already hedged."""
+
+    def __init__(self, min_delay_s: float = 2.0, budget: float = HEDGE_BUDGET):
+        self.min_delay_s = min_delay_s
+        self.budget = budget
+        self._latencies: Dict[int, Deque[float]] = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+        self._calls = 0
+        self._hedges = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def size_class(payload_bytes: int) -> int:
+        return (payload_bytes // SIZE_CLASS_BYTES).bit_length()
+
+    def record(self, payload_bytes: int, seconds: float):
+        with self._lock:
+            self._latencies[self.size_class(payload_bytes)].append(seconds)
+
+    def delay(self, payload_bytes: int) -> Optional[float]:
+        """Seconds after which to send a duplicate, or None (too few samples, or budget spent)."""
+        with self._lock:
+            self._calls += 1
+            samples = sorted(self._latencies[self.size_class(payload_bytes)])
+            if len(samples) < HEDGE_MIN_SAMPLES or self._hedges >= self.budget * self._calls:
+                return None
+            return max(self.min_delay_s, samples[int(0.95 * (len(samples) - 1))])
+
+    def hedged(self):
+        with self._lock:
+            self._hedges += 1
+
+
+def call_with_deadline(
+    fn: Callable[[], T],
+    deadline_s: float,
+    hedge_after_s: Optional[float] = None,
+    on_hedge: Optional[Callable[[], None]] = None,
+) -> Tuple[T, bool]:
+    """
+    Run fn with a deadline, optionally racing a duplicate started after
+    hedge_after_s. Returns (result, won_by_hedge). The slower call is not
+    waited for, but keeps running until it ends: its result is discarded.
+    No duplicate is sent while HEDGE_MAX_IN_FLIGHT are already running.
+    """
+    deadline = time.monotonic() + deadline_s
+    # Each call gets its own copy of the context: spans and usage scopes follow it
+    primary = _pool.submit(contextvars.copy_context().run, fn)
+    pending = {primary}
+    hedge = None
+    if hedge_after_s is not None and hedge_after_s < deadline_s:
+        done, _ = wait(pending, timeout=hedge_after_s)
+        if not done and _hedge_slots.acquire(blocking=False):
+            hedge = _pool.submit(contextvars.copy_context().run, fn)
+            hedge.add_done_callback(lambda _: _hedge_slots.release())
+            pending.add(hedge)
+            Metrics.increment("gemini_hedges")
+            if on_hedge:
+                on_hedge()
+
+    error: Optional[BaseException] = None
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            pending.discard(future)
+            if future.exception() is None:
+                for loser in pending:
+                    loser.cancel()  # only stops a call that has not started yet
+                if future is hedge:
+                    Metrics.increment("gemini_hedge_wins")
+                return future.result(), future is hedge
+            error = future.exception()
+    if error is not None and not pending:
+        raise error
+    Metrics.increment("gemini_deadline_exceeded")
+    raise DeadlineExceededError(f"Pas de réponse du modèle en {deadline_s:.0f}s")
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_hedge_policies: Dict[str, HedgePolicy] = {}
+_registry_lock = threading.Lock()
+
+
+def breaker_for(name: str, failure_threshold: int, cooldown_s: float) -> CircuitBreaker:
+    """Process-wide breaker per model endpoint: every GeminiService instance shares it."""
+    with _registry_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, failure_threshold, cooldown_s)
+        return _breakers[name]
+
+
+def hedge_policy_for(name: str, min_delay_s: float) -> HedgePolicy:
+    with _registry_lock:
+        if name not in _hedge_policies:
+            _hedge_policies[name] = HedgePolicy(min_delay_s)
+        return _hedge_policies[name]
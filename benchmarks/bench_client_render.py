@@ -0,0 +1,131 @@
+"""
+Dashboard render latency: one fresh connection per request, in series (the
+old client) vs the pooled keep-alive session with concurrent sidebar GETs.
+A local proxy adds round-trip latency to mimic a remote API.
+Usage: python -m benchmarks.bench_client_render [--rtt-ms 40] [--renders 20] [--api-url URL]
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Requests made by one render of the catalogue tab
+SIDEBAR = ["/health/live", "/api/v1/stats", "/api/v1/watcher/activity"]
+CATALOGUE = ["/api/v1/catalogue/facets", "/api/v1/catalogue?limit=50&offset=0"]
+
+
+class LatencyProxy:
+    """TCP proxy adding one RTT per connection (handshake) and half an RTT per chunk each way."""
+
+    def __init__(self, target_port: int, rtt: float):
+        self.target_port = target_port
+        self.rtt = rtt
+        self.port = None
+        self._ready = threading.Event()
+        threading.Thread(target=self._serve, daemon=True).start()
+        self._ready.wait()
+
+    def _serve(self):
+        asyncio.run(self._main())
+
+    async def _main(self):
+        server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, client_reader, client_writer):
+        await asyncio.sleep(self.rtt)
+        upstream_reader, upstream_writer = await asyncio.open_connection("127.0.0.1", self.target_port)
+
+        async def pipe(reader, writer):
+            try:
+                while data := await reader.read(65536):
+                    await asyncio.sleep(self.rtt / 2)
+                    writer.write(data)
+                    await writer.drain()
+            finally:
+                writer.close()
+
+        await asyncio.gather(
+            pipe(client_reader, upstream_writer), pipe(upstream_reader, client_writer),
+            return_exceptions=True,
+        )
+
+
+def start_local_api(db_dir: str) -> int:
+    import os
+    import socket
+    import uvicorn
+
+    os.environ["DB_PATH"] = str(Path(db_dir) / "bench.db")
+    from api import app
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return port
+
+
+def render_baseline(base: str):
+    for path in SIDEBAR + CATALOGUE:
+        requests.get(base + path, timeout=10)
+
+
+def render_pooled(base: str, session: requests.Session, pool: ThreadPoolExecutor):
+    list(pool.map(lambda path: session.get(base + path, timeout=10), SIDEBAR))
+    for path in CATALOGUE:
+        session.get(base + path, timeout=10)
+
+
+def measure(render, renders: int):
+    timings = []
+    for _ in range(renders):
+        start = time.perf_counter()
+        render()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), max(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rtt-ms", type=float, default=40.0, help="Simulated round trip")
+    parser.add_argument("--renders", type=int, default=20)
+    parser.add_argument("--api-url", help="Measure against this API instead of a local one")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.api_url:
+            base = args.api_url.rstrip("/")
+        else:
+            proxy = LatencyProxy(start_local_api(tmp), args.rtt_ms / 1000)
+            base = f"http://127.0.0.1:{proxy.port}"
+
+        session = requests.Session()
+        session.mount("http://", HTTPAdapter(pool_maxsize=16))
+        session.mount("https://", HTTPAdapter(pool_maxsize=16))
+        with ThreadPoolExecutor(len(SIDEBAR)) as pool:
+            render_pooled(base, session, pool)  # warm the pool, as a running dashboard would be
+            baseline = measure(lambda: render_baseline(base), args.renders)
+            pooled = measure(lambda: render_pooled(base, session, pool), args.renders)
+
+    print(f"{'client':>22} | {'median ms':>9} | {'max ms':>7}")
+    print(f"{'new conn, serial':>22} | {baseline[0]:>9.1f} | {baseline[1]:>7.1f}")
+    print(f"{'pooled, concurrent':>22} | {pooled[0]:>9.1f} | {pooled[1]:>7.1f}")
+    print(f"speedup x{baseline[0] / pooled[0]:.1f}")
+
+
+if __name__ == "__main__":
+    main()
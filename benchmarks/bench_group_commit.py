@@ -0,0 +1,77 @@
+"""
+Catalogue write throughput: per-row commits vs the group-commit writer.
+Usage: python -m benchmarks.bench_group_commit [--invoices 40] [--lines 25]
+"""
+import argparse
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from backend.core.db_manager import DBManager
+from backend.core.db_writer import CatalogueWriter
+from backend.schemas.invoice import Product
+
+PRODUCERS = (1, 10, 50)
+
+
+def make_invoice(producer: int, invoice: int, lines: int):
+    return [
+        Product(
+            fournisseur=f"Fournisseur {producer % 7}",
+            designation_raw=f"P{producer}-F{invoice}-L{i}",
+            designation_fr=f"Article {i}",
+            famille="Ciment",
+            prix_remise_ht=1.0 + i,
+        )
+        for i in range(lines)
+    ]
+
+
+def run_per_row(db: DBManager, producers: int, invoices: int, lines: int) -> float:
+    def produce(p):
+        for k in range(invoices):
+            for product in make_invoice(p, k, lines):
+                db.upsert_product(product, f"F{k}", "")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(producers) as pool:
+        list(pool.map(produce, range(producers)))
+    return producers * invoices * lines / (time.perf_counter() - start)
+
+
+def run_group_commit(db: DBManager, producers: int, invoices: int, lines: int) -> float:
+    writer = CatalogueWriter(db)
+
+    def produce(p):
+        for k in range(invoices):
+            writer.submit(make_invoice(p, k, lines), f"F{k}", "").result()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(producers) as pool:
+        list(pool.map(produce, range(producers)))
+    elapsed = time.perf_counter() - start
+    writer.close()
+    return producers * invoices * lines / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--invoices", type=int, default=40, help="Invoices per producer")
+    parser.add_argument("--lines", type=int, default=25, help="Product lines per invoice")
+    args = parser.parse_args(argv)
+
+    print(f"{'producers':>9} | {'per-row rows/s':>14} | {'group rows/s':>12} | speedup")
+    with tempfile.TemporaryDirectory() as tmp:
+        for producers in PRODUCERS:
+            per_row = run_per_row(
+                DBManager(str(Path(tmp) / f"row_{producers}.db")), producers, args.invoices, args.lines
+            )
+            grouped = run_group_commit(
+                DBManager(str(Path(tmp) / f"group_{producers}.db")), producers, args.invoices, args.lines
+            )
+            print(f"{producers:>9} | {per_row:>14.0f} | {grouped:>12.0f} | x{grouped / per_row:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Synthetic invoice corpus for benchmarks: deterministic invoices of 1–500
+lines rendered as PDF or image, with the expected extraction kept alongside
+so a stub model can answer for them.
+Usage: python -m benchmarks.corpus OUT_DIR [--invoices 50] [--seed 0]
+"""
+import argparse
+import hashlib
+import io
+import random
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from PIL import Image, ImageDraw
+
+from backend.schemas.invoice import InvoiceResult, Product
+
+SUPPLIERS = ["BigMat", "Leroy Merlin", "Saint-Gobain", "Point P", "Cedeo", "Rexel", "Gedimat"]
+FAMILIES = {
+    "Ciment": [("Ciment gris 25kg", "sac"), ("Mortero cola C2", "sac"), ("Cal hidráulica", "sac")],
+    "Granulats": [("Arena lavada 0/4", "t"), ("Grava 6/12", "t"), ("Saco de árido", "sac")],
+    "Finition": [("Pintura plástica blanca", "l"), ("Masilla en polvo", "kg"), ("Yeso fino", "sac")],
+    "Plomberie": [("Tubo PVC 40mm", "ml"), ("Codo cobre 22", "unité"), ("Grifo monomando", "unité")],
+    "Électricité": [("Cable 2,5mm²", "ml"), ("Caja de empalme", "unité"), ("Interruptor doble", "unité")],
+    "Bois": [("Tablero OSB 18mm", "m²"), ("Listón pino 45x45", "ml"), ("Contrachapado 10mm", "m²")],
+}
+SKUS_PER_SUPPLIER = 600  # catalogue size per supplier: repeated SKUs turn into updates
+MAX_LINES = 500
+FORMATS = ("pdf", "png", "jpg")
+LINES_PER_PAGE = 60
+
+
+@dataclass
+class SyntheticInvoice:
+    filename: str
+    content: bytes
+    expected: InvoiceResult
+
+    @property
+    def file_hash(self) -> str:
+        return hashlib.sha256(self.content).hexdigest()
+
+
+def invoice_size(rng: random.Random) -> int:
+    """Line count skewed like real traffic: mostly short invoices, a long tail up to 500."""
+    return max(1, min(MAX_LINES, int(rng.lognormvariate(2.3, 1.1))))
+
+
+def make_invoice_data(rng: random.Random, lines: int, number: int) -> InvoiceResult:
+    supplier = rng.choice(SUPPLIERS)
+    products = []
+    for sku in rng.sample(range(SKUS_PER_SUPPLIER), min(lines, SKUS_PER_SUPPLIER)):
+        famille = list(FAMILIES)[sku % len(FAMILIES)]
+        label, unite = FAMILIES[famille][sku % 3]
+        brut = round(rng.uniform(0.5, 250), 2)
+        remise = rng.choice([None, 5.0, 10.0, 15.0])
+        net = round(brut * (1 - (remise or 0) / 100), 2)
+        products.append(Product(
+            fournisseur=supplier,
+            designation_raw=f"{label} ref.{sku:04d}",
+            designation_fr=f"{famille} article {sku:04d}",
+            famille=famille,
+            unite=unite,
+            prix_brut_ht=brut,
+            remise_pct=remise,
+            prix_remise_ht=net,
+        ))
+    return InvoiceResult(
+        numero_facture=f"BENCH-{number:06d}",
+        date_facture=f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        fournisseur=supplier,
+        products=products,
+    )
+
+
+def _text_lines(invoice: InvoiceResult) -> List[str]:
+    lines = [f"{invoice.fournisseur} - Factura {invoice.numero_facture} - {invoice.date_facture}", ""]
+    lines += [
+        f"{p.designation_raw[:40]:<40} {p.unite:>6} {p.prix_brut_ht:>8.2f} "
+        f"{(p.remise_pct or 0):>5.1f}% {p.prix_remise_ht:>8.2f}"
+        for p in invoice.products
+    ]
+    return lines
+
+
+def _pdf_escape(line: str) -> str:
+    line = line.encode("latin-1", "replace").decode("latin-1")
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def render_pdf(invoice: InvoiceResult) -> bytes:
+    """Minimal multi-page text PDF (Helvetica, uncompressed), no PDF library needed."""
+    lines = _text_lines(invoice)
+    pages = [lines[i:i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)]
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in pages:
+        text = "".join(f"({_pdf_escape(line)}) Tj T* " for line in page)
+        stream = f"BT /F1 9 Tf 12 TL 40 800 Td {text}ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects))
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode()
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def render_image(invoice: InvoiceResult, fmt: str) -> bytes:
+    """Scanned-looking page: one text row per line, page height grows with the invoice."""
+    lines = _text_lines(invoice)
+    image = Image.new("L", (1240, 80 + 16 * len(lines)), color=255)
+    draw = ImageDraw.Draw(image)
+    for row, line in enumerate(lines):
+        draw.text((40, 40 + 16 * row), line, fill=0)
+    out = io.BytesIO()
+    image.save(out, format="JPEG" if fmt == "jpg" else "PNG", quality=80)
+    return out.getvalue()
+
+
+def make_invoice(
+    seed: int, number: int, lines: Optional[int] = None, fmt: Optional[str] = None
+) -> SyntheticInvoice:
+    rng = random.Random(seed * 1_000_003 + number)
+    invoice = make_invoice_data(rng, lines or invoice_size(rng), number)
+    fmt = fmt or rng.choices(FORMATS, weights=(6, 2, 2))[0]
+    content = render_pdf(invoice) if fmt == "pdf" else render_image(invoice, fmt)
+    return SyntheticInvoice(f"{invoice.numero_facture}.{fmt}", content, invoice)
+
+
+class Corpus:
+    """A reproducible set of synthetic invoices, indexed by file hash for the stub model."""
+
+    def __init__(
+        self, size: int, seed: int = 0, lines: Optional[int] = None, fmt: Optional[str] = None
+    ):
+        self.seed = seed
+        self.invoices = [make_invoice(seed, n, lines, fmt) for n in range(size)]
+        self.by_hash: Dict[str, InvoiceResult] = {inv.file_hash: inv.expected for inv in self.invoices}
+
+    def __iter__(self):
+        return iter(self.invoices)
+
+    def __len__(self) -> int:
+        return len(self.invoices)
+
+    @property
+    def total_lines(self) -> int:
+        return sum(len(inv.expected.products) for inv in self.invoices)
+
+    def write(self, directory: Path) -> List[Path]:
+        directory.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for inv in self.invoices:
+            path = directory / inv.filename
+            path.write_bytes(inv.content)
+            paths.append(path)
+        return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("out", type=Path)
+    parser.add_argument("--invoices", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--lines", type=int, help="Fixed line count (default: skewed 1-500)")
+    parser.add_argument("--format", choices=FORMATS, help="Single format (default: mixed)")
+    args = parser.parse_args(argv)
+
+    corpus = Corpus(args.invoices, args.seed, args.lines, args.format)
+    corpus.write(args.out)
+    print(f"{len(corpus)} factures, {corpus.total_lines} lignes → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""
+Load test for the REST API: mixed uploads, catalogue searches, stats and
+watcher polling from N closed-loop virtual users, while a probe polls
+/health like the uptime monitor does.
+
+By default a single uvicorn worker of api.py is started in a child process
+with the model stubbed (so client and server don't share a GIL).
+
+Usage:
+    python -m benchmarks.loadtest [--users 16] [--duration 30]
+    python -m benchmarks.loadtest --ramp 1,2,4,8,16,32,64 --stage-seconds 15
+    python -m benchmarks.loadtest --api-url http://host:8000 ...   # existing server
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from itertools import count
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from backend.core.orchestrator import MIME_TYPES
+
+from benchmarks.corpus import Corpus
+from benchmarks.stub_gemini import StubProfile, variant
+from benchmarks.suite import percentiles
+
+# Relative weights of the operations a virtual user picks from
+WORKLOAD = {"upload": 1, "catalogue_search": 4, "stats": 3, "watcher_activity": 3}
+SEARCH_TERMS = ["ciment", "ref.01", "tubo", "cable", "pintura", "arena", "osb", ""]
+REQUEST_TIMEOUT = 60.0
+HEALTH_INTERVAL = 1.0
+HEALTH_TIMEOUT = 2.0  # what the uptime monitor tolerates
+SERVER_START_TIMEOUT = 60.0
+
+
+class Recorder:
+    """Thread-safe per-endpoint latencies and errors."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, latency_ms: float, ok: bool):
+        with self._lock:
+            self.latencies[endpoint].append(latency_ms)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def report(self, elapsed: float) -> Dict[str, Dict]:
+        with self._lock:
+            endpoints = {name: list(values) for name, values in self.latencies.items()}
+            errors = dict(self.errors)
+        report = {}
+        for name, values in sorted(endpoints.items()):
+            report[name] = {
+                "requests": len(values),
+                "errors": errors.get(name, 0),
+                "error_rate": round(errors.get(name, 0) / len(values), 4),
+                "rps": round(len(values) / elapsed, 2),
+                **percentiles(values),
+            }
+        return report
+
+
+class Workload:
+    """The operations, bound to one API base URL and corpus."""
+
+    def __init__(self, base: str, corpus: Corpus, upload_timeout: float):
+        self.base = base
+        self.corpus = corpus
+        self.upload_timeout = upload_timeout
+        self._variants = count()
+        self.ops: Dict[str, Callable[[requests.Session, random.Random], requests.Response]] = {
+            "upload": self.upload,
+            "catalogue_search": self.catalogue_search,
+            "stats": lambda s, rng: s.get(f"{self.base}/api/v1/stats", timeout=REQUEST_TIMEOUT),
+            "watcher_activity": lambda s, rng: s.get(
+                f"{self.base}/api/v1/watcher/activity", timeout=REQUEST_TIMEOUT
+            ),
+        }
+
+    def upload(self, session: requests.Session, rng: random.Random) -> requests.Response:
+        invoice = rng.choice(self.corpus.invoices)
+        # A fresh hash per upload, or everything after the first pass is a cache hit
+        content = variant(invoice.content, next(self._variants))
+        return session.post(
+            f"{self.base}/api/v1/invoices/process",
+            files={"file": (invoice.filename, content, MIME_TYPES[Path(invoice.filename).suffix])},
+            timeout=self.upload_timeout,
+        )
+
+    def catalogue_search(self, session: requests.Session, rng: random.Random) -> requests.Response:
+        return session.get(
+            f"{self.base}/api/v1/catalogue",
+            params={"search": rng.choice(SEARCH_TERMS), "limit": 50, "offset": rng.choice([0, 0, 50, 100])},
+            timeout=REQUEST_TIMEOUT,
+        )
+
+
+def _session(pool_size: int = 1) -> requests.Session:
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_maxsize=pool_size))
+    session.mount("https://", HTTPAdapter(pool_maxsize=pool_size))
+    return session
+
+
+def run_stage(workload: Workload, users: int, duration: float, seed: int) -> Dict:
+    """Closed loop: each user sends its next request as soon as the previous one returns."""
+    recorder, health = Recorder(), Recorder()
+    stop = threading.Event()
+    names = list(WORKLOAD)
+    weights = [WORKLOAD[name] for name in names]
+
+    def user(number: int):
+        rng = random.Random(seed * 10_000 + number)
+        session = _session()
+        while not stop.is_set():
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                ok = workload.ops[name](session, rng).status_code < 400
+            except requests.RequestException:
+                ok = False
+            recorder.record(name, (time.perf_counter() - start) * 1000, ok)
+
+    def probe():
+        session = _session()
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                ok = session.get(f"{workload.base}/health", timeout=HEALTH_TIMEOUT).status_code == 200
+            except requests.RequestException:
+                ok = False
+            health.record("health", (time.perf_counter() - start) * 1000, ok)
+            stop.wait(HEALTH_INTERVAL)
+
+    threads = [threading.Thread(target=user, args=(n,), daemon=True) for n in range(users)]
+    threads.append(threading.Thread(target=probe, daemon=True))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join(REQUEST_TIMEOUT)
+    elapsed = time.perf_counter() - start
+
+    endpoints = recorder.report(elapsed)
+    all_latencies = [v for values in recorder.latencies.values() for v in values]
+    total = sum(e["requests"] for e in endpoints.values())
+    errors = sum(e["errors"] for e in endpoints.values())
+    return {
+        "users": users,
+        "seconds": round(elapsed, 1),
+        "rps": round(total / elapsed, 2),
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        **percentiles(all_latencies),
+        "health": health.report(elapsed).get("health", {}),
+        "endpoints": endpoints,
+    }
+
+
+def saturated(stage: Dict, best_rps: float, args) -> Optional[str]:
+    """Why this stage is past saturation, or None while the API still keeps up."""
+    if stage["health"].get("errors"):
+        return f"/health a échoué {stage['health']['errors']} fois (timeout {HEALTH_TIMEOUT}s)"
+    if stage["error_rate"] > args.max_error_rate:
+        return f"taux d'erreur {stage['error_rate']:.1%}"
+    if args.p95_slo_ms and stage.get("p95_ms", 0) > args.p95_slo_ms:
+        return f"p95 {stage['p95_ms']:.0f} ms > {args.p95_slo_ms:.0f} ms"
+    if best_rps and stage["rps"] < best_rps * (1 + args.min_gain):
+        return f"débit plafonné ({stage['rps']:.1f} req/s vs {best_rps:.1f})"
+    return None
+
+
+def print_stage(stage: Dict):
+    health = stage["health"]
+    print(
+        f"👥 {stage['users']:>3} | {stage['rps']:>7.1f} req/s | p50 {stage.get('p50_ms', 0):>7.1f} ms | "
+        f"p95 {stage.get('p95_ms', 0):>7.1f} ms | erreurs {stage['error_rate']:.1%} | "
+        f"/health p95 {health.get('p95_ms', 0):.0f} ms, {health.get('errors', 0)} échec(s)"
+    )
+    for name, e in stage["endpoints"].items():
+        print(
+            f"      {name:<18} {e['requests']:>6} req {e['rps']:>7.1f}/s  p50 {e.get('p50_ms', 0):>7.1f}  "
+            f"p95 {e.get('p95_ms', 0):>7.1f}  p99 {e.get('p99_ms', 0):>7.1f} ms  err {e['error_rate']:.1%}"
+        )
+
+
+# ── Local stubbed server ───────────────────────────────────
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_stub_server(workdir: str, args) -> Tuple[subprocess.Popen, str]:
+    port = _free_port()
+    env = {**os.environ, "DB_PATH": str(Path(workdir) / "loadtest.db")}
+    env.pop("WATCHDOG_FOLDER", None)
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.loadtest", "serve", "--port", str(port),
+            "--invoices", str(args.invoices), "--seed", str(args.seed),
+            "--latency-ms", str(args.latency_ms), "--per-line-ms", str(args.per_line_ms),
+            "--jitter", str(args.jitter), "--rate-limit", str(args.rate_limit),
+        ],
+        env=env,
+    )
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Le serveur de test s'est arrêté au démarrage")
+        try:
+            if requests.get(f"{base}/health/live", timeout=1).ok:
+                return process, base
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Le serveur de test n'a pas démarré à temps")
+
+
+def serve(args):
+    """Child process: one uvicorn worker of api.py with the model stubbed."""
+    import uvicorn
+
+    import api
+    from benchmarks.stub_gemini import stub_orchestrator
+
+    # api.py logs every pipeline step at INFO: keep the console for the report
+    logging.getLogger().setLevel(logging.WARNING)
+
+    corpus = Corpus(args.invoices, args.seed)
+    profile = StubProfile(
+        base_latency_ms=args.latency_ms, per_line_ms=args.per_line_ms,
+        jitter=args.jitter, rate_limit=args.rate_limit, seed=args.seed,
+    )
+    orchestrator = stub_orchestrator(api.get_db(), profile, corpus.by_hash)
+    api.app.dependency_overrides[api.get_orchestrator] = lambda: orchestrator
+    uvicorn.run(api.app, host="127.0.0.1", port=args.port, log_level="warning", workers=1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", nargs="?", choices=["run", "serve"], default="run")
+    parser.add_argument("--api-url", help="Target an already running API instead of a local stubbed one")
+    parser.add_argument("--users", type=int, default=16, help="Virtual users (fixed mode)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds (fixed mode)")
+    parser.add_argument("--ramp", help="Comma-separated user counts, e.g. 1,2,4,8,16,32")
+    parser.add_argument("--stage-seconds", type=float, default=15.0)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--p95-slo-ms", type=float, default=0.0, help="Stop the ramp past this p95 (0: off)")
+    parser.add_argument("--min-gain", type=float, default=0.05,
+                        help="Throughput gain a stage must bring to count as unsaturated")
+    parser.add_argument("--invoices", type=int, default=30, help="Corpus size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=StubProfile.base_latency_ms)
+    parser.add_argument("--per-line-ms", type=float, default=StubProfile.per_line_ms)
+    parser.add_argument("--jitter", type=float, default=StubProfile.jitter)
+    parser.add_argument("--rate-limit", type=float, default=StubProfile.rate_limit)
+    parser.add_argument("--upload-timeout", type=float, default=REQUEST_TIMEOUT)
+    parser.add_argument("--port", type=int, default=8000, help="serve mode only")
+    parser.add_argument("--out", type=Path, help="Write the stage reports as JSON")
+    args = parser.parse_args(argv)
+
+    if args.mode == "serve":
+        serve(args)
+        return 0
+
+    corpus = Corpus(args.invoices, args.seed)
+    process = None
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.api_url:
+            base = args.api_url.rstrip("/")
+        else:
+            process, base = start_stub_server(tmp, args)
+        try:
+            workload = Workload(base, corpus, args.upload_timeout)
+            stages, saturation = [], None
+            if args.ramp:
+                best_rps = 0.0
+                for users in [int(u) for u in args.ramp.split(",")]:
+                    stage = run_stage(workload, users, args.stage_seconds, args.seed)
+                    stages.append(stage)
+                    print_stage(stage)
+                    reason = saturated(stage, best_rps, args)
+                    if reason:
+                        saturation = {"users": users, "reason": reason, "best_rps": best_rps}
+                        break
+                    best_rps = max(best_rps, stage["rps"])
+            else:
+                stages.append(run_stage(workload, args.users, args.duration, args.seed))
+                print_stage(stages[0])
+        finally:
+            if process:
+                process.terminate()
+                process.wait(10)
+
+    if args.ramp:
+        if saturation:
+            print(f"🔥 Saturation à {saturation['users']} utilisateurs : {saturation['reason']} "
+                  f"(max soutenu ≈ {saturation['best_rps']:.1f} req/s)")
+        else:
+            print("✅ Pas de saturation sur la rampe testée")
+    if args.out:
+        args.out.write_text(json.dumps({"stages": stages, "saturation": saturation}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""
+Deterministic stand-in for the Gemini API, for benchmarks.
+It replaces only the network client, so GeminiService's real retry,
+parsing and streaming code runs. Latency grows with the invoice size;
+429s, stalls and jitter come from a seeded RNG, so a run replays
+identically. Error bursts fail a fixed range of calls with 503s.
+"""
+import hashlib
+import random
+import threading
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Dict, Iterator, Optional
+
+from backend.core.config import AppConfig, get_config
+from backend.core.db_manager import DBManager
+from backend.core.orchestrator import ExtractionOrchestrator
+from backend.schemas.invoice import InvoiceResult
+from backend.services.gemini_service import GeminiService
+
+from benchmarks.corpus import make_invoice_data
+
+STREAM_LINES_PER_CHUNK = 5
+VARIANT_MARKER = b"\n%bench-variant:"
+
+
+def variant(content: bytes, number: int) -> bytes:
+    """Same invoice under a new file hash (defeats the dedup cache); the stub still knows it."""
+    return content + VARIANT_MARKER + str(number).encode()
+
+
+@dataclass
+class StubProfile:
+    """Simulated model behaviour. Times in milliseconds."""
+    base_latency_ms: float = 800.0
+    per_line_ms: float = 25.0
+    jitter: float = 0.2  # ± fraction of the latency
+    rate_limit: float = 0.0  # probability that a call answers 429
+    retry_after_s: int = 0  # advertised in the 429 message (GeminiService adds 2s)
+    stall_rate: float = 0.0  # probability that a call hangs for stall_ms
+    stall_ms: float = 60_000.0
+    error_burst_start: int = 0  # calls number [start, start + length) answer 503
+    error_burst_length: int = 0
+    seed: int = 0
+
+
+class StubModels:
+    """Drop-in for genai.Client().models."""
+
+    def __init__(self, profile: StubProfile, answers: Dict[str, InvoiceResult]):
+        self.profile = profile
+        self.answers = answers
+        self.calls = 0
+        self.rate_limited = 0
+        self.stalled = 0
+        self.unavailable = 0
+        self._attempts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _document(self, contents) -> Optional[bytes]:
+        for part in contents:
+            inline = getattr(part, "inline_data", None)
+            if inline is not None:
+                return inline.data
+        return None
+
+    def _answer(self, data: bytes) -> InvoiceResult:
+        base = data.split(VARIANT_MARKER, 1)[0]
+        file_hash = hashlib.sha256(base).hexdigest()
+        if file_hash in self.answers:
+            return self.answers[file_hash]
+        # Unknown document: still deterministic, sized like a small invoice
+        return make_invoice_data(random.Random(file_hash), 5, int(file_hash[:6], 16))
+
+    def _call(self, contents, config=None):
+        """Decide the outcome of one call. Returns (result, latency in seconds)."""
+        data = self._document(contents) or b""
+        key = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self.calls += 1
+            number = self.calls
+            attempt = self._attempts[key] = self._attempts.get(key, 0) + 1
+        rng = random.Random(f"{self.profile.seed}:{key}:{attempt}")
+        burst = self.profile.error_burst_start
+        if burst <= number < burst + self.profile.error_burst_length:
+            with self._lock:
+                self.unavailable += 1
+            time.sleep(self.profile.base_latency_ms / 4000)
+            raise RuntimeError("503 UNAVAILABLE. The model is overloaded.")
+        if rng.random() < self.profile.rate_limit:
+            with self._lock:
+                self.rate_limited += 1
+            time.sleep(self.profile.base_latency_ms / 4000)
+            raise RuntimeError(
+                f"429 RESOURCE_EXHAUSTED. Please retry in {self.profile.retry_after_s}s."
+            )
+        result = self._answer(data)
+        latency = self.profile.base_latency_ms + self.profile.per_line_ms * len(result.products)
+        latency *= 1 + rng.uniform(-self.profile.jitter, self.profile.jitter)
+        if rng.random() < self.profile.stall_rate:
+            with self._lock:
+                self.stalled += 1
+            latency = self.profile.stall_ms
+        # Like the real client, give up at the HTTP timeout set in the call config
+        timeout_ms = getattr(getattr(config, "http_options", None), "timeout", None)
+        if timeout_ms is not None and latency > timeout_ms:
+            time.sleep(timeout_ms / 1000)
+            raise TimeoutError(f"Read timed out after {timeout_ms} ms")
+        return result, latency / 1000
+
+    @staticmethod
+    def _usage(text: str):
+        return SimpleNamespace(candidates_token_count=len(text) // 4)
+
+    def generate_content(self, model, contents, config=None):
+        result, latency = self._call(contents, config)
+        time.sleep(latency)
+        text = result.model_dump_json()
+        return SimpleNamespace(text=text, usage_metadata=self._usage(text))
+
+    def generate_content_stream(self, model, contents, config=None) -> Iterator:
+        result, latency = self._call(contents, config)
+        header = result.model_dump_json(exclude={"products"})[:-1] + ', "products": ['
+        lines = [p.model_dump_json() for p in result.products]
+        chunks = [header] + [
+            ", ".join(lines[i:i + STREAM_LINES_PER_CHUNK]) + ("," if i + STREAM_LINES_PER_CHUNK < len(lines) else "")
+            for i in range(0, len(lines), STREAM_LINES_PER_CHUNK)
+        ] + ["]}"]
+
+        def _stream():
+            # Time to first token is the base latency; the rest arrives with the lines
+            time.sleep(min(latency, self.profile.base_latency_ms / 1000))
+            per_chunk = max(0.0, latency - self.profile.base_latency_ms / 1000) / max(1, len(chunks) - 1)
+            text = ""
+            for number, chunk in enumerate(chunks):
+                if number:
+                    time.sleep(per_chunk)
+                text += chunk
+                yield SimpleNamespace(
+                    text=chunk,
+                    usage_metadata=self._usage(text) if number == len(chunks) - 1 else None,
+                )
+        return _stream()
+
+
+class StubGeminiService(GeminiService):
+    """GeminiService wired to StubModels instead of the network."""
+
+    def __init__(
+        self,
+        config: Optional[AppConfig] = None,
+        profile: Optional[StubProfile] = None,
+        answers: Optional[Dict[str, InvoiceResult]] = None,
+    ):
+        config = config or get_config()
+        # No key: the base class must not build a real client or context cache
+        super().__init__(config.model_copy(update={"gemini_api_key": "", "gemini_prompt_cache": False}))
+        self.models = StubModels(profile or StubProfile(), answers or {})
+        self._client = SimpleNamespace(models=self.models)
+
+
+def stub_orchestrator(
+    db: DBManager,
+    profile: Optional[StubProfile] = None,
+    answers: Optional[Dict[str, InvoiceResult]] = None,
+    **config_overrides,
+) -> ExtractionOrchestrator:
+    config = get_config(db_path=db.db_path, **config_overrides)
+    orchestrator = ExtractionOrchestrator(config=config, db_manager=db)
+    orchestrator.gemini = StubGeminiService(config, profile, answers)
+    return orchestrator
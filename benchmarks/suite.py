@@ -0,0 +1,424 @@
+"""
+End-to-end benchmark suite on a synthetic corpus with a stub model.
+Scenarios: db_upsert, catalogue_queries, api_upload, watcher_ingest, gemini_tail,
+anomaly_scoring.
+Results go to JSON so two commits can be compared.
+
+Usage:
+    python -m benchmarks.suite run [--out results.json] [--scenarios api_upload,db_upsert]
+    python -m benchmarks.suite compare base.json new.json [--threshold 0.10]
+"""
+import argparse
+import json
+import logging
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, replace
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import requests
+
+from backend.core.db_manager import DBManager
+from backend.core.db_writer import CatalogueWriter
+from backend.core.orchestrator import MIME_TYPES
+
+from benchmarks.corpus import Corpus
+from benchmarks.stub_gemini import StubGeminiService, StubProfile, stub_orchestrator
+
+SCENARIOS = (
+    "db_upsert", "catalogue_queries", "api_upload", "watcher_ingest", "gemini_tail", "anomaly_scoring",
+)
+QUERY_ROUNDS = 30
+WATCHER_TIMEOUT = 600  # seconds
+
+
+def percentiles(samples_ms: List[float], prefix: str = "") -> Dict[str, float]:
+    if not samples_ms:
+        return {}
+    ordered = sorted(samples_ms)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        f"{prefix}p50_ms": round(statistics.median(ordered), 2),
+        f"{prefix}p95_ms": round(pick(0.95), 2),
+        f"{prefix}p99_ms": round(pick(0.99), 2),
+        f"{prefix}max_ms": round(ordered[-1], 2),
+    }
+
+
+def timed(fn: Callable) -> float:
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+# ── Scenarios ──────────────────────────────────────────────
+def bench_db_upsert(corpus: Corpus, workdir: Path, args) -> Dict:
+    """Catalogue writes through the group-commit writer, one producer per worker."""
+    db = DBManager(str(workdir / "upsert.db"))
+    writer = CatalogueWriter(db)
+    latencies = []
+
+    def write(invoice):
+        expected = invoice.expected
+        latencies.append(timed(lambda: writer.submit(
+            expected.products, expected.numero_facture, expected.date_facture
+        ).result()))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(write, corpus))
+    elapsed = time.perf_counter() - start
+    writer.close()
+    return {
+        "rows": corpus.total_lines,
+        "rows_per_s": round(corpus.total_lines / elapsed, 1),
+        **percentiles(latencies, "invoice_"),
+    }
+
+
+def bench_catalogue_queries(corpus: Corpus, workdir: Path, args) -> Dict:
+    """Read paths of the catalogue tab on a catalogue built from the corpus."""
+    db = DBManager(str(workdir / "queries.db"))
+    db.upsert_products([
+        (p, inv.expected.numero_facture, inv.expected.date_facture)
+        for inv in corpus for p in inv.expected.products
+    ])
+    total = db.count_catalogue()
+    queries = {
+        "first_page": lambda: db.get_catalogue(limit=50, offset=0),
+        "deep_page": lambda: db.get_catalogue(limit=50, offset=max(0, total - 50)),
+        "famille_filter": lambda: db.get_catalogue(famille="Ciment", limit=50),
+        "search": lambda: db.get_catalogue(search="ref.01", limit=50),
+        "sorted_price": lambda: db.get_catalogue(sort="prix_remise_ht", order="desc", limit=50),
+        "count_filtered": lambda: db.count_catalogue(fournisseur="BigMat"),
+        "facets": lambda: db.get_facets(famille="Ciment"),
+        "stats": db.get_stats,
+    }
+    result = {"products": total}
+    for name, query in queries.items():
+        query()  # warm the page cache
+        result.update(percentiles([timed(query) for _ in range(QUERY_ROUNDS)], f"{name}_"))
+    return result
+
+
+def bench_api_upload(corpus: Corpus, workdir: Path, args) -> Dict:
+    """POST /api/v1/invoices/process against a local uvicorn, `concurrency` clients."""
+    from benchmarks.bench_client_render import start_local_api
+
+    port = start_local_api(str(workdir))
+    import api
+    orchestrator = stub_orchestrator(api.get_db(), args.profile, corpus.by_hash)
+    api.app.dependency_overrides[api.get_orchestrator] = lambda: orchestrator
+    base = f"http://127.0.0.1:{port}"
+
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency))
+    latencies, failures = [], []
+
+    def upload(invoice):
+        mime = MIME_TYPES[Path(invoice.filename).suffix]
+        start = time.perf_counter()
+        response = session.post(
+            f"{base}/api/v1/invoices/process",
+            files={"file": (invoice.filename, invoice.content, mime)}, timeout=120,
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            failures.append(response.status_code)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(upload, corpus))
+    elapsed = time.perf_counter() - start
+    api.app.dependency_overrides.pop(api.get_orchestrator, None)
+    return {
+        "files": len(corpus),
+        "failures": len(failures),
+        "model_calls": orchestrator.gemini.models.calls,
+        "rate_limited": orchestrator.gemini.models.rate_limited,
+        "files_per_s": round(len(corpus) / elapsed, 2),
+        "lines_per_s": round(corpus.total_lines / elapsed, 1),
+        **percentiles(latencies),
+    }
+
+
+def bench_watcher_ingest(corpus: Corpus, workdir: Path, args) -> Dict:
+    """Files dropped into the watched folder until each lands in Traitees/Erreurs."""
+    from backend.core.folder_watcher import DoclingWatcher
+
+    invoices = list(corpus)[:args.watcher_files]
+    inbox = workdir / "inbox"
+    db = DBManager(str(workdir / "watcher.db"))
+    watcher = DoclingWatcher(stub_orchestrator(db, args.profile, corpus.by_hash), str(inbox))
+    watcher.start()
+
+    dropped: Dict[str, float] = {}
+    landed: Dict[str, float] = {}
+    start = time.perf_counter()
+    for invoice in invoices:
+        (workdir / invoice.filename).write_bytes(invoice.content)
+        # Rename is atomic: the watcher never sees a half-written file
+        shutil.move(str(workdir / invoice.filename), str(inbox / invoice.filename))
+        dropped[invoice.filename] = time.perf_counter()
+    while len(landed) < len(invoices) and time.perf_counter() - start < WATCHER_TIMEOUT:
+        for folder in ("Traitees", "Erreurs"):
+            for path in (inbox / folder).iterdir():
+                landed.setdefault(path.name, time.perf_counter())
+        time.sleep(0.02)
+    elapsed = time.perf_counter() - start
+    watcher.stop()
+
+    latencies = [(landed[name] - dropped[name]) * 1000 for name in landed if name in dropped]
+    return {
+        "files": len(invoices),
+        "processed": len(list((inbox / "Traitees").iterdir())),
+        "errors": len(list((inbox / "Erreurs").iterdir())),
+        "files_per_s": round(len(landed) / elapsed, 2),
+        **percentiles(latencies),
+    }
+
+
+def bench_gemini_tail(corpus: Corpus, workdir: Path, args) -> Dict:
+    """
+    Extraction latency with stalled calls and a burst of 503s injected,
+    without then with hedging. Same seed: both runs see the same stalls.
+    """
+    from backend.core.config import get_config
+    from backend.services.resilience import CircuitBreaker, CircuitOpenError, HedgePolicy
+
+    invoices = list(corpus)
+    profile = replace(
+        args.profile, stall_rate=args.stall_rate, stall_ms=args.stall_ms,
+        error_burst_start=len(invoices) // 2, error_burst_length=args.error_burst,
+    )
+    result = {"files": len(invoices), "stalled_calls": 0}
+    for mode in ("plain", "hedged"):
+        config = get_config(gemini_hedging=mode == "hedged", gemini_call_timeout_s=args.call_timeout_s)
+        service = StubGeminiService(config, profile, corpus.by_hash)
+        # Fresh state per run: the process-wide breaker and latency history would leak across
+        service.breaker = CircuitBreaker("stub", config.gemini_breaker_failures, cooldown_s=1.0)
+        service.hedging = HedgePolicy(config.gemini_hedge_min_delay_s)
+        latencies, failures, rejected = [], [], []
+
+        def extract(invoice):
+            mime = MIME_TYPES[Path(invoice.filename).suffix]
+            start = time.perf_counter()
+            while True:
+                try:
+                    if service.extract_invoice(invoice.content, mime) is None:
+                        failures.append(invoice.filename)
+                    break
+                except CircuitOpenError:
+                    # Parked like background work in the orchestrator
+                    rejected.append(invoice.filename)
+                    service.breaker.wait_until_available()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            list(pool.map(extract, invoices))
+        result.update({
+            f"{mode}_failures": len(failures),
+            f"{mode}_circuit_rejected": len(rejected),
+            f"{mode}_model_calls": service.models.calls,
+            **percentiles(latencies, f"{mode}_"),
+        })
+        result["stalled_calls"] = max(result["stalled_calls"], service.models.stalled)
+    return result
+
+
+def bench_anomaly_scoring(corpus: Corpus, workdir: Path, args) -> Dict:
+    """
+    Price-anomaly screening of each corpus invoice against a synthetic price
+    history (--history-rows rows spread over the corpus products).
+    """
+    import numpy as np
+    from backend.core.anomaly import PriceAnomalyDetector
+
+    db = DBManager(str(workdir / "anomaly.db"))
+    db.upsert_products([
+        (p, inv.expected.numero_facture, inv.expected.date_facture)
+        for inv in corpus for p in inv.expected.products
+    ])
+    catalogue = db.get_catalogue(limit=None)
+    rng = np.random.default_rng(args.seed)
+    product_ids = rng.choice(catalogue["id"].to_numpy(), args.history_rows)
+    base = dict(zip(catalogue["id"], catalogue["prix_remise_ht"].clip(lower=0.01)))
+    prices = np.array([base[i] for i in product_ids]) * rng.lognormal(0, 0.05, args.history_rows)
+    conn = db._get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO price_history (product_id, prix_remise_ht, recorded_at) VALUES (?, ?, '2026-01-01')",
+            zip(product_ids.tolist(), prices.tolist()),
+        )
+
+    detector = PriceAnomalyDetector(db)
+    build_ms = timed(detector.refresh)
+    invoices = [inv.expected for inv in corpus]
+    for invoice in invoices:
+        detector.screen(invoice.products)  # page cache warm
+    latencies, per_line = [], []
+    for invoice in invoices:
+        ms = timed(lambda: detector.screen(invoice.products))
+        latencies.append(ms)
+        per_line.append(ms / max(1, len(invoice.products)))
+    largest = max(invoices, key=lambda inv: len(inv.products))
+    return {
+        "history_rows": args.history_rows,
+        "products": len(catalogue),
+        "summary_build_ms": round(build_ms, 1),
+        "largest_invoice_lines": len(largest.products),
+        "largest_invoice_ms": round(statistics.median(
+            timed(lambda: detector.screen(largest.products)) for _ in range(QUERY_ROUNDS)
+        ), 2),
+        "line_p50_ms": round(statistics.median(per_line), 4),
+        **percentiles(latencies, "invoice_"),
+    }
+
+
+RUNNERS = {
+    "db_upsert": bench_db_upsert,
+    "catalogue_queries": bench_catalogue_queries,
+    "api_upload": bench_api_upload,
+    "watcher_ingest": bench_watcher_ingest,
+    "gemini_tail": bench_gemini_tail,
+    "anomaly_scoring": bench_anomaly_scoring,
+}
+
+
+# ── Results ────────────────────────────────────────────────
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(args) -> Dict:
+    corpus = Corpus(args.invoices, args.seed, args.lines)
+    results = {
+        "meta": {
+            "commit": _git_commit(),
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "invoices": len(corpus),
+            "lines": corpus.total_lines,
+            "seed": args.seed,
+            "concurrency": args.concurrency,
+            "stub": asdict(args.profile),
+        },
+        "scenarios": {},
+    }
+    for name in args.scenarios:
+        with tempfile.TemporaryDirectory() as tmp:
+            print(f"▶ {name}...", file=sys.stderr)
+            results["scenarios"][name] = RUNNERS[name](corpus, Path(tmp), args)
+            print(f"  {results['scenarios'][name]}", file=sys.stderr)
+    return results
+
+
+def _better(metric: str, old: float, new: float) -> float:
+    """Relative change, positive when new is better: throughputs go up, latencies down."""
+    if not old:
+        return 0.0
+    if metric.endswith("_per_s"):
+        return (new - old) / old
+    if metric.endswith("_ms"):
+        return (old - new) / old
+    return 0.0
+
+
+def compare(base: Dict, new: Dict, threshold: float) -> List[str]:
+    """Print a metric-by-metric diff; returns the regressions beyond threshold."""
+    regressions = []
+    print(f"{base['meta']['commit']} → {new['meta']['commit']}")
+    print(f"{'scenario.metric':<44} | {'base':>10} | {'new':>10} | change")
+    for scenario, metrics in new["scenarios"].items():
+        for metric, value in metrics.items():
+            old = base["scenarios"].get(scenario, {}).get(metric)
+            if old is None or not (metric.endswith("_per_s") or metric.endswith("_ms")):
+                continue
+            change = _better(metric, old, value)
+            flag = ""
+            if change < -threshold:
+                flag = " ⚠️"
+                regressions.append(f"{scenario}.{metric}")
+            print(f"{scenario + '.' + metric:<44} | {old:>10} | {value:>10} | {change:+.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_cmd = commands.add_parser("run", help="Run the scenarios and write JSON results")
+    run_cmd.add_argument("--out", type=Path, help="Results file (default: stdout)")
+    run_cmd.add_argument("--scenarios", default=",".join(SCENARIOS))
+    run_cmd.add_argument("--invoices", type=int, default=50)
+    run_cmd.add_argument("--lines", type=int, help="Fixed line count per invoice (default: skewed 1-500)")
+    run_cmd.add_argument("--seed", type=int, default=0)
+    run_cmd.add_argument("--concurrency", type=int, default=8)
+    run_cmd.add_argument("--watcher-files", type=int, default=10)
+    run_cmd.add_argument("--latency-ms", type=float, default=StubProfile.base_latency_ms)
+    run_cmd.add_argument("--per-line-ms", type=float, default=StubProfile.per_line_ms)
+    run_cmd.add_argument("--jitter", type=float, default=StubProfile.jitter)
+    run_cmd.add_argument("--rate-limit", type=float, default=StubProfile.rate_limit,
+                         help="Share of model calls answered with 429")
+    run_cmd.add_argument("--stall-rate", type=float, default=0.05,
+                         help="gemini_tail: share of model calls that hang")
+    run_cmd.add_argument("--stall-ms", type=float, default=StubProfile.stall_ms)
+    run_cmd.add_argument("--error-burst", type=int, default=20,
+                         help="gemini_tail: consecutive calls answered 503 mid-run")
+    run_cmd.add_argument("--call-timeout-s", type=float, default=20.0,
+                         help="gemini_tail: per-call deadline")
+    run_cmd.add_argument("--history-rows", type=int, default=1_000_000,
+                         help="anomaly_scoring: price history rows to score against")
+
+    compare_cmd = commands.add_parser("compare", help="Diff two result files")
+    compare_cmd.add_argument("base", type=Path)
+    compare_cmd.add_argument("new", type=Path)
+    compare_cmd.add_argument("--threshold", type=float, default=0.10,
+                             help="Relative regression that fails the comparison")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s [%(name)s] %(levelname)s: %(message)s")
+
+    if args.command == "compare":
+        regressions = compare(
+            json.loads(args.base.read_text()), json.loads(args.new.read_text()), args.threshold
+        )
+        if regressions:
+            print(f"❌ {len(regressions)} régression(s) > {args.threshold:.0%} : {', '.join(regressions)}")
+        return 1 if regressions else 0
+
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    args.profile = StubProfile(
+        base_latency_ms=args.latency_ms, per_line_ms=args.per_line_ms,
+        jitter=args.jitter, rate_limit=args.rate_limit, seed=args.seed,
+    )
+    results = json.dumps(run(args), indent=2, ensure_ascii=False)
+    if args.out:
+        args.out.write_text(results)
+    else:
+        print(results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
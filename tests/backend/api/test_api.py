@@ -0,0 +1,267 @@
+import pytest
+from fastapi.testclient import TestClient
+from api import app, get_db
+from backend.core.db_manager import DBManager
+
+
+@pytest.fixture
+def client(tmp_path):
+    db = DBManager(str(tmp_path / "api.db"))
+    app.dependency_overrides[get_db] = lambda: db
+    yield TestClient(app), db
+    app.dependency_overrides.clear()
+
+
+def test_liveness_does_not_touch_db(client, mocker):
+    test_client, _ = client
+    spy = mocker.patch("api.get_db", side_effect=AssertionError("db used"))
+    response = test_client.get("/health/live")
+    assert response.status_code == 200
+    assert response.json() == {"status": "alive"}
+    spy.assert_not_called()
+
+
+def test_readiness_checks_schema(client, mocker):
+    test_client, db = client
+    response = test_client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["schema_up_to_date"] is True
+
+    mocker.patch.object(db, "check_ready", side_effect=RuntimeError("disk gone"))
+    assert test_client.get("/health/ready").status_code == 503
+
+
+def test_catalogue_facets(client):
+    from backend.schemas.invoice import Product
+    test_client, db = client
+    for raw, famille in [("Ciment 25kg", "Ciment"), ("Sable 0/4", "Granulats")]:
+        db.upsert_product(Product(
+            fournisseur="BigMat", designation_raw=raw, designation_fr=raw, famille=famille,
+        ), "F1", "2026-01-01")
+
+    body = test_client.get("/api/v1/catalogue/facets", params={"search": "sable"}).json()
+    assert body == {
+        "familles": [{"value": "Granulats", "count": 1}],
+        "fournisseurs": [{"value": "BigMat", "count": 1}],
+    }
+
+
+def test_catalogue_pagination(client):
+    from backend.schemas.invoice import Product
+    test_client, db = client
+    db.upsert_products([
+        (Product(fournisseur="BigMat", designation_raw=f"Vis {i:02d}", designation_fr=f"Vis {i:02d}",
+                 famille="Quincaillerie", prix_remise_ht=float(i)), "F1", "2026-01-01")
+        for i in range(25)
+    ])
+
+    body = test_client.get("/api/v1/catalogue", params={
+        "sort": "prix_remise_ht", "order": "desc", "limit": 10, "offset": 10,
+    }).json()
+    assert body["total"] == 25 and body["limit"] == 10
+    assert [p["prix_remise_ht"] for p in body["products"]] == [float(i) for i in range(14, 4, -1)]
+
+    assert test_client.get("/api/v1/catalogue", params={"sort": "id; DROP TABLE products"}).status_code == 400
+    assert test_client.get("/api/v1/catalogue", params={"limit": 0}).status_code == 422
+
+def test_patch_products(client):
+    from backend.schemas.invoice import Product
+    test_client, db = client
+    db.upsert_product(Product(
+        fournisseur="BigMat", designation_raw="Ciment 25kg", designation_fr="Ciment", famille="Ciment",
+    ), "F1", "2026-01-01")
+    row = test_client.get("/api/v1/catalogue").json()["products"][0]
+
+    response = test_client.patch("/api/v1/products", json=[
+        {"id": row["id"], "fields": {"prix_remise_ht": 10.0}, "updated_at": row["updated_at"]},
+    ])
+    assert response.status_code == 200
+    updated = response.json()["products"][0]
+    assert updated["prix_remise_ht"] == 10.0 and updated["prix_ttc_iva21"] == 12.1
+
+    # Same stale updated_at again: rejected
+    response = test_client.patch("/api/v1/products", json=[
+        {"id": row["id"], "fields": {"unite": "sac"}, "updated_at": row["updated_at"]},
+    ])
+    assert response.status_code == 409
+    assert response.json()["detail"] == {"conflicts": [row["id"]], "missing": []}
+
+    # Validation: unknown field, negative price
+    assert test_client.patch("/api/v1/products", json=[
+        {"id": row["id"], "fields": {"fournisseur": "X"}}]).status_code == 422
+    assert test_client.patch("/api/v1/products", json=[
+        {"id": row["id"], "fields": {"prix_brut_ht": -1}}]).status_code == 422
+
+
+def test_batch_upload_fans_out_in_background(client, tmp_path):
+    import io
+    import zipfile
+    from types import SimpleNamespace
+    from api import get_orchestrator
+    from backend.schemas.invoice import InvoiceResult, Product
+
+    test_client, _ = client
+    processed = []
+
+    class FakeOrchestrator:
+        def process_file(self, data, filename, priority=None):
+            processed.append(filename)
+            return SimpleNamespace(was_cached=False, invoice=InvoiceResult(
+                numero_facture=filename, products=[Product(
+                    fournisseur="BigMat", designation_raw=filename, designation_fr=filename,
+                    famille="Ciment", prix_remise_ht=5.0,
+                )]), products_added=2, products_updated=0, products_held=0)
+
+    app.dependency_overrides[get_orchestrator] = lambda: FakeOrchestrator()
+    bundle = io.BytesIO()
+    with zipfile.ZipFile(bundle, "w") as archive:
+        archive.writestr("a.pdf", b"A")
+        archive.writestr("b.png", b"B")
+
+    response = test_client.post("/api/v1/invoices/batch", files=[
+        ("files", ("bundle.zip", bundle.getvalue(), "application/zip")),
+        ("files", ("c.pdf", b"C", "application/pdf")),
+    ])
+    assert response.status_code == 202
+    job = response.json()
+    assert job["total"] == 3
+
+    # TestClient runs background tasks before returning
+    status = test_client.get(job["status_url"]).json()
+    assert status["state"] == "done" and status["counts"] == {"done": 3}
+    assert sorted(processed) == ["a.pdf", "b.png", "c.pdf"]
+
+    assert test_client.post("/api/v1/invoices/batch", files=[
+        ("files", ("notes.txt", b"x", "text/plain"))]).status_code == 400
+    assert test_client.get("/api/v1/invoices/batch/unknown").status_code == 404
+
+
+def test_event_stream_resumes_from_last_event_id(monkeypatch):
+    # The stream never ends, so drive the SSE generator directly
+    import asyncio
+    import json
+    import api
+    from backend.core.events import EventBus
+
+    bus = EventBus()
+    monkeypatch.setattr(api, "event_bus", bus)
+    monkeypatch.setattr(api, "SSE_HEARTBEAT", 0.01)
+    seen = bus.publish("pipeline.received", filename="a.pdf")
+    bus.publish("watcher.activity", filename="b.pdf", status="🔄 En cours")
+    bus.publish("pipeline.done", filename="a.pdf", products_added=3)
+
+    async def read_stream():
+        sub, replay, lost = bus.subscribe(seen.id, {"pipeline"})
+        disconnected = asyncio.Event()
+
+        async def is_disconnected():
+            return disconnected.is_set()
+
+        chunks = []
+        async for chunk in api._sse_stream(sub, replay, lost, is_disconnected):
+            chunks.append(chunk)
+            if chunk.startswith(": keep-alive"):
+                bus.publish("pipeline.failed", filename="c.pdf", error="boom")
+            if "pipeline.failed" in chunk:
+                disconnected.set()
+        return chunks, bus._subscribers
+
+    chunks, subscribers = asyncio.run(read_stream())
+    events = [json.loads(c.split("data: ", 1)[1]) for c in chunks if c.startswith("id:")]
+    assert [e["type"] for e in events] == ["pipeline.done", "pipeline.failed"]
+    assert events[0]["products_added"] == 3
+    assert subscribers == []  # released on disconnect
+
+
+def test_processing_events_pages(client):
+    test_client, db = client
+    for i in range(3):
+        db.record_processing_event("watcher", f"f{i}.pdf", "done")
+    db.record_processing_event("watcher", "bad.pdf", "error", "boom")
+
+    page = test_client.get("/api/v1/events", params={"limit": 2}).json()
+    assert [e["filename"] for e in page["events"]] == ["f0.pdf", "f1.pdf"]
+    assert page["has_more"] is True
+    page = test_client.get("/api/v1/events", params={"after": page["next_cursor"]}).json()
+    assert [e["filename"] for e in page["events"]] == ["f2.pdf", "bad.pdf"]
+
+    errors = test_client.get("/api/v1/events", params={"status": "error"}).json()
+    assert [e["message"] for e in errors["events"]] == ["boom"]
+    assert test_client.get("/api/v1/events", params={"status": "weird"}).status_code == 422
+
+
+def test_profiling_header_and_admin_endpoints(client, monkeypatch, tmp_path):
+    import api
+    test_client, _ = client
+    monkeypatch.setattr(api.config, "profiles_dir", str(tmp_path / "profiles"))
+    monkeypatch.setattr(api.config, "profiling_enabled", True)
+
+    assert test_client.get("/api/v1/admin/profiles").status_code == 403
+    monkeypatch.setattr(api.config, "admin_api_key", "secret")
+    assert test_client.get("/api/v1/admin/profiles", headers={"X-API-Key": "bad"}).status_code == 401
+
+    assert "x-profile-id" not in test_client.get("/api/v1/stats").headers
+    profile_id = test_client.get("/api/v1/stats", headers={"X-Profile": "1"}).headers["x-profile-id"]
+
+    admin = {"X-API-Key": "secret"}
+    listed = test_client.get("/api/v1/admin/profiles", headers=admin).json()
+    assert [p["name"] for p in listed["profiles"]] == [profile_id]
+    download = test_client.get(f"/api/v1/admin/profiles/{profile_id}", headers=admin)
+    assert download.status_code == 200
+    assert test_client.get("/api/v1/admin/profiles/nope.folded", headers=admin).status_code == 404
+
+
+def test_request_joins_client_trace(client, tmp_path):
+    import json
+    from backend.core import tracing
+    from backend.core.config import get_config
+    test_client, _ = client
+    path = tmp_path / "traces.jsonl"
+    tracing.configure(get_config(tracing_enabled=True, trace_file=str(path)))
+    try:
+        test_client.get("/api/v1/stats", headers={"traceparent": "00-" + "c" * 32 + "-" + "d" * 16 + "-01"})
+    finally:
+        tracing.configure(get_config(tracing_enabled=False))
+    spans = {s["name"]: s for s in map(json.loads, path.read_text().splitlines())}
+    server = spans["GET /api/v1/stats"]
+    assert server["trace_id"] == "c" * 32 and server["parent_id"] == "d" * 16
+    assert server["attributes"]["http.status_code"] == 200
+    assert spans["db.get_stats"]["parent_id"] == server["span_id"]
+
+
+def test_usage_endpoint(client, monkeypatch):
+    import api
+    from backend.core.usage import Usage
+    test_client, db = client
+    monkeypatch.setattr(api.config, "daily_token_budget", 10_000)
+    db.save_invoice("h1", "a.pdf", "BigMat", "1", "01/01/2026", 3, usage=Usage(1, 1_000_000, 0, 800.0))
+    db.record_token_usage(Usage(1, 1_000_000, 0, 800.0))
+
+    body = test_client.get("/api/v1/usage", params={"days": 7}).json()
+    assert body["budget"] == {"daily_limit": 10_000, "spent_today": 1_000_000, "remaining": 0}
+    assert body["by_day"][0]["cost_usd"] == api.config.gemini_input_price_per_m
+    assert body["by_supplier"][0]["fournisseur"] == "BigMat"
+    assert body["by_model"] == []  # booked without a model: priced at the standard rate
+    assert test_client.get("/api/v1/usage", params={"days": 0}).status_code == 422
+
+
+def test_price_review_endpoints(client):
+    from backend.schemas.invoice import Product
+    test_client, db = client
+    product = Product(fournisseur="BigMat", designation_raw="CIM 25", designation_fr="Ciment",
+                      famille="Ciment", prix_remise_ht=85.0)
+    db.hold_price_reviews([{
+        "fournisseur": "BigMat", "designation_raw": "CIM 25", "product_json": product.model_dump_json(),
+        "numero_facture": "F9", "proposed_price": 85.0, "expected_price": 8.5, "score": 9.1, "basis": "family",
+    }] * 2)
+
+    body = test_client.get("/api/v1/reviews").json()
+    first, second = [r["id"] for r in body["reviews"]]
+    assert test_client.post(f"/api/v1/reviews/{first}/approve").json()["status"] == "approved"
+    assert test_client.post(f"/api/v1/reviews/{first}/reject").status_code == 409
+    assert test_client.post(f"/api/v1/reviews/{second}/reject").json()["status"] == "rejected"
+    assert test_client.post("/api/v1/reviews/999/approve").status_code == 404
+
+    assert test_client.get("/api/v1/reviews").json()["reviews"] == []
+    assert len(test_client.get("/api/v1/reviews", params={"status": "approved"}).json()["reviews"]) == 1
+    assert test_client.get("/api/v1/catalogue").json()["products"][0]["prix_remise_ht"] == 85.0
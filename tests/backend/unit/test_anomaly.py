@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from backend.core.anomaly import PriceAnomalyDetector, group_median_mad
+from backend.core.config import AppConfig
+from backend.core.db_manager import DBManager
+from backend.core.orchestrator import ExtractionOrchestrator
+from backend.schemas.invoice import InvoiceResult, Product
+
+
+def _product(raw, price, famille="Ciment", unite="sac"):
+    return Product(
+        fournisseur="BigMat", designation_raw=raw, designation_fr=raw,
+        famille=famille, unite=unite, prix_remise_ht=price,
+    )
+
+
+@pytest.fixture
+def test_db(tmp_path):
+    return DBManager(str(tmp_path / "anomaly.db"))
+
+
+def test_group_median_mad_matches_numpy():
+    rng = np.random.default_rng(0)
+    groups = rng.integers(0, 50, 2000)
+    values = rng.normal(size=2000)
+    ids, median, mad, counts = group_median_mad(groups, values)
+    for g, m, d, n in zip(ids, median, mad, counts):
+        own = values[groups == g]
+        assert m == pytest.approx(np.median(own))
+        assert d == pytest.approx(np.median(np.abs(own - np.median(own))))
+        assert n == len(own)
+
+
+def test_jumps_against_product_and_family_history(test_db):
+    for i, price in enumerate([8.4, 8.5, 8.6, 8.5]):
+        test_db.upsert_product(_product("CIM 25", price), f"F{i}", "2026-01-01")
+    test_db.upsert_products([(_product(f"Mortier {i}", 10.0 + i % 5), "F9", "2026-01-01") for i in range(25)])
+    detector = PriceAnomalyDetector(test_db, threshold=4.0)
+
+    suspects = detector.screen([
+        _product("CIM 25", 9.1),  # ordinary increase
+        _product("CIM 25", 42.5),  # sac price read as a pallet
+        _product("Nouveau mortier", 11.0),  # new, in line with its family
+        _product("Nouveau mortier XL", 1100.0),  # new, far above its family
+        _product("Sable", 0.0),  # no price: nothing to judge
+    ])
+    assert [(s.index, s.basis) for s in suspects] == [(1, "product"), (3, "family")]
+    assert suspects[0].current_price == 8.5 and suspects[0].expected_price == pytest.approx(8.5)
+
+    # New history is picked up incrementally: the product now lives at ~42
+    for i in range(6):
+        test_db.upsert_product(_product("CIM 25", 42.5), f"G{i}", "2026-02-01")
+    assert detector.screen([_product("CIM 25", 42.0)]) == []
+
+
+def test_orchestrator_holds_suspect_lines_for_review(test_db):
+    config = AppConfig(GEMINI_API_KEY="test", DB_GROUP_COMMIT=False)
+    orch = ExtractionOrchestrator(config=config, db_manager=test_db)
+    for i in range(3):
+        orch.ingest_result(f"h{i}", f"f{i}.pdf", InvoiceResult(
+            numero_facture=f"F{i}", products=[_product("CIM 25", 8.5), _product("Sable 0/4", 3.0)]
+        ))
+
+    result = orch.ingest_result("h9", "f9.pdf", InvoiceResult(
+        numero_facture="F9", products=[_product("CIM 25", 85.0), _product("Sable 0/4", 3.1)]
+    ))
+    assert (result.products_updated, result.products_held) == (1, 1)
+    catalogue = test_db.get_catalogue()
+    assert catalogue.set_index("designation_raw").loc["CIM 25", "prix_remise_ht"] == 8.5
+
+    review = test_db.get_price_reviews()[0]
+    assert (review["proposed_price"], review["current_price"], review["numero_facture"]) == (85.0, 8.5, "F9")
+    test_db.resolve_price_review(review["id"], approve=True)
+    catalogue = test_db.get_catalogue()
+    assert catalogue.set_index("designation_raw").loc["CIM 25", "prix_remise_ht"] == 85.0
+    assert test_db.get_price_reviews() == []
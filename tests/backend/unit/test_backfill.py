@@ -0,0 +1,105 @@
+import json
+import pytest
+from types import SimpleNamespace
+from google.genai import types
+from backend.core.backfill import BatchBackfill
+from backend.core.config import AppConfig
+from backend.core.db_manager import DBManager
+from backend.core.orchestrator import ExtractionOrchestrator
+from backend.core.usage import batch_model, cost_usd
+
+
+class FakeBatchEndpoint:
+    """Local stand-in for client.batches: each job succeeds after `polls_to_finish` polls."""
+
+    def __init__(self, polls_to_finish=2):
+        self.polls_to_finish = polls_to_finish
+        self.jobs = {}
+
+    def create(self, model, src, config=None):
+        name = f"batches/{len(self.jobs) + 1}"
+        self.jobs[name] = {"src": src, "polls": 0}
+        return SimpleNamespace(name=name)
+
+    def get(self, name):
+        job = self.jobs[name]
+        job["polls"] += 1
+        if job["polls"] < self.polls_to_finish:
+            return SimpleNamespace(state=types.JobState.JOB_STATE_RUNNING, dest=None)
+        responses = [
+            SimpleNamespace(metadata=req.metadata, error=None, response=SimpleNamespace(
+                text=self._answer(req),
+                usage_metadata=SimpleNamespace(prompt_token_count=300, candidates_token_count=40),
+            ))
+            for req in job["src"]
+        ]
+        return SimpleNamespace(
+            state=types.JobState.JOB_STATE_SUCCEEDED,
+            dest=SimpleNamespace(inlined_responses=responses),
+        )
+
+    @staticmethod
+    def _answer(request):
+        label = request.contents[0].inline_data.data.decode()
+        return json.dumps({
+            "numero_facture": label, "date_facture": "01/01/2019", "fournisseur": "BigMat",
+            "products": [{
+                "fournisseur": "BigMat", "designation_raw": label, "designation_fr": label,
+                "famille": "Ciment", "prix_remise_ht": 5.0,
+            }],
+        })
+
+
+@pytest.fixture
+def archive(tmp_path):
+    root = tmp_path / "2019"
+    (root / "T1").mkdir(parents=True)
+    for i in range(5):
+        (root / "T1" / f"facture_{i}.pdf").write_bytes(f"FACT-{i}".encode())
+    (root / "notes.txt").write_text("ignored")
+    return root
+
+
+@pytest.fixture
+def orchestrator(tmp_path):
+    config = AppConfig(GEMINI_API_KEY="test", GEMINI_PROMPT_CACHE=False)
+    orch = ExtractionOrchestrator(config=config, db_manager=DBManager(str(tmp_path / "bf.db")))
+    orch.gemini._client = SimpleNamespace(batches=FakeBatchEndpoint())
+    return orch
+
+
+def test_backfill_ingests_archive_in_batches(archive, orchestrator):
+    backfill = BatchBackfill(orchestrator, batch_size=2, poll_interval=0)
+    stats = backfill.run(str(archive))
+
+    assert stats["submitted"] == 5 and stats["ingested"] == 5
+    assert len(orchestrator.gemini._client.batches.jobs) == 3
+    assert orchestrator.db.get_stats()["invoices"] == 5
+    # Each invoice carries its own tokens, priced at batch rates
+    invoices = orchestrator.db.get_invoices()
+    assert invoices["input_tokens"].tolist() == [300] * 5
+    assert invoices["model_calls"].tolist() == [1] * 5
+    assert set(invoices["model"]) == {"gemini-2.5-flash:batch"}
+    by_model = orchestrator.db.get_usage_by_model("2000-01-01")
+    assert [(row["model"], row["input_tokens"]) for row in by_model] == [("gemini-2.5-flash:batch", 1500)]
+    # Originals stay where they are
+    assert len(list((archive / "T1").glob("*.pdf"))) == 5
+
+    assert backfill.run(str(archive))["skipped"] == 5
+
+
+def test_batch_usage_is_priced_at_the_batch_factor():
+    config = AppConfig(GEMINI_API_KEY="test", GEMINI_BATCH_PRICE_FACTOR=0.5)
+    interactive = cost_usd(1_000_000, 100_000, config, "gemini-2.5-flash")
+    assert cost_usd(1_000_000, 100_000, config, batch_model("gemini-2.5-flash")) == pytest.approx(interactive / 2)
+
+
+def test_backfill_resumes_open_jobs(archive, orchestrator):
+    BatchBackfill(orchestrator, poll_interval=0).run(str(archive), wait=False)
+    assert orchestrator.db.get_open_backfill_jobs() == ["batches/1"]
+
+    # A new process picks up the submitted job instead of resubmitting the files
+    stats = BatchBackfill(orchestrator, poll_interval=0).run(str(archive))
+    assert stats["submitted"] == 0 and stats["ingested"] == 5
+    assert len(orchestrator.gemini._client.batches.jobs) == 1
+    assert orchestrator.db.get_open_backfill_jobs() == []
@@ -0,0 +1,89 @@
+import pytest
+from backend.core import bulk_import
+from backend.core.bulk_import import BulkImporter
+from backend.core.config import AppConfig
+from backend.core.db_manager import DBManager
+from backend.core.orchestrator import ExtractionOrchestrator
+from backend.schemas.invoice import InvoiceResult, Product
+
+
+def fake_extract(file_bytes, mime_type):
+    label = file_bytes.decode()
+    if label == "BROKEN":
+        raise RuntimeError("Gemini down")
+    if label == "EMPTY":
+        return None  # what GeminiService returns once its retries are spent
+    return InvoiceResult(numero_facture=label, fournisseur="BigMat", products=[Product(
+        fournisseur="BigMat", designation_raw=label, designation_fr=label,
+        famille="Ciment", prix_remise_ht=5.0,
+    )])
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "factures"
+    (root / "2021" / "Q1").mkdir(parents=True)
+    (root / "Traitees").mkdir()
+    for i in range(6):
+        (root / "2021" / "Q1" / f"f{i}.pdf").write_bytes(f"FACT-{i}".encode())
+    (root / "2021" / "doublon.pdf").write_bytes(b"FACT-0")
+    (root / "Traitees" / "old.pdf").write_bytes(b"OLD")
+    return root
+
+
+@pytest.fixture
+def orchestrator(tmp_path, mocker):
+    orch = ExtractionOrchestrator(
+        config=AppConfig(GEMINI_API_KEY="test"), db_manager=DBManager(str(tmp_path / "import.db"))
+    )
+    mocker.patch.object(orch.gemini, "extract_invoice", side_effect=fake_extract)
+    return orch
+
+
+def test_bulk_import_skips_known_and_keeps_files(tree, orchestrator):
+    reports = []
+    progress = BulkImporter(orchestrator, workers=3).run(str(tree), on_progress=reports.append)
+
+    assert progress.total == 7
+    assert (progress.added, progress.skipped, progress.failed) == (6, 1, 0)
+    assert orchestrator.gemini.extract_invoice.call_count == 6
+    assert reports[-1].eta_seconds == 0.0
+    assert len(list(tree.rglob("*.pdf"))) == 8
+
+    again = BulkImporter(orchestrator).run(str(tree))
+    assert again.skipped == 7 and orchestrator.gemini.extract_invoice.call_count == 6
+
+
+def test_bulk_import_resumes_failed_files(tree, orchestrator):
+    broken = tree / "2021" / "Q1" / "f3.pdf"
+    broken.write_bytes(b"BROKEN")
+    first = BulkImporter(orchestrator).run(str(tree))
+    assert first.failed == 1
+
+    broken.write_bytes(b"FACT-3")
+    second = BulkImporter(orchestrator).run(str(tree))
+    assert (second.added, second.failed) == (1, 0)
+
+
+def test_bulk_import_retries_files_with_nothing_extracted(tree, orchestrator, mocker):
+    (tree / "2021" / "vide.pdf").write_bytes(b"EMPTY")
+    first = BulkImporter(orchestrator).run(str(tree))
+    assert (first.added, first.failed) == (6, 1)
+
+    # Same bytes, the model answers this time: the file is not skipped as done
+    orchestrator.gemini.extract_invoice.side_effect = lambda data, mime: fake_extract(b"FACT-9", mime)
+    second = BulkImporter(orchestrator).run(str(tree))
+    assert (second.added, second.failed) == (1, 0)
+
+
+def test_bulk_import_walks_the_tree_once(tree, orchestrator, mocker):
+    walk = mocker.spy(bulk_import, "iter_invoice_files")
+    assert BulkImporter(orchestrator).run(str(tree)).total == 7
+    assert walk.call_count == 1
+
+
+def test_cli_sizes_the_scheduler_from_workers(tree, mocker):
+    orchestrator_cls = mocker.patch.object(bulk_import, "ExtractionOrchestrator")
+    mocker.patch.object(bulk_import.BulkImporter, "run", return_value=bulk_import.ImportProgress(total=0))
+    assert bulk_import.main([str(tree), "-j", "16"]) == 0
+    assert orchestrator_cls.call_args.args[0].extraction_slots == 16
@@ -37,3 +37,138 @@ def test_invoice_saving(test_db):
     test_db.save_invoice("hash123", "test.pdf", "BigMat", "F123", "2026-01-01", 1)
     assert test_db.is_invoice_processed("hash123") is True
     assert test_db.is_invoice_processed("unknown") is False
+
+def test_stats_counters_follow_writes(test_db):
+    for raw, famille, fournisseur in [
+        ("Ciment 25kg", "Ciment", "BigMat"), ("Sable 0/4", "Granulats", "BigMat"),
+        ("Ciment 35kg", "Ciment", "Point.P"),
+    ]:
+        test_db.upsert_product(Product(
+            fournisseur=fournisseur, designation_raw=raw, designation_fr=raw, famille=famille,
+        ), "F1", "2026-01-01")
+    # Re-saving the same invoice hash must not double count
+    test_db.save_invoice("h1", "a.pdf", "BigMat", "F1", "2026-01-01", 3)
+    test_db.save_invoice("h1", "a.pdf", "BigMat", "F1", "2026-01-01", 3)
+
+    assert test_db.get_stats() == {"products": 3, "invoices": 1, "families": 2}
+    assert test_db.get_facet_counts() == {
+        "famille": [("Ciment", 2), ("Granulats", 1)],
+        "fournisseur": [("BigMat", 2), ("Point.P", 1)],
+    }
+
+    conn = test_db._get_connection()
+    conn.execute("UPDATE products SET famille = 'Ciment' WHERE designation_raw = 'Sable 0/4'")
+    conn.execute("DELETE FROM products WHERE fournisseur = 'Point.P'")
+    conn.commit()
+    assert test_db.get_stats() == {"products": 2, "invoices": 1, "families": 1}
+    assert test_db.get_facet_counts() == {"famille": [("Ciment", 2)], "fournisseur": [("BigMat", 2)]}
+
+    test_db.reset_database()
+    assert test_db.get_stats() == {"products": 0, "invoices": 0, "families": 0}
+
+@pytest.mark.parametrize("order", ["asc", "desc"])
+def test_catalogue_pages_are_stable_across_suppliers(test_db, order):
+    # Same (famille, designation_fr) from many suppliers: only id tells the rows apart
+    for i in range(12):
+        test_db.upsert_product(Product(
+            fournisseur=f"Fournisseur {i}", designation_raw="Ciment 25kg", designation_fr="Ciment",
+            famille="Ciment", prix_remise_ht=8.0 + i,
+        ), "F1", "2026-01-01")
+    pages = [test_db.get_catalogue(order=order, limit=5, offset=offset)["id"].tolist() for offset in (0, 5, 10)]
+    ids = [i for page in pages for i in page]
+    assert ids == sorted(ids, reverse=order == "desc") and len(set(ids)) == 12
+
+
+def test_facets_narrowed_by_other_filters(test_db):
+    for raw, famille, fournisseur in [
+        ("Ciment 25kg", "Ciment", "BigMat"), ("Sable 0/4", "Granulats", "BigMat"),
+        ("Ciment 35kg", "Ciment", "Point.P"),
+    ]:
+        test_db.upsert_product(Product(
+            fournisseur=fournisseur, designation_raw=raw, designation_fr=raw, famille=famille,
+        ), "F1", "2026-01-01")
+
+    facets = test_db.get_facets(famille="Ciment")
+    # famille facet ignores its own filter; fournisseurs are narrowed to Ciment
+    assert facets["famille"] == [("Ciment", 2), ("Granulats", 1)]
+    assert facets["fournisseur"] == [("BigMat", 1), ("Point.P", 1)]
+
+    facets = test_db.get_facets(fournisseur="BigMat", search="ciment")
+    assert facets["famille"] == [("Ciment", 1)]
+    assert facets["fournisseur"] == [("BigMat", 1), ("Point.P", 1)]
+
+def test_update_products_is_atomic_with_optimistic_concurrency(test_db):
+    from backend.core.db_manager import UpdateConflictError
+    for raw in ("Ciment 25kg", "Sable 0/4"):
+        test_db.upsert_product(Product(
+            fournisseur="BigMat", designation_raw=raw, designation_fr=raw, famille="Ciment",
+        ), "F1", "2026-01-01")
+    rows = test_db.get_catalogue().set_index("designation_raw")
+    ciment, sable = rows.loc["Ciment 25kg"], rows.loc["Sable 0/4"]
+
+    updated = test_db.update_products([
+        (int(ciment["id"]), {"prix_remise_ht": 9.5}, ciment["updated_at"]),
+        (int(sable["id"]), {"famille": "Granulats"}, sable["updated_at"]),
+    ])
+    assert {row["id"]: row["prix_remise_ht"] for row in updated}[int(ciment["id"])] == 9.5
+    assert test_db.get_stats()["families"] == 2
+
+    # Stale updated_at on one row: nothing from the batch is written
+    with pytest.raises(UpdateConflictError) as exc:
+        test_db.update_products([
+            (int(sable["id"]), {"unite": "tonne"}, None),
+            (int(ciment["id"]), {"prix_remise_ht": 1.0}, ciment["updated_at"]),
+            (9999, {"unite": "sac"}, None),
+        ])
+    assert exc.value.conflicts == [int(ciment["id"])] and exc.value.missing == [9999]
+    rows = test_db.get_catalogue().set_index("designation_raw")
+    assert rows.loc["Sable 0/4", "unite"] == "unité"
+    assert rows.loc["Ciment 25kg", "prix_remise_ht"] == 9.5
+
+    with pytest.raises(ValueError):
+        test_db.update_products([(int(sable["id"]), {"fournisseur": "Autre"}, None)])
+
+def test_processing_events_cursor(test_db):
+    for i in range(5):
+        test_db.record_processing_event("watcher", f"f{i}.pdf", "error" if i % 2 else "done")
+    first = test_db.get_processing_events(limit=2)
+    assert [e["filename"] for e in first] == ["f0.pdf", "f1.pdf"]
+    rest = test_db.get_processing_events(after=first[-1]["id"])
+    assert [e["filename"] for e in rest] == ["f2.pdf", "f3.pdf", "f4.pdf"]
+    errors = test_db.get_processing_events(status="error")
+    assert [e["filename"] for e in errors] == ["f1.pdf", "f3.pdf"]
+
+def test_token_usage_aggregates(test_db):
+    from backend.core.usage import Usage
+    test_db.save_invoice("h1", "a.pdf", "BigMat", "1", "01/01/2026", 3, usage=Usage(1, 1000, 200, 900.0))
+    test_db.save_invoice("h2", "b.pdf", "BigMat", "2", "01/01/2026", 5, usage=Usage(2, 3000, 400, 2100.0))
+    test_db.save_invoice("h3", "c.pdf", "Leroy", "3", "01/01/2026", 1, usage=Usage(1, 500, 50, 300.0))
+    test_db.save_invoice("h4", "d.pdf", "Old", "4", "01/01/2026", 1)  # before accounting existed
+
+    by_supplier = test_db.get_usage_by_supplier("2000-01-01")
+    assert [r["fournisseur"] for r in by_supplier] == ["BigMat", "Leroy"]
+    assert by_supplier[0]["invoices"] == 2 and by_supplier[0]["input_tokens"] == 4000
+    assert by_supplier[0]["avg_latency_ms"] == 1500.0
+
+    test_db.record_token_usage(Usage(1, 1000, 200, 900.0), day="2026-01-01")
+    test_db.record_token_usage(Usage(2, 3000, 400, 2100.0), day="2026-01-01")
+    test_db.record_token_usage(Usage(), day="2026-01-02")  # no calls: not booked
+    assert test_db.get_tokens_spent("2026-01-01") == 4600
+    assert [d["day"] for d in test_db.get_usage_by_day("2026-01-01")] == ["2026-01-01"]
+
+def test_token_usage_per_model(test_db):
+    from backend.core.usage import Usage, record_call, record_escalation, track_usage
+    with track_usage() as usage:
+        record_call(None, 100.0, "fast-model")
+        record_escalation("fast-model")
+        record_call(None, 900.0, "standard-model")
+    test_db.record_token_usage(usage, day="2026-01-01")
+    test_db.record_token_usage(Usage(1, 10, 1, 50.0, by_model={"fast-model": Usage(1, 10, 1, 50.0)}), day="2026-01-02")
+    test_db.save_invoice("h1", "a.pdf", "BigMat", "1", "01/01/2026", 3, usage=usage, cost_usd=0.5)
+
+    rows = {r["model"]: r for r in test_db.get_usage_by_model("2026-01-01")}
+    assert rows["fast-model"]["calls"] == 2 and rows["fast-model"]["escalations"] == 1
+    assert rows["standard-model"]["avg_latency_ms"] == 900.0
+    assert len(test_db.get_usage_by_model("2026-01-01", per_day=True)) == 3
+    supplier = test_db.get_usage_by_supplier("2000-01-01")[0]
+    assert supplier["escalated"] == 1 and supplier["cost_usd"] == 0.5
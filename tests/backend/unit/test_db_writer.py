@@ -0,0 +1,69 @@
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from backend.core.db_manager import DBManager
+from backend.core.db_writer import CatalogueWriter
+from backend.schemas.invoice import Product
+
+
+def make_products(prefix, n):
+    return [Product(
+        fournisseur="BigMat", designation_raw=f"{prefix}-{i}", designation_fr=f"{prefix}-{i}",
+        famille="Ciment", prix_remise_ht=1.0 + i,
+    ) for i in range(n)]
+
+
+@pytest.fixture
+def writer(tmp_path):
+    w = CatalogueWriter(DBManager(str(tmp_path / "writer.db")), max_wait_ms=20)
+    yield w
+    w.close()
+
+
+def test_writer_resolves_each_caller_counts(writer):
+    with ThreadPoolExecutor(10) as pool:
+        futures = [
+            pool.submit(lambda k: writer.submit(make_products(f"inv{k % 5}", 4), f"F{k}", "").result(), k)
+            for k in range(10)
+        ]
+        results = [f.result() for f in futures]
+
+    # 5 distinct invoices written twice: 20 adds then 20 updates overall
+    assert sum(a for a, _ in results) == 20
+    assert sum(u for _, u in results) == 20
+    assert writer.db.get_stats()["products"] == 20
+
+
+def test_writer_coalesces_commits(writer, mocker):
+    spy = mocker.spy(writer.db, "upsert_products")
+    futures = [writer.submit(make_products(f"p{k}", 2), "F", "") for k in range(20)]
+    assert [f.result() for f in futures] == [(2, 0)] * 20
+    assert spy.call_count < 20
+
+
+def test_bad_request_does_not_fail_its_group(writer, mocker):
+    upsert = writer.db.upsert_products
+
+    def reject_bad_rows(rows):
+        if any(product.designation_raw.startswith("bad") for product, _, _ in rows):
+            raise ValueError("constraint failed")
+        return upsert(rows)
+
+    mocker.patch.object(writer.db, "upsert_products", side_effect=reject_bad_rows)
+    futures = [writer.submit(make_products("bad" if k == 3 else f"ok{k}", 2), "F", "") for k in range(6)]
+    for k, future in enumerate(futures):
+        if k == 3:
+            with pytest.raises(ValueError):
+                future.result()
+        else:
+            assert future.result() == (2, 0)
+    assert writer.db.get_stats()["products"] == 10
+
+
+def test_orchestrator_uses_shared_writer(tmp_path):
+    from backend.core.config import AppConfig
+    from backend.core.orchestrator import ExtractionOrchestrator
+
+    db = DBManager(str(tmp_path / "shared.db"))
+    first = ExtractionOrchestrator(config=AppConfig(GEMINI_API_KEY="test"), db_manager=db)
+    second = ExtractionOrchestrator(config=AppConfig(GEMINI_API_KEY="test"), db_manager=db)
+    assert first.writer is second.writer
@@ -0,0 +1,60 @@
+import asyncio
+import threading
+from backend.core.events import EventBus
+
+
+def test_publish_from_threads_reaches_async_subscriber():
+    bus = EventBus()
+
+    async def scenario():
+        sub, replay, lost = bus.subscribe(types={"pipeline"})
+        assert replay == [] and lost is False
+        threads = [
+            threading.Thread(target=bus.publish, args=(kind,), kwargs={"filename": f"f{i}"})
+            for i, kind in enumerate(["pipeline.received", "watcher.activity", "pipeline.done"])
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        received = [await sub.get(timeout=1), await sub.get(timeout=1)]
+        assert await sub.get(timeout=0.05) is None  # watcher event filtered out
+        sub.close()
+        return received
+
+    received = asyncio.run(scenario())
+    assert sorted(e.type for e in received) == ["pipeline.done", "pipeline.received"]
+
+
+def test_resume_replays_missed_events_and_flags_gaps():
+    bus = EventBus(history_size=3)
+    first = bus.publish("job.done", job_id="a")
+    for i in range(4):
+        bus.publish("job.file", job_id="b", index=i)
+
+    async def resume(last_id):
+        sub, replay, lost = bus.subscribe(last_id)
+        sub.close()
+        return [e.data.get("index") for e in replay], lost
+
+    # Last seen event still in the buffer: exact replay
+    assert asyncio.run(resume(bus.last_id - 2)) == ([2, 3], False)
+    # Older than the ring buffer: the client must resync
+    assert asyncio.run(resume(first.id))[1] is True
+
+
+def test_slow_subscriber_is_dropped_not_blocking(monkeypatch):
+    import backend.core.events as events
+    monkeypatch.setattr(events, "SUBSCRIBER_QUEUE_SIZE", 2)
+    bus = EventBus()
+
+    async def scenario():
+        sub, _, _ = bus.subscribe()
+        for i in range(5):
+            bus.publish("pipeline.done", index=i)
+        await asyncio.sleep(0.01)  # let call_soon_threadsafe deliveries run
+        drained = [(await sub.get(timeout=0.1)).data["index"] for _ in range(2)]
+        return drained, sub.exhausted
+
+    drained, exhausted = asyncio.run(scenario())
+    assert drained == [0, 1] and exhausted
@@ -0,0 +1,87 @@
+import threading
+import pytest
+from backend.core.config import AppConfig
+from backend.core.db_manager import DBManager
+from backend.core.folder_watcher import DoclingWatcher, InvoiceHandler
+from backend.core.usage import Usage
+
+
+@pytest.fixture
+def watcher(tmp_path, mocker):
+    orchestrator = mocker.Mock()
+    orchestrator.db = DBManager(str(tmp_path / "watcher.db"))
+    orchestrator.config = AppConfig(GEMINI_API_KEY="test", DAILY_TOKEN_BUDGET=1000)
+    return DoclingWatcher(orchestrator, str(tmp_path / "inbox"), log_size=3)
+
+
+def test_activity_log_is_bounded_and_newest_first(watcher):
+    for i in range(5):
+        watcher.add_activity(f"f{i}.pdf", "✅ Terminé", kind="done")
+    assert [e["filename"] for e in watcher.get_activity()] == ["f4.pdf", "f3.pdf", "f2.pdf"]
+
+
+def test_activity_is_persisted(watcher):
+    watcher.add_activity("a.pdf", "🔄 En cours", size="1.0 KB")
+    watcher.add_activity("a.pdf", "❌ Erreur: boom", kind="error", message="boom")
+    events = watcher.orchestrator.db.get_processing_events()
+    assert [(e["status"], e["message"]) for e in events] == [
+        ("processing", "🔄 En cours"), ("error", "boom"),
+    ]
+    assert events[0]["size"] == "1.0 KB"
+
+
+def test_concurrent_writers(watcher):
+    threads = [
+        threading.Thread(target=lambda n=n: [watcher.add_activity(f"{n}-{i}.pdf", "ok") for i in range(20)])
+        for n in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(watcher.get_activity()) == 3
+    assert len(watcher.orchestrator.db.get_processing_events(limit=500)) == 80
+
+
+def test_files_are_deferred_once_token_budget_is_spent(watcher, tmp_path):
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    watcher.handler = InvoiceHandler(watcher.orchestrator, str(inbox), watcher)
+    invoice = inbox / "late.pdf"
+    invoice.write_bytes(b"%PDF")
+
+    watcher.orchestrator.db.record_token_usage(Usage(3, 900, 150, 0.0))
+    watcher.handler.process_file(invoice)
+    assert invoice.exists()
+    watcher.orchestrator.process_file.assert_not_called()
+    assert watcher.get_activity()[0]["status"].startswith("⏸️")
+    assert watcher.resume_deferred() == 0
+
+    watcher.budget.daily_limit = 10_000  # e.g. the next day, or a raised budget
+    assert watcher.resume_deferred() == 1
+    watcher.orchestrator.process_file.assert_called_once()
+    assert watcher.orchestrator.process_file.call_args.kwargs["priority"] == "watcher"
+    assert (inbox / "Traitees" / "late.pdf").exists()
+    assert watcher.orchestrator.db.get_processing_events(status="deferred")[0]["filename"] == "late.pdf"
+
+
+def test_deferred_scan_files_resume_as_backfill(watcher, tmp_path):
+    inbox = tmp_path / "inbox"
+    (inbox / "2024").mkdir(parents=True)
+    (inbox / "2024" / "old.pdf").write_bytes(b"%PDF")
+    watcher.handler = InvoiceHandler(watcher.orchestrator, str(inbox), watcher)
+
+    watcher.orchestrator.db.record_token_usage(Usage(3, 900, 150, 0.0))
+    watcher.handler.scan_existing()
+    watcher.budget.daily_limit = 10_000
+    assert watcher.resume_deferred() == 1
+    assert watcher.orchestrator.process_file.call_args.kwargs["priority"] == "backfill"
+
+
+def test_startup_scan_runs_as_backfill(watcher, tmp_path):
+    inbox = tmp_path / "inbox"
+    (inbox / "2024").mkdir(parents=True)
+    (inbox / "2024" / "old.pdf").write_bytes(b"%PDF")
+    handler = InvoiceHandler(watcher.orchestrator, str(inbox), watcher)
+    handler.scan_existing()
+    assert watcher.orchestrator.process_file.call_args.kwargs["priority"] == "backfill"
@@ -1,11 +1,12 @@
 import pytest
+from types import SimpleNamespace
 from unittest.mock import MagicMock
-from backend.services.gemini_service import GeminiService
+from backend.services.gemini_service import GeminiService, StreamingInvoiceParser, repair_json
 from backend.core.config import AppConfig
 
 @pytest.fixture
 def gemini_svc():
-    config = AppConfig(GEMINI_API_KEY="AIzaSyTestKey")
+    config = AppConfig(GEMINI_API_KEY="AIzaSyTestKey", GEMINI_PROMPT_CACHE=False, GEMINI_MODEL_ROUTING=False)
     return GeminiService(config=config)
 
 def test_extract_invoice_success(gemini_svc, mocker):
@@ -37,3 +38,232 @@ def test_extract_api_error(gemini_svc, mocker):
     result = gemini_svc.extract_invoice(b"filedata", "application/pdf")
     # Due to retry loop it will exhaust and return None
     assert result is None
+
+STREAMED_JSON = (
+    '{"numero_facture": "F9", "date_facture": "03/03/2026", "fournisseur": "BigMat", '
+    '"products": [{"fournisseur": "BigMat", "designation_raw": "Morter {gris} \\"M5\\"", '
+    '"designation_fr": "Mortier", "famille": "Maçonnerie", "prix_remise_ht": 4.0}, '
+    '{"fournisseur": "BigMat", "designation_raw": "Sorra [0-4]", "designation_fr": "Sable", '
+    '"famille": "Granulat", "prix_remise_ht": 2.0}]}'
+)
+
+def test_streaming_parser_emits_products_incrementally():
+    parser = StreamingInvoiceParser()
+    emitted = []
+    for i in range(0, len(STREAMED_JSON), 7):
+        emitted.extend(parser.feed(STREAMED_JSON[i:i + 7]))
+        if len(emitted) == 1:
+            # First product is available before the document is complete
+            assert not parser.text.endswith("]}")
+    assert [p["designation_fr"] for p in emitted] == ["Mortier", "Sable"]
+    assert emitted[0]["designation_raw"] == 'Morter {gris} "M5"'
+    assert parser.header == {
+        "numero_facture": "F9", "date_facture": "03/03/2026", "fournisseur": "BigMat"
+    }
+
+def test_extract_invoice_stream(gemini_svc):
+    mock_client = MagicMock()
+    mock_client.models.generate_content_stream.return_value = [
+        MagicMock(text=STREAMED_JSON[i:i + 50]) for i in range(0, len(STREAMED_JSON), 50)
+    ]
+    gemini_svc._client = mock_client
+    received = []
+
+    result = gemini_svc.extract_invoice_stream(
+        b"filedata", "application/pdf",
+        on_product=lambda product, header: received.append((product.designation_fr, header.numero_facture)),
+    )
+    assert received == [("Mortier", "F9"), ("Sable", "F9")]
+    assert len(result.products) == 2
+
+def test_extract_invoice_stream_coerces_a_non_string_header(gemini_svc):
+    streamed = STREAMED_JSON.replace('"numero_facture": "F9"', '"numero_facture": 12345')
+    mock_client = MagicMock()
+    mock_client.models.generate_content_stream.return_value = [MagicMock(text=streamed)]
+    gemini_svc._client = mock_client
+    headers = []
+
+    result = gemini_svc.extract_invoice_stream(
+        b"filedata", "application/pdf", on_product=lambda product, header: headers.append(header.numero_facture),
+    )
+    assert headers == ["12345", "12345"]
+    assert result.numero_facture == "12345" and len(result.products) == 2
+
+def test_schema_mode_sends_response_schema(gemini_svc):
+    mock_client = MagicMock()
+    mock_client.models.generate_content.return_value = MagicMock(
+        text='{"numero_facture": "F1", "products": []}'
+    )
+    gemini_svc._client = mock_client
+
+    gemini_svc.extract_invoice(b"filedata", "application/pdf")
+    kwargs = mock_client.models.generate_content.call_args.kwargs
+    assert kwargs["config"].response_schema is not None
+    # The prose JSON description is not needed when the schema constrains output
+    assert "Réponds UNIQUEMENT" not in kwargs["config"].system_instruction
+
+def test_extract_retries_unparseable_response(gemini_svc):
+    mock_client = MagicMock()
+    mock_client.models.generate_content.side_effect = [
+        MagicMock(text="INVALID JSON"),
+        MagicMock(text='{"numero_facture": "F2", "products": []}'),
+    ]
+    gemini_svc._client = mock_client
+
+    result = gemini_svc.extract_invoice(b"filedata", "application/pdf")
+    assert result.numero_facture == "F2"
+    assert mock_client.models.generate_content.call_count == 2
+
+def test_repair_only_reextracts_invalid_products(gemini_svc):
+    bad_response = (
+        '```json\n{"numero_facture": "F3", "products": ['
+        '{"fournisseur": "BigMat", "designation_raw": "Ciment", "designation_fr": "Ciment", '
+        '"famille": "Ciment", "prix_remise_ht": 8.5},'
+        '{"fournisseur": "BigMat", "designation_raw": "Sorra", "prix_remise_ht": "deux"},'
+        ']}\n```'
+    )
+    repaired = (
+        '[{"fournisseur": "BigMat", "designation_raw": "Sorra", "designation_fr": "Sable", '
+        '"famille": "Granulat", "prix_remise_ht": 2.0}]'
+    )
+    mock_client = MagicMock()
+    mock_client.models.generate_content.side_effect = [
+        MagicMock(text=bad_response), MagicMock(text=repaired),
+    ]
+    gemini_svc._client = mock_client
+
+    result = gemini_svc.extract_invoice(b"filedata", "application/pdf")
+    assert [p.designation_fr for p in result.products] == ["Ciment", "Sable"]
+    repair_call = mock_client.models.generate_content.call_args_list[1].kwargs
+    # Only the broken line is sent back, without the document
+    assert "Sorra" in repair_call["contents"][0] and "Ciment" not in repair_call["contents"][0]
+
+def test_repair_json_closes_truncated_document():
+    truncated = '{"numero_facture": "F4", "products": [{"designation_raw": "A"}, {"designation_raw": "B'
+    assert repair_json(truncated) == {"numero_facture": "F4", "products": [{"designation_raw": "A"}]}
+
+class TokenCountingClient:
+    """Local stand-in for genai.Client that bills input tokens (1 per word)."""
+
+    def __init__(self, caching_available=True):
+        self.caching_available = caching_available
+        self.caches_created = []
+        self.billed_input_tokens = 0
+        self.models = SimpleNamespace(generate_content=self._generate_content)
+        self.caches = SimpleNamespace(create=self._create_cache)
+
+    def _create_cache(self, model, config):
+        if not self.caching_available:
+            raise RuntimeError("400 INVALID_ARGUMENT: caching not supported")
+        self.caches_created.append(config.system_instruction)
+        return SimpleNamespace(name=f"cachedContents/{len(self.caches_created)}")
+
+    def _generate_content(self, model, contents, config):
+        text = " ".join(c for c in contents if isinstance(c, str))
+        if config.system_instruction:
+            text += " " + config.system_instruction
+        self.billed_input_tokens += len(text.split())
+        return SimpleNamespace(text='{"numero_facture": "F1", "products": []}', usage_metadata=None)
+
+@pytest.fixture
+def caching_svc(monkeypatch):
+    # Pretend the instructions are large enough to be cached
+    monkeypatch.setattr("backend.services.gemini_service.CACHE_MIN_TOKENS", 0)
+    monkeypatch.setattr("backend.services.gemini_service.CACHE_MIN_TOKENS_PRO", 0)
+    return GeminiService(config=AppConfig(GEMINI_API_KEY="AIzaSyTestKey", GEMINI_PROMPT_CACHE=True))
+
+def test_prompt_cache_skipped_below_minimum_size():
+    assert AppConfig(GEMINI_API_KEY="AIzaSyTestKey").gemini_prompt_cache is False
+    svc = GeminiService(config=AppConfig(GEMINI_API_KEY="AIzaSyTestKey", GEMINI_PROMPT_CACHE=True))
+    assert svc._prompt_caches == {}
+
+def test_prompt_cache_sends_instructions_once(caching_svc):
+    cached_client = TokenCountingClient()
+    caching_svc._client = cached_client
+    for _ in range(5):
+        assert caching_svc.extract_from_text("Ciment 25kg 8,50") is not None
+    assert len(cached_client.caches_created) == 1
+
+    fallback_svc = GeminiService(config=AppConfig(GEMINI_API_KEY="AIzaSyTestKey", GEMINI_PROMPT_CACHE=False))
+    uncached_client = TokenCountingClient()
+    fallback_svc._client = uncached_client
+    for _ in range(5):
+        fallback_svc.extract_from_text("Ciment 25kg 8,50")
+    assert cached_client.billed_input_tokens * 10 < uncached_client.billed_input_tokens
+
+def test_prompt_cache_refreshes_after_ttl(caching_svc, mocker):
+    client = TokenCountingClient()
+    caching_svc._client = client
+    clock = mocker.patch("backend.services.gemini_service.time.monotonic", return_value=1000.0)
+    caching_svc.extract_from_text("x")
+    clock.return_value = 1000.0 + caching_svc.config.gemini_prompt_cache_ttl
+    caching_svc.extract_from_text("x")
+    assert len(client.caches_created) == 2
+
+def test_prompt_cache_falls_back_to_system_instruction(caching_svc):
+    client = TokenCountingClient(caching_available=False)
+    caching_svc._client = client
+
+    result = caching_svc.extract_from_text("Ciment 25kg 8,50")
+    assert result.numero_facture == "F1"
+    assert client.billed_input_tokens > 100  # instructions sent inline
+
+def test_usage_metadata_is_booked_to_active_scope(gemini_svc):
+    from backend.core.usage import track_usage
+    mock_client = MagicMock()
+    mock_client.models.generate_content.return_value = SimpleNamespace(
+        text='{"numero_facture": "F1", "products": []}',
+        usage_metadata=SimpleNamespace(prompt_token_count=1200, candidates_token_count=80),
+    )
+    gemini_svc._client = mock_client
+
+    with track_usage() as usage:
+        gemini_svc.extract_invoice(b"filedata", "application/pdf")
+    assert (usage.calls, usage.input_tokens, usage.output_tokens) == (1, 1200, 80)
+    assert usage.latency_ms > 0
+
+def _answer(text, tokens=100):
+    return SimpleNamespace(
+        text=text, usage_metadata=SimpleNamespace(prompt_token_count=tokens, candidates_token_count=10),
+    )
+
+def test_fast_tier_escalates_when_its_answer_fails_validation():
+    from backend.core.usage import track_usage
+    svc = GeminiService(config=AppConfig(GEMINI_API_KEY="AIzaSyTestKey", GEMINI_PROMPT_CACHE=False))
+    good = (
+        '{"numero_facture": "F1", "fournisseur": "BigMat", "products": [{"fournisseur": "BigMat",'
+        ' "designation_raw": "CIM 25",'
+        ' "designation_fr": "Ciment 25kg", "famille": "Maçonnerie", "unite": "sac", "prix_brut_ht": 10,'
+        ' "remise_pct": 10, "prix_remise_ht": 9, "prix_ttc_iva21": 10.89}]}'
+    )
+    svc._client = MagicMock()
+    svc._client.models.generate_content.side_effect = [
+        _answer('{"numero_facture": "", "fournisseur": "", "products": []}'), _answer(good, 300),
+    ]
+
+    with track_usage() as usage:
+        result = svc.extract_invoice(b"small receipt", "image/jpeg")
+    assert result.fournisseur == "BigMat"
+    models = [c.kwargs["model"] for c in svc._client.models.generate_content.call_args_list]
+    assert models == [svc.config.gemini_fast_model, svc.config.gemini_model]
+    assert usage.escalations == 1 and usage.model == svc.config.gemini_model
+    assert usage.by_model[svc.config.gemini_fast_model].input_tokens == 100
+    assert usage.by_model[svc.config.gemini_model].input_tokens == 300
+
+    # A sound fast answer is kept as is
+    svc._client.models.generate_content.side_effect = [_answer(good)]
+    assert svc.extract_invoice(b"small receipt", "image/jpeg").numero_facture == "F1"
+    assert svc._client.models.generate_content.call_args.kwargs["model"] == svc.config.gemini_fast_model
+
+def test_packed_request_returns_one_result_per_document(gemini_svc):
+    gemini_svc._client = MagicMock()
+    gemini_svc._client.models.generate_content.return_value = _answer(
+        '[{"numero_facture": "T1", "products": []}, {"numero_facture": "T2", "products": []}]'
+    )
+    results = gemini_svc.extract_invoices([(b"a", "image/jpeg"), (b"b", "image/png")])
+    assert [r.numero_facture for r in results] == ["T1", "T2"]
+    contents = gemini_svc._client.models.generate_content.call_args.kwargs["contents"]
+    assert "2 documents" in contents[0] and contents[1] == "Document 1 :"
+
+    # Results that cannot be matched back to the documents are discarded
+    assert gemini_svc.extract_invoices([(b"a", "image/jpeg"), (b"b", "image/png"), (b"c", "image/png")]) is None
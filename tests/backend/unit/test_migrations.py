@@ -0,0 +1,92 @@
+import sqlite3
+import pytest
+from backend.core.db_manager import DBManager
+from backend.core.migrations import LATEST_VERSION, get_version
+
+
+@pytest.fixture
+def db(tmp_path):
+    return DBManager(str(tmp_path / "migrations.db"))
+
+
+def query_plan(db, sql, params=()):
+    conn = db._get_connection()
+    return " | ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+
+
+def test_fresh_database_is_at_latest_version(db):
+    assert get_version(db._get_connection()) == LATEST_VERSION
+
+
+def test_legacy_database_upgraded_in_place(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, fournisseur TEXT NOT NULL,
+        designation_raw TEXT NOT NULL, designation_fr TEXT, famille TEXT, unite TEXT,
+        prix_brut_ht REAL DEFAULT 0.0, remise_pct REAL, prix_remise_ht REAL DEFAULT 0.0,
+        prix_ttc_iva21 REAL DEFAULT 0.0, numero_facture TEXT, date_facture TEXT,
+        updated_at TIMESTAMP NOT NULL, UNIQUE(designation_raw, fournisseur))""")
+    conn.execute("""CREATE TABLE invoices (
+        file_hash TEXT PRIMARY KEY, filename TEXT NOT NULL, fournisseur TEXT,
+        numero_facture TEXT, date_facture TEXT, nb_products INTEGER DEFAULT 0,
+        processed_at TIMESTAMP NOT NULL)""")
+    conn.execute(
+        "INSERT INTO products (fournisseur, designation_raw, famille, updated_at) "
+        "VALUES ('BigMat', 'Ciment', 'Ciment', '2025-01-01')"
+    )
+    conn.commit()
+    conn.close()
+
+    db = DBManager(path)
+    assert get_version(db._get_connection()) == LATEST_VERSION
+    assert db.get_stats()["products"] == 1
+    indexes = {row[0] for row in db._get_connection().execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index'"
+    )}
+    assert {"idx_products_famille", "idx_products_fournisseur", "idx_invoices_processed_at"} <= indexes
+
+
+@pytest.mark.parametrize("filters, index", [
+    ({}, "idx_products_famille"),
+    ({"famille": "Ciment"}, "idx_products_famille"),
+    ({"fournisseur": "BigMat"}, "idx_products_fournisseur"),
+    ({"famille": "Ciment", "fournisseur": "BigMat"}, "idx_products_fournisseur"),
+    ({"search": "sable"}, "idx_products_famille"),
+])
+def test_catalogue_queries_use_indexes(db, filters, index):
+    plan = query_plan(db, *DBManager._catalogue_query(**filters))
+    assert index in plan
+    assert "TEMP B-TREE" not in plan
+
+
+@pytest.mark.parametrize("numero", [None, "F-2024-001"])
+def test_invoice_queries_use_indexes(db, numero):
+    plan = query_plan(db, *DBManager._invoices_query(numero))
+    assert "USING INDEX idx_invoices_" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_stats_and_upsert_lookups_use_indexes(db):
+    assert "COVERING INDEX idx_products_famille" in query_plan(
+        db, "SELECT COUNT(DISTINCT famille) FROM products"
+    )
+    assert "USING COVERING INDEX" in query_plan(
+        db, "SELECT id FROM products WHERE designation_raw = ? AND fournisseur = ?", ("a", "b")
+    )
+
+
+def test_facet_query_grouped_on_fournisseur_index(db):
+    plan = query_plan(db, *DBManager._facet_query("famille", fournisseur="BigMat"))
+    assert "idx_products_fournisseur" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+@pytest.mark.parametrize("filters, index", [
+    ({"status": "error"}, "idx_events_status"),
+    ({"filename": "a.pdf"}, "idx_events_filename"),
+])
+def test_processing_event_queries_use_indexes(db, filters, index):
+    plan = query_plan(db, *DBManager._processing_events_query(after=10, **filters))
+    assert index in plan
+    assert "TEMP B-TREE" not in plan
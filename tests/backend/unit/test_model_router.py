@@ -0,0 +1,45 @@
+from backend.core.config import AppConfig
+from backend.schemas.invoice import InvoiceResult, Product
+from backend.services.model_router import FAST, STANDARD, count_pages, route, validate_extraction
+
+
+def _product(**overrides):
+    fields = dict(
+        fournisseur="BigMat", designation_raw="CIM 25", designation_fr="Ciment 25kg", famille="Maçonnerie", unite="sac",
+        prix_brut_ht=10.0, remise_pct=10.0, prix_remise_ht=9.0, prix_ttc_iva21=10.89,
+    )
+    fields.update(overrides)
+    return Product(**fields)
+
+
+def test_route_sends_only_small_single_page_documents_to_fast_tier():
+    config = AppConfig(GEMINI_API_KEY="test", GEMINI_FAST_MAX_BYTES=1000)
+    one_page = b"%PDF-1.7 /Type /Pages /Type /Page"
+    assert count_pages(one_page, "application/pdf") == 1
+    assert count_pages(one_page + b" /Type/Page", "application/pdf") == 2
+    assert route(one_page, "application/pdf", config) == FAST
+    assert route(b"x" * 2000, "image/jpeg", config) == STANDARD
+    assert route(one_page + b" /Type/Page", "application/pdf", config) == STANDARD
+    assert route(one_page, "application/pdf", config.model_copy(update={"gemini_model_routing": False})) == STANDARD
+
+
+def test_route_reads_page_tree_count_and_distrusts_unknown_page_counts():
+    config = AppConfig(GEMINI_API_KEY="test", GEMINI_FAST_MAX_BYTES=1000)
+    # Page objects compressed in an object stream: only the page tree (if any) is readable
+    tree_only = b"%PDF-1.7 << /Type /Pages /Kids [4 0 R 5 0 R] /Count 3 >> << /Count 2 >> /ObjStm"
+    assert count_pages(tree_only, "application/pdf") == 3
+    assert route(tree_only, "application/pdf", config) == STANDARD
+    opaque = b"%PDF-1.7 /Type /ObjStm /Filter /FlateDecode stream ... endstream"
+    assert count_pages(opaque, "application/pdf") is None
+    assert route(opaque, "application/pdf", config) == STANDARD
+    assert route(b"%PDF-1.7 << /Type /Pages /Count 1 >> /ObjStm", "application/pdf", config) == FAST
+
+
+def test_validation_flags_doubtful_extractions():
+    sound = InvoiceResult(numero_facture="F1", fournisseur="BigMat", products=[_product()])
+    assert validate_extraction(sound, pages=1) == []
+    assert validate_extraction(None, pages=1) == ["unparseable"]
+    assert validate_extraction(InvoiceResult(products=[]), pages=1) == ["no_products"]
+
+    doubtful = InvoiceResult(products=[_product(prix_ttc_iva21=25.0), _product(famille="")])
+    assert validate_extraction(doubtful, pages=3) == ["missing_header", "line_count", "price_mismatch", "empty_fields"]
@@ -1,5 +1,6 @@
 import pytest
 from unittest.mock import MagicMock
+from backend.core.config import AppConfig
 from backend.core.orchestrator import ExtractionOrchestrator
 from backend.schemas.invoice import InvoiceResult, Product
 
@@ -12,7 +13,7 @@ def mock_db():
 
 @pytest.fixture
 def mock_config():
-    return MagicMock()
+    return AppConfig(GEMINI_API_KEY="test", DB_GROUP_COMMIT=False, ANOMALY_DETECTION=False)
 
 def test_orchestrator_cache_hit(mock_db, mock_config):
     mock_db.is_invoice_processed.return_value = True
@@ -41,3 +42,188 @@ def test_orchestrator_success(mock_db, mock_config, mocker):
     assert result.was_cached is False
     assert result.products_added == 1
     mock_db.save_invoice.assert_called_once()
+
+def test_orchestrator_streaming_upserts_each_product(mock_db, mock_config, mocker):
+    orch = ExtractionOrchestrator(config=mock_config, db_manager=mock_db)
+    header = InvoiceResult(numero_facture="S1", date_facture="02/02/2026", fournisseur="BigMat")
+    products = [
+        Product(
+            fournisseur="BigMat", designation_raw=f"Article {i}", designation_fr=f"Article {i}",
+            famille="Granulat", unite="kg", prix_remise_ht=1.0,
+        )
+        for i in range(3)
+    ]
+
+    def fake_stream(file_bytes, mime_type, on_product=None):
+        for p in products:
+            on_product(p, header)
+        return header.model_copy(update={"products": products})
+
+    mocker.patch.object(orch.gemini, "extract_invoice_stream", side_effect=fake_stream)
+    statuses = []
+
+    result = orch.process_file(b"data", "test.pdf", on_status=statuses.append, stream=True)
+    assert result.products_added == 3
+    assert mock_db.upsert_product.call_count == 3
+    mock_db.upsert_product.assert_called_with(products[-1], "S1", "02/02/2026")
+    mock_db.save_invoice.assert_called_once()
+    assert statuses[-1].startswith("✅")
+
+@pytest.mark.parametrize("group_commit", [False, True])
+def test_orchestrator_streaming_records_invoice_when_stream_breaks(mock_db, mock_config, mocker, group_commit):
+    orch = ExtractionOrchestrator(config=mock_config, db_manager=mock_db)
+    if group_commit:
+        orch.writer = MagicMock()
+        orch.writer.submit.return_value.result.return_value = (1, 0)
+    header = InvoiceResult(numero_facture="S2", date_facture="03/02/2026", fournisseur="BigMat")
+    products = [
+        Product(
+            fournisseur="BigMat", designation_raw=f"Article {i}", designation_fr=f"Article {i}",
+            famille="Granulat", unite="kg", prix_remise_ht=1.0,
+        )
+        for i in range(2)
+    ]
+
+    def broken_stream(file_bytes, mime_type, on_product=None):
+        for p in products:
+            on_product(p, header)
+        return None  # connection lost before the end of the JSON
+
+    mocker.patch.object(orch.gemini, "extract_invoice_stream", side_effect=broken_stream)
+
+    result = orch.process_file(b"data", "cut.pdf", stream=True)
+    assert result.products_added == 2
+    assert result.invoice.numero_facture == "S2"
+    assert result.invoice.products == products
+    mock_db.save_invoice.assert_called_once()
+    assert mock_db.save_invoice.call_args.args[5] == 2
+
+
+@pytest.mark.parametrize("group_commit", [False, True])
+def test_orchestrator_streaming_upserts_lines_repaired_after_the_stream(mock_db, mock_config, mocker, group_commit):
+    orch = ExtractionOrchestrator(config=mock_config, db_manager=mock_db)
+    if group_commit:
+        orch.writer = MagicMock()
+        orch.writer.submit.side_effect = lambda products, *_: MagicMock(
+            **{"result.return_value": (len(products), 0)}
+        )
+    header = InvoiceResult(numero_facture="S3", date_facture="04/02/2026", fournisseur="BigMat")
+    products = [
+        Product(
+            fournisseur="BigMat", designation_raw=f"Article {i}", designation_fr=f"Article {i}",
+            famille="Granulat", unite="kg", prix_remise_ht=1.0,
+        )
+        for i in range(3)
+    ]
+
+    def stream_with_repair(file_bytes, mime_type, on_product=None):
+        for p in products[:2]:
+            on_product(p, header)
+        # The third line failed validation mid-stream and was repaired in the final parse
+        return header.model_copy(update={"products": [p.model_copy() for p in products]})
+
+    mocker.patch.object(orch.gemini, "extract_invoice_stream", side_effect=stream_with_repair)
+
+    result = orch.process_file(b"data", "repaired.pdf", stream=True)
+    assert result.products_added == 3
+    written = (
+        [p for call in orch.writer.submit.call_args_list for p in call.args[0]] if group_commit
+        else [call.args[0] for call in mock_db.upsert_product.call_args_list]
+    )
+    assert written == products
+
+
+def test_orchestrator_publishes_pipeline_stages(mock_db, mock_config, mocker):
+    from backend.core.events import event_bus
+    orch = ExtractionOrchestrator(config=mock_config, db_manager=mock_db)
+    mocker.patch.object(orch.gemini, "extract_invoice", side_effect=RuntimeError("quota"))
+    start = event_bus.last_id
+
+    with pytest.raises(RuntimeError):
+        orch.process_file(b"stage-data", "stages.pdf")
+
+    stages = [e.type for e in event_bus.recent(after=start) if e.data.get("filename") == "stages.pdf"]
+    assert stages == ["pipeline.received", "pipeline.extracting", "pipeline.failed"]
+
+def test_pipeline_profiling(mock_db, tmp_path):
+    from backend.core.profiling import list_profiles
+    config = AppConfig(
+        GEMINI_API_KEY="test", DB_GROUP_COMMIT=False, PROFILING_ENABLED=True,
+        PROFILE_PIPELINE=True, PROFILES_DIR=str(tmp_path),
+    )
+    mock_db.is_invoice_processed.return_value = True
+    ExtractionOrchestrator(config=config, db_manager=mock_db).process_file(b"data", "lent.pdf")
+    assert "process_file_lent.pdf" in list_profiles(str(tmp_path))[0]["name"]
+
+def test_token_usage_is_stored_with_invoice(mock_db, mock_config, mocker):
+    from types import SimpleNamespace
+    from backend.core.usage import record_call
+    orch = ExtractionOrchestrator(config=mock_config, db_manager=mock_db)
+    invoice = InvoiceResult(
+        numero_facture="7", fournisseur="BigMat",
+        products=[Product(
+            fournisseur="BigMat", designation_raw="Sable", designation_fr="Sable",
+            famille="Granulat", unite="kg", prix_brut_ht=1.0, remise_pct=0,
+            prix_remise_ht=1.0, prix_ttc_iva21=1.21
+        )],
+    )
+
+    def _extract(*args):
+        record_call(SimpleNamespace(prompt_token_count=900, candidates_token_count=100), 40.0)
+        return invoice
+
+    mocker.patch.object(orch.gemini, "extract_invoice", side_effect=_extract)
+    orch.process_file(b"data", "test.pdf", stream=False)
+
+    usage = mock_db.save_invoice.call_args.kwargs["usage"]
+    assert (usage.calls, usage.total_tokens, usage.latency_ms) == (1, 1000, 40.0)
+    mock_db.record_token_usage.assert_called_once_with(usage)
+
+def test_background_work_is_parked_while_model_is_down(mock_db, mock_config, mocker):
+    from backend.services.resilience import CircuitOpenError
+    orch = ExtractionOrchestrator(config=mock_config, db_manager=mock_db)
+    mocker.patch.object(orch.gemini, "extract_invoice", side_effect=[
+        CircuitOpenError("gemini", 30), InvoiceResult(numero_facture="9"),
+    ])
+    parked = mocker.patch.object(orch.gemini.breaker, "wait_until_available", return_value=True)
+
+    result = orch.process_file(b"data", "scan.pdf", stream=False, priority="backfill")
+    assert result.invoice.numero_facture == "9"
+    parked.assert_called_once()
+
+    orch.gemini.extract_invoice.side_effect = CircuitOpenError("gemini", 30)
+    with pytest.raises(CircuitOpenError):
+        orch.process_file(b"data2", "upload.pdf", stream=False)
+
+def test_small_images_are_packed_into_one_request(mock_db, mocker):
+    import threading
+    from backend.core.packing import DocumentPacker
+    config = AppConfig(GEMINI_API_KEY="test", DB_GROUP_COMMIT=False, GEMINI_PACKING=True)
+    orch = ExtractionOrchestrator(config=config, db_manager=mock_db)
+    orch.packer = DocumentPacker(orch.scheduler, max_docs=3, max_wait_ms=5000)
+
+    def invoice(n):
+        return InvoiceResult(numero_facture=n, fournisseur="Bricodepot", products=[Product(
+            fournisseur="Bricodepot", designation_raw=f"Vis {n}", designation_fr=f"Vis {n}",
+            famille="Quincaillerie", prix_remise_ht=2.0,
+        )])
+    extract_many = mocker.patch.object(
+        orch.gemini, "extract_invoices", side_effect=lambda docs: [invoice(d.decode()) for d, _ in docs]
+    )
+    single = mocker.patch.object(orch.gemini, "extract_invoice", return_value=invoice("PDF"))
+
+    results = {}
+    threads = [
+        threading.Thread(target=lambda n=n: results.__setitem__(n, orch.process_file(n.encode(), f"{n}.jpg")))
+        for n in ("T1", "T2", "T3")
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    orch.process_file(b"%PDF", "facture.pdf")
+
+    assert extract_many.call_count == 1 and single.call_count == 1
+    assert {n: r.invoice.numero_facture for n, r in results.items()} == {"T1": "T1", "T2": "T2", "T3": "T3"}
+    saved = sorted(c.args[1] for c in mock_db.save_invoice.call_args_list)
+    assert saved == ["T1.jpg", "T2.jpg", "T3.jpg", "facture.pdf"]
@@ -0,0 +1,57 @@
+import threading
+import time
+import pytest
+from backend.core.packing import DocumentPacker
+from backend.core.scheduler import BACKFILL, INTERACTIVE, ExtractionScheduler
+from backend.core.usage import record_call
+from backend.schemas.invoice import InvoiceResult
+
+
+def _submit_concurrently(packer, priorities, extract_many):
+    tickets = [None] * len(priorities)
+
+    def _submit(i):
+        tickets[i] = packer.submit(b"img%d" % i, "image/jpeg", priorities[i], extract_many)
+        tickets[i]._done.wait()
+
+    threads = [threading.Thread(target=_submit, args=(i,)) for i in range(len(priorities))]
+    for t in threads:
+        t.start()
+        time.sleep(0.01)  # the first one leads
+    for t in threads:
+        t.join()
+    return tickets
+
+
+def test_small_images_share_one_request():
+    calls = []
+
+    def extract_many(documents):
+        calls.append([data for data, _ in documents])
+        record_call(type("Meta", (), {"prompt_token_count": 301, "candidates_token_count": 30})(), 900.0, "m")
+        return [InvoiceResult(numero_facture=data.decode()) for data, _ in documents]
+
+    packer = DocumentPacker(ExtractionScheduler(slots=1), max_docs=3, max_wait_ms=5000)
+    start = time.perf_counter()
+    tickets = _submit_concurrently(packer, [BACKFILL, INTERACTIVE, BACKFILL], extract_many)
+    assert time.perf_counter() - start < 2  # a full pack does not wait for the window
+    assert calls == [[b"img0", b"img1", b"img2"]]
+    assert [t.result.numero_facture for t in tickets] == ["img0", "img1", "img2"]
+    assert [t.usage.input_tokens for t in tickets] == [101, 100, 100]
+    assert sum(t.usage.calls for t in tickets) == 1
+    assert not packer.accepts(b"%PDF", "application/pdf")
+
+
+def test_lone_or_unmatched_documents_fall_back_to_single_requests():
+    packer = DocumentPacker(ExtractionScheduler(slots=1), max_docs=8, max_wait_ms=20)
+    ticket = packer.submit(b"img", "image/png", INTERACTIVE, lambda docs: pytest.fail("no packed call"))
+    assert ticket.fallback and ticket.wait() is None
+
+    tickets = _submit_concurrently(packer, [INTERACTIVE] * 2, lambda docs: [InvoiceResult(), None])
+    assert [t.fallback for t in tickets] == [False, True]
+
+    def _down(docs):
+        raise RuntimeError("503 UNAVAILABLE")
+    tickets = _submit_concurrently(packer, [INTERACTIVE] * 2, _down)
+    with pytest.raises(RuntimeError):
+        tickets[1].wait()
@@ -0,0 +1,47 @@
+import time
+import pytest
+from backend.core.config import get_config
+from backend.core.profiling import list_profiles, profile, profile_path
+
+
+def busy_loop(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+@pytest.fixture
+def config(tmp_path):
+    return get_config(
+        profiling_enabled=True, profiles_dir=str(tmp_path / "profiles"), profile_interval_ms=1
+    )
+
+
+def test_disabled_profiling_is_a_noop(tmp_path):
+    config = get_config(profiling_enabled=False, profile_pipeline=True, profiles_dir=str(tmp_path))
+    with profile(config, "off", requested=True) as profiler:
+        assert profiler is None
+    assert list_profiles(str(tmp_path)) == []
+
+
+def test_requested_profile_writes_collapsed_stacks(config):
+    with profile(config, "POST /api/v1/invoices/process", requested=True) as profiler:
+        busy_loop(0.1)
+    stored = list_profiles(config.profiles_dir)
+    assert [p["name"] for p in stored] == [profiler.name]
+    text = profile_path(config.profiles_dir, profiler.name).read_text()
+    busy = [line for line in text.splitlines() if "busy_loop" in line]
+    assert busy and busy[0].startswith("MainThread;")
+    assert int(busy[0].rsplit(" ", 1)[1]) > 0
+
+
+def test_nested_block_is_not_profiled_twice(config):
+    with profile(config, "outer", requested=True):
+        with profile(config, "inner", requested=True) as inner:
+            assert inner is None
+    assert len(list_profiles(config.profiles_dir)) == 1
+
+
+def test_profile_path_rejects_traversal(config):
+    assert profile_path(config.profiles_dir, "../secret.folded") is None
+    assert profile_path(config.profiles_dir, "missing.folded") is None
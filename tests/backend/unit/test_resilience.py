@@ -0,0 +1,111 @@
+import threading
+import time
+import pytest
+from unittest.mock import MagicMock
+from google.genai import errors as genai_errors
+from backend.core.config import AppConfig
+from backend.services.gemini_service import GeminiService
+from backend.services.resilience import (
+    HEDGE_MAX_IN_FLIGHT, CircuitBreaker, CircuitOpenError, DeadlineExceededError, HedgePolicy, call_with_deadline,
+    is_transient,
+)
+
+
+def test_deadline_abandons_a_stalled_call():
+    release = threading.Event()
+    start = time.perf_counter()
+    with pytest.raises(DeadlineExceededError):
+        call_with_deadline(lambda: release.wait(5), deadline_s=0.1)
+    assert time.perf_counter() - start < 1
+    release.set()
+
+
+def test_hedge_wins_over_stalled_primary():
+    calls, release = [], threading.Event()
+
+    def _call():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait(5)  # the primary stalls
+            return "late"
+        return "hedge"
+
+    start = time.perf_counter()
+    assert call_with_deadline(_call, deadline_s=5, hedge_after_s=0.05) == ("hedge", True)
+    assert time.perf_counter() - start < 1
+    release.set()
+    # A fast primary is never duplicated
+    assert call_with_deadline(lambda: "ok", deadline_s=5, hedge_after_s=0.5) == ("ok", False)
+
+
+def test_hedges_in_flight_are_bounded():
+    release = threading.Event()
+    stalls = [
+        threading.Thread(target=call_with_deadline, args=(lambda: release.wait(5), 5, 0.01))
+        for _ in range(HEDGE_MAX_IN_FLIGHT)
+    ]
+    for t in stalls:
+        t.start()
+    time.sleep(0.2)  # every slot now holds a stalled duplicate
+    calls = []
+
+    def _call():
+        calls.append(1)
+        time.sleep(0.1)
+        return "ok"
+
+    assert call_with_deadline(_call, deadline_s=5, hedge_after_s=0.01) == ("ok", False)
+    assert len(calls) == 1
+    release.set()
+    for t in stalls:
+        t.join()
+
+
+def test_hedge_delay_follows_p95_within_budget():
+    policy = HedgePolicy(min_delay_s=0.5, budget=0.5)
+    assert policy.delay(1000) is None  # no history yet
+    for ms in range(1, 101):
+        policy.record(1000, ms / 10)
+    assert policy.delay(1000) == pytest.approx(9.5)
+    assert policy.delay(10_000_000) is None  # other size class: no history
+    policy.hedged()
+    policy.hedged()
+    assert policy.delay(1000) is None  # 2 hedges for 4 calls: budget spent
+
+
+def test_breaker_opens_then_probes_once():
+    breaker = CircuitBreaker("test", failure_threshold=2, cooldown_s=0.1)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert not breaker.wait_until_available(timeout=0.01)
+
+    assert breaker.wait_until_available(timeout=1)
+    breaker.before_call()  # the half-open probe
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # only one probe at a time
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_transient_errors_trip_the_breaker_instead_of_retrying():
+    assert is_transient(TimeoutError()) and is_transient(RuntimeError("503 UNAVAILABLE"))
+    assert not is_transient(ValueError("400 INVALID_ARGUMENT"))
+    # Status codes, not substrings: a 400 mentioning "internal" or 5000 is permanent
+    assert not is_transient(ValueError("invalid value 5000 for max_output_tokens"))
+    assert not is_transient(genai_errors.ClientError(400, {"error": {"message": "internal field missing"}}))
+    assert is_transient(genai_errors.ServerError(503, {"error": {"status": "UNAVAILABLE"}}))
+
+    svc = GeminiService(AppConfig(GEMINI_API_KEY="AIzaSyTestKey", GEMINI_PROMPT_CACHE=False, GEMINI_MODEL_ROUTING=False))
+    svc.breaker = CircuitBreaker("test", failure_threshold=2, cooldown_s=60)
+    svc._client = MagicMock()
+    svc._client.models.generate_content.side_effect = RuntimeError("503 UNAVAILABLE")
+
+    with pytest.raises(CircuitOpenError):
+        svc.extract_invoice(b"filedata", "application/pdf")
+    assert svc._client.models.generate_content.call_count == 2
+    with pytest.raises(CircuitOpenError):
+        svc.extract_invoice(b"filedata", "application/pdf")
+    assert svc._client.models.generate_content.call_count == 2  # failed fast
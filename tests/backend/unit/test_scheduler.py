@@ -0,0 +1,77 @@
+import threading
+import time
+import pytest
+from backend.core.scheduler import BACKFILL, INTERACTIVE, WATCHER, ExtractionScheduler
+
+
+def _queue_behind_held_slot(scheduler, priorities):
+    """Hold the only slot, queue one job per priority (in order), return (release, order, threads)."""
+    order, release = [], threading.Event()
+
+    def _hold():
+        with scheduler.slot(BACKFILL):
+            release.wait()
+
+    def _job(priority):
+        with scheduler.slot(priority):
+            order.append(priority)
+
+    threads = [threading.Thread(target=_hold)]
+    threads[0].start()
+    for priority in priorities:
+        queued = sum(s["queued"] for s in scheduler.stats().values())
+        threads.append(threading.Thread(target=_job, args=(priority,)))
+        threads[-1].start()
+        while sum(s["queued"] for s in scheduler.stats().values()) == queued:
+            time.sleep(0.001)
+    return release, order, threads
+
+
+def test_interactive_jumps_the_backfill_queue():
+    scheduler = ExtractionScheduler(slots=1)
+    release, order, threads = _queue_behind_held_slot(
+        scheduler, [BACKFILL] * 5 + [WATCHER, INTERACTIVE]
+    )
+    assert scheduler.stats()[BACKFILL]["queued"] == 5
+    release.set()
+    for t in threads:
+        t.join()
+    assert order[:2] == [INTERACTIVE, WATCHER]
+    assert order[2:] == [BACKFILL] * 5
+
+
+def test_lower_classes_get_their_weighted_share():
+    scheduler = ExtractionScheduler(slots=1, weights={INTERACTIVE: 4, WATCHER: 1, BACKFILL: 1})
+    release, order, threads = _queue_behind_held_slot(scheduler, [BACKFILL] * 3 + [INTERACTIVE] * 9)
+    release.set()
+    for t in threads:
+        t.join()
+    # About 4 interactive jobs per backfill job (the holder already used one backfill turn)
+    assert "".join(p[0] for p in order) == "iiiiibiiiibb"
+
+
+def test_stats_and_slot_bound():
+    scheduler = ExtractionScheduler(slots=2)
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def _job():
+        with scheduler.slot(WATCHER):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+
+    threads = [threading.Thread(target=_job) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = scheduler.stats()[WATCHER]
+    assert peak[0] == 2
+    assert stats["admitted"] == 6 and stats["queued"] == 0 and stats["running"] == 0
+    assert stats["p95_wait_ms"] > 0
+    with pytest.raises(ValueError):
+        with scheduler.slot("urgent"):
+            pass
@@ -0,0 +1,53 @@
+import json
+import pytest
+from backend.core import tracing
+from backend.core.config import get_config
+from backend.core.db_manager import DBManager
+
+
+@pytest.fixture
+def trace_file(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracing.configure(get_config(tracing_enabled=True, trace_file=str(path)))
+    yield path
+    tracing.configure(get_config(tracing_enabled=False))
+
+
+def read_spans(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_disabled_tracing_exports_nothing(tmp_path):
+    tracing.configure(get_config(tracing_enabled=False))
+    with tracing.span("noop") as span:
+        span.set("ignored", 1)
+        assert tracing.inject() == {}
+
+
+def test_spans_nest_and_continue_remote_trace(trace_file):
+    remote = tracing.parse_traceparent("00-" + "a" * 32 + "-" + "b" * 16 + "-01")
+    with tracing.span("server", parent=remote):
+        with tracing.span("child") as child:
+            assert tracing.inject()["traceparent"] == child.traceparent
+    child, server = read_spans(trace_file)
+    assert server["trace_id"] == child["trace_id"] == "a" * 32
+    assert server["parent_id"] == "b" * 16
+    assert child["parent_id"] == server["span_id"]
+
+
+def test_error_status_and_db_lock_wait(trace_file, tmp_path):
+    db = DBManager(str(tmp_path / "trace.db"))
+    with pytest.raises(RuntimeError):
+        with tracing.span("pipeline"):
+            db.is_invoice_processed("abc")
+            raise RuntimeError("boom")
+    db_span, pipeline = read_spans(trace_file)
+    assert db_span["name"] == "db.is_invoice_processed"
+    assert "lock_wait_ms" in db_span["attributes"]
+    assert pipeline["status"] == "error"
+    assert "db.is_invoice_processed" in tracing.format_trace([db_span, pipeline])
+
+
+def test_invalid_traceparent_ignored():
+    assert tracing.parse_traceparent("garbage") is None
+    assert tracing.parse_traceparent(None) is None
@@ -0,0 +1,73 @@
+import io
+import threading
+import time
+import zipfile
+import pytest
+from types import SimpleNamespace
+from backend.core.upload_batch import BatchRejectedError, UploadBatch
+from backend.schemas.invoice import InvoiceResult, Product
+
+
+def make_zip(members):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    buf.seek(0)
+    return buf
+
+
+class SlowOrchestrator:
+    """Records peak concurrency; fails on files whose content starts with b'BAD', extracts nothing from b'EMPTY'."""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def process_file(self, data, filename, priority=None):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.01)
+        with self.lock:
+            self.active -= 1
+        if data.startswith(b"BAD"):
+            raise ValueError("unreadable")
+        products = [] if data == b"EMPTY" else [Product(
+            fournisseur="BigMat", designation_raw=filename, designation_fr=filename, famille="Ciment", prix_remise_ht=5.0,
+        )]
+        return SimpleNamespace(
+            was_cached=False, invoice=InvoiceResult(numero_facture=filename, products=products),
+            products_added=1, products_updated=0, products_held=0,
+        )
+
+
+def test_zip_and_files_are_spooled_and_processed_with_bounded_concurrency(tmp_path):
+    batch = UploadBatch(max_file_size=100, root=str(tmp_path))
+    batch.add_upload("bundle.zip", make_zip({
+        "2024/T1/facture.pdf": b"A", "2024/T2/facture.pdf": b"B",  # same name, different folders
+        "../../evil.pdf": b"C", "notes.txt": b"ignored", "big.pdf": b"x" * 200,
+    }))
+    for i in range(6):
+        batch.add_upload(f"scan_{i}.jpg", io.BytesIO({0: b"BAD", 1: b"EMPTY"}.get(i, b"ok")))
+    batch.add_upload("readme.docx", io.BytesIO(b"nope"))
+
+    assert len(batch.files) == 9
+    assert all(path.parent == batch.workdir for path in batch.files)
+
+    orchestrator = SlowOrchestrator()
+    batch.run(orchestrator, workers=3)
+
+    report = batch.to_dict()
+    assert report["state"] == "done"
+    assert report["counts"] == {"done": 7, "failed": 2, "rejected": 2}
+    assert [f["filename"] for f in report["files"]].count("facture.pdf") == 2
+    assert orchestrator.peak <= 3
+    assert not batch.workdir.exists()
+
+
+def test_invalid_zip_is_rejected(tmp_path):
+    batch = UploadBatch(max_file_size=100, root=str(tmp_path))
+    with pytest.raises(BatchRejectedError):
+        batch.add_upload("bundle.zip", io.BytesIO(b"not a zip"))
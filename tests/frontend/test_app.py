@@ -1,27 +1,44 @@
+import threading
+from collections import deque
+from unittest.mock import MagicMock, patch
+
 import pytest
+import streamlit as st
 from streamlit.testing.v1 import AppTest
-from unittest.mock import patch, MagicMock
-
-@patch("requests.get")
-def test_app_loads_correctly(mock_get):
-    # Mock /api/v1/catalogue response
-    mock_resp_cat = MagicMock()
-    mock_resp_cat.status_code = 200
-    mock_resp_cat.json.return_value = {"products": [{"fournisseur": "BigMat", "designation_fr": "Sable"}], "total": 1}
-
-    # Mock /health response
-    mock_resp_health = MagicMock()
-    mock_resp_health.status_code = 200
-    mock_resp_health.json.return_value = {"status": "healthy", "db": {"products": 1, "invoices": 1, "families": 1}}
-
-    def side_effect(url, *args, **kwargs):
-        if "catalogue" in url:
-            return mock_resp_cat
-        if "health" in url:
-            return mock_resp_health
+
+from app import HTTP_POOL_SIZE, EventListener, get_http_session
+
+
+@pytest.fixture
+def api_routes():
+    """URL suffix -> JSON payload (or callable(params) building one) served to the app."""
+    return {
+        "/health/live": {"status": "alive"},
+        "/api/v1/stats": {"products": 0, "invoices": 0, "families": 0},
+        "/api/v1/catalogue/facets": {"familles": [], "fournisseurs": []},
+        "/api/v1/catalogue": {"products": [], "total": 0},
+        "/api/v1/watcher/activity": {"activity": []},
+    }
+
+
+@pytest.fixture
+def mock_get(api_routes):
+    def side_effect(url, *args, params=None, **kwargs):
+        for path, payload in api_routes.items():
+            if url.endswith(path):
+                body = payload(params) if callable(payload) else payload
+                return MagicMock(status_code=200, json=MagicMock(return_value=body))
         return MagicMock(status_code=404)
 
-    mock_get.side_effect = side_effect
+    # fetch_* results and the HTTP session are cached process-wide across AppTest runs
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    with patch("requests.Session.get", side_effect=side_effect) as mocked:
+        yield mocked
+
+
+def test_app_loads_correctly(api_routes, mock_get):
+    api_routes["/api/v1/catalogue"] = {"products": [{"fournisseur": "BigMat", "designation_fr": "Sable"}], "total": 1}
 
     # Initialize Streamlit Test App
     at = AppTest.from_file("app.py").run(timeout=15)
@@ -32,3 +49,77 @@ def test_app_loads_correctly(mock_get):
     # Check if the Main Title is rendered correctly
     assert len(at.markdown) > 0
     assert any("Traitement Rapide" in m.value for m in at.markdown)
+
+
+def test_catalogue_filters_use_facets(api_routes, mock_get):
+    api_routes.update({
+        "/api/v1/catalogue/facets": {
+            "familles": [{"value": "Ciment", "count": 2}, {"value": "Granulats", "count": 1}],
+            "fournisseurs": [{"value": "BigMat", "count": 3}],
+        },
+        "/api/v1/catalogue": {"products": [{"id": 1, "fournisseur": "BigMat", "designation_fr": "Sable"}], "total": 1},
+        "/api/v1/stats": {"products": 3, "invoices": 1, "families": 2},
+    })
+
+    at = AppTest.from_file("app.py").run(timeout=15)
+    assert not at.exception
+    famille_box = next(box for box in at.selectbox if box.label == "Famille")
+    assert famille_box.options == ["Toutes", "Ciment (2)", "Granulats (1)"]
+    # Menu entries come from the facets endpoint, not from the product rows
+    facet_calls = [c for c in mock_get.call_args_list if c.args[0].endswith("/facets")]
+    assert facet_calls
+
+
+def test_catalogue_is_paged_and_prefetched(api_routes, mock_get):
+    total = 120
+    products = [{"id": i, "fournisseur": "BigMat", "designation_fr": f"P{i}"} for i in range(total)]
+    api_routes.update({
+        "/api/v1/catalogue": lambda params: {
+            "products": products[params["offset"]:params["offset"] + params["limit"]], "total": total,
+        },
+        "/api/v1/stats": {"products": total, "invoices": 1, "families": 1},
+    })
+
+    at = AppTest.from_file("app.py").run(timeout=15)
+    assert not at.exception
+
+    pages = at.session_state["catalogue_pages"]
+    offsets = sorted(key[1] for key in pages)
+    assert offsets == [0, 1]  # current page plus the prefetched next one
+    first_page = pages[next(k for k in pages if k[1] == 0)].result()
+    assert len(first_page["products"]) == 50
+
+
+def test_sidebar_uses_shared_pooled_session(mock_get):
+    at = AppTest.from_file("app.py").run(timeout=15)
+    assert not at.exception
+    assert any("API Connectée" in s.value for s in at.success)
+
+    urls = {c.args[0] for c in mock_get.call_args_list}
+    assert any(u.endswith("/health/live") for u in urls)
+    assert any(u.endswith("/api/v1/stats") for u in urls)
+    assert any(u.endswith("/api/v1/watcher/activity") for u in urls)
+
+    adapter = get_http_session().get_adapter("http://api")
+    assert adapter._pool_maxsize == HTTP_POOL_SIZE
+    assert adapter.max_retries.total == 3 and "POST" not in adapter.max_retries.allowed_methods
+
+
+def test_event_listener_tracks_stages_and_activity():
+    listener = EventListener.__new__(EventListener)  # no background thread
+    listener.last_id, listener.activity, listener.in_progress = 0, deque(maxlen=10), {}
+    listener.lock = threading.Lock()
+
+    listener._consume([
+        "retry: 3000", "",
+        "id: 7", "event: pipeline.extracting", 'data: {"filename": "a.pdf"}', "",
+        "id: 8", "event: pipeline.extracting", 'data: {"filename": "b.pdf"}', "",
+        ": keep-alive", "",
+        "id: 9", "event: pipeline.done", 'data: {"filename": "a.pdf", "products_added": 2}', "",
+        "id: 10", "event: watcher.activity",
+        'data: {"filename": "c.pdf", "status": "✅ Terminé", "time": "10:00:00"}', "",
+    ])
+    activity, in_progress = listener.snapshot()
+    assert listener.last_id == 10
+    assert in_progress == {"b.pdf": "extracting"}
+    assert [a["filename"] for a in activity] == ["c.pdf"]